@@ -0,0 +1,31 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+
+-- Trigram indexes serve the ILIKE '%value%' filters of the gcode list
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
+CREATE INDEX IF NOT EXISTS gcodes_filename_trgm_idx
+    ON public.gcodes USING gin
+    (filename public.gin_trgm_ops)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_display_trgm_idx
+    ON public.gcodes USING gin
+    (display public.gin_trgm_ops)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_path_trgm_idx
+    ON public.gcodes USING gin
+    (path public.gin_trgm_ops)
+    TABLESPACE pg_default;
@@ -0,0 +1,59 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+
+-- One index per sortable list column, matching the (column, id) keyset order
+-- Descending orders are served by scanning the same indexes backwards
+CREATE INDEX IF NOT EXISTS gcodes_filename_id_idx
+    ON public.gcodes USING btree
+    (filename ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_display_id_idx
+    ON public.gcodes USING btree
+    (display ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_path_id_idx
+    ON public.gcodes USING btree
+    (path ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_uploaded_id_idx
+    ON public.gcodes USING btree
+    (uploaded ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_size_id_idx
+    ON public.gcodes USING btree
+    (size ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS printjobs_started_id_idx
+    ON public.printjobs USING btree
+    (started ASC, id ASC)
+    TABLESPACE pg_default;
+
+-- These supersede the single column indexes from V0002 for lookups as well
+CREATE INDEX IF NOT EXISTS printjobs_gcode_id_id_idx
+    ON public.printjobs USING btree
+    (gcode_id ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS printjobs_printer_ip_id_idx
+    ON public.printjobs USING btree
+    (printer_ip ASC, id ASC)
+    TABLESPACE pg_default;
+
+DROP INDEX IF EXISTS public.printjobs_gcode_id_idx;
+DROP INDEX IF EXISTS public.printjobs_printer_ip_idx;
@@ -0,0 +1,36 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+
+-- jsonb can be indexed, the structured list filters compile into @> containment
+ALTER TABLE public.printjobs
+    ALTER COLUMN gcode_data TYPE jsonb USING gcode_data::jsonb;
+ALTER TABLE public.printjobs
+    ALTER COLUMN printer_data TYPE jsonb USING printer_data::jsonb;
+ALTER TABLE public.printers
+    ALTER COLUMN client_props TYPE jsonb USING client_props::jsonb;
+
+CREATE INDEX IF NOT EXISTS printjobs_gcode_data_idx
+    ON public.printjobs USING gin
+    (gcode_data jsonb_path_ops)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS printjobs_printer_data_idx
+    ON public.printjobs USING gin
+    (printer_data jsonb_path_ops)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS printers_client_props_idx
+    ON public.printers USING gin
+    (client_props jsonb_path_ops)
+    TABLESPACE pg_default;
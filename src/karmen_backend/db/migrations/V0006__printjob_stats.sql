@@ -0,0 +1,75 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+
+-- Summaries of printjobs kept up to date by add_printjob and delete_printjob,
+-- the statistics never need to scan the whole job history
+CREATE TABLE IF NOT EXISTS public.printjob_stats_daily (
+    printer_ip character varying(21) NOT NULL,
+    day date NOT NULL,
+    jobs integer DEFAULT 0 NOT NULL,
+    CONSTRAINT printjob_stats_daily_pkey PRIMARY KEY (printer_ip, day)
+);
+
+ALTER TABLE public.printjob_stats_daily OWNER TO print3d;
+
+CREATE INDEX IF NOT EXISTS printjob_stats_daily_day_idx
+    ON public.printjob_stats_daily USING btree
+    (day ASC)
+    TABLESPACE pg_default;
+
+CREATE TABLE IF NOT EXISTS public.printer_stats (
+    printer_ip character varying(21) NOT NULL,
+    jobs integer DEFAULT 0 NOT NULL,
+    last_started timestamp with time zone,
+    CONSTRAINT printer_stats_pkey PRIMARY KEY (printer_ip)
+);
+
+ALTER TABLE public.printer_stats OWNER TO print3d;
+
+CREATE TABLE IF NOT EXISTS public.gcode_stats (
+    gcode_id integer NOT NULL,
+    filename character varying,
+    jobs integer DEFAULT 0 NOT NULL,
+    CONSTRAINT gcode_stats_pkey PRIMARY KEY (gcode_id)
+);
+
+ALTER TABLE public.gcode_stats OWNER TO print3d;
+
+CREATE INDEX IF NOT EXISTS gcode_stats_jobs_idx
+    ON public.gcode_stats USING btree
+    (jobs DESC, gcode_id ASC)
+    TABLESPACE pg_default;
+
+-- delete_printjob looks up the previous job of a printer when the latest one is
+-- deleted, this keeps it to a single index probe
+CREATE INDEX IF NOT EXISTS printjobs_printer_ip_started_idx
+    ON public.printjobs USING btree
+    (printer_ip ASC, started ASC)
+    TABLESPACE pg_default;
+
+-- Summarize the existing history
+INSERT INTO public.printjob_stats_daily (printer_ip, day, jobs)
+    SELECT printer_ip, (started AT TIME ZONE 'UTC')::date, count(*)
+    FROM public.printjobs GROUP BY 1, 2
+    ON CONFLICT DO NOTHING;
+
+INSERT INTO public.printer_stats (printer_ip, jobs, last_started)
+    SELECT printer_ip, count(*), max(started)
+    FROM public.printjobs GROUP BY 1
+    ON CONFLICT DO NOTHING;
+
+INSERT INTO public.gcode_stats (gcode_id, filename, jobs)
+    SELECT gcode_id, max(gcode_data->>'filename'), count(*)
+    FROM public.printjobs GROUP BY 1
+    ON CONFLICT DO NOTHING;
@@ -0,0 +1,28 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+
+-- Uploads are stored once per content under their sha256, every gcode with the
+-- same content refers to the same blob. Gcodes uploaded before have no hash and
+-- keep their own files.
+CREATE TABLE IF NOT EXISTS public.gcode_blobs (
+    hash character(64) NOT NULL,
+    absolute_path character varying NOT NULL,
+    size bigint NOT NULL,
+    refs integer DEFAULT 0 NOT NULL,
+    CONSTRAINT gcode_blobs_pkey PRIMARY KEY (hash)
+);
+
+ALTER TABLE public.gcode_blobs OWNER TO print3d;
+
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS hash character(64);
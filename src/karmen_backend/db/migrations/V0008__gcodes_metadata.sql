@@ -0,0 +1,52 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+
+-- Read from the slicer comments and the first temperature commands on upload,
+-- gcodes uploaded before stay empty
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS filament_type character varying(255);
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS printer_model character varying(255);
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS bed_temperature integer;
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS extruder_temperature integer;
+
+-- Sortable, see V0004__sort_indexes.sql
+CREATE INDEX IF NOT EXISTS gcodes_filament_type_id_idx
+    ON public.gcodes USING btree
+    (filament_type ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_printer_model_id_idx
+    ON public.gcodes USING btree
+    (printer_model ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_bed_temperature_id_idx
+    ON public.gcodes USING btree
+    (bed_temperature ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_extruder_temperature_id_idx
+    ON public.gcodes USING btree
+    (extruder_temperature ASC, id ASC)
+    TABLESPACE pg_default;
+
+-- Filtered by substring, see V0003__gcodes_trigram_indexes.sql
+CREATE INDEX IF NOT EXISTS gcodes_filament_type_trgm_idx
+    ON public.gcodes USING gin
+    (filament_type public.gin_trgm_ops)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_printer_model_trgm_idx
+    ON public.gcodes USING gin
+    (printer_model public.gin_trgm_ops)
+    TABLESPACE pg_default;
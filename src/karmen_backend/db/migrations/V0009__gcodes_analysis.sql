@@ -0,0 +1,33 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+
+-- Estimated by simulating the moves on upload, see server/services/gcodeanalysis.py,
+-- gcodes uploaded before stay empty
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS print_time integer;
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS filament_length real;
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS filament_weight real;
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS layer_count integer;
+-- {"min": [x, y, z], "max": [x, y, z]} of the printed moves
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS bounding_box jsonb;
+
+-- Sortable, see V0004__sort_indexes.sql
+CREATE INDEX IF NOT EXISTS gcodes_print_time_id_idx
+    ON public.gcodes USING btree
+    (print_time ASC, id ASC)
+    TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS gcodes_filament_weight_id_idx
+    ON public.gcodes USING btree
+    (filament_weight ASC, id ASC)
+    TABLESPACE pg_default;
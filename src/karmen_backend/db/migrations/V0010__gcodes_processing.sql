@@ -0,0 +1,19 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+
+-- Uploads are processed in the background, see server/tasks/process_gcode.py.
+-- state is one of processing, ready or failed, stages maps each stage of the
+-- processing to pending, done or failed. Gcodes uploaded before are ready as they are
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS state character varying(32) NOT NULL DEFAULT 'ready';
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS stages jsonb NOT NULL DEFAULT '{}'::jsonb;
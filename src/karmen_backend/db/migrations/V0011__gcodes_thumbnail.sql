@@ -0,0 +1,17 @@
+SET statement_timeout = 0;
+SET lock_timeout = 0;
+SET idle_in_transaction_session_timeout = 0;
+SET client_encoding = 'UTF8';
+SET standard_conforming_strings = on;
+SELECT pg_catalog.set_config('search_path', '', false);
+SET check_function_bodies = false;
+SET xmloption = content;
+SET client_min_messages = warning;
+SET row_security = off;
+
+SET default_tablespace = '';
+
+
+-- sha256 of the thumbnail embedded in the file, stored next to it, see
+-- server/services/gcodethumbnail.py. Empty when the slicer did not add any
+ALTER TABLE public.gcodes ADD COLUMN IF NOT EXISTS thumbnail character(64);
@@ -0,0 +1,70 @@
+# Measures the throughput of the gcode analysis. Pass real-world gcodes as arguments,
+# without any a synthetic file resembling a PrusaSlicer output is generated first.
+#
+# FLASKR_SETTINGS=../config.dev.cfg PYTHONPATH=. python3 scripts/benchmark_analysis.py [file.gcode ...]
+import os
+import sys
+import json
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+from server.services import gcodeanalysis, gcodemeta
+
+SYNTHETIC_SIZE = 200 * 1024 * 1024
+
+
+def make_synthetic(path, size):
+    random = np.random.default_rng(42)
+    with open(path, "wb") as gcode:
+        gcode.write(b"; generated by benchmark\nG90\nM83\nM104 S215\nM140 S60\nG28 W\n")
+        z = 0.2
+        while gcode.tell() < size:
+            gcode.write(
+                b";LAYER_CHANGE\nG1 Z%.3f F720\nG1 X20 Y20 F9000\nG1 E0.8 F2100\n" % z
+            )
+            points = random.uniform(20, 230, size=(20000, 2))
+            extrusion = random.uniform(0.01, 0.5, size=20000)
+            gcode.write(
+                b"".join(
+                    b"G1 X%.3f Y%.3f E%.5f\n" % (x, y, e)
+                    for (x, y), e in zip(points, extrusion)
+                )
+            )
+            gcode.write(b"G1 E-0.8 F2100\n")
+            z += 0.2
+        gcode.write(b"M104 S0\nM140 S0\n; filament_type = PLA\n")
+
+
+def run(path):
+    size = os.path.getsize(path)
+    start = perf_counter()
+    metadata = gcodemeta.extract(path)
+    metadata_time = perf_counter() - start
+    start = perf_counter()
+    result = gcodeanalysis.analyze(path, filament_type=metadata["filament_type"])
+    elapsed = perf_counter() - start
+    return {
+        "file": path,
+        "mb": round(size / 1024 / 1024, 1),
+        "seconds": round(elapsed, 2),
+        "mb_per_second": round(size / 1024 / 1024 / elapsed, 1),
+        "metadata_seconds": round(metadata_time, 4),
+        "result": result,
+    }
+
+
+paths = sys.argv[1:]
+synthetic = None
+if not paths:
+    synthetic = tempfile.NamedTemporaryFile(suffix=".gcode", delete=False)
+    synthetic.close()
+    make_synthetic(synthetic.name, SYNTHETIC_SIZE)
+    paths = [synthetic.name]
+try:
+    for path in paths:
+        print(json.dumps(run(path), indent=2))
+finally:
+    if synthetic is not None:
+        os.remove(synthetic.name)
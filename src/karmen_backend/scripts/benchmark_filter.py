@@ -0,0 +1,97 @@
+# Shows whether the gcode list filter can use the trigram indexes. Fills a temporary
+# copy of the gcodes table with 100k rows and prints the query plan of a filtered
+# page with and without the index. Nothing is written to the real tables.
+#
+# FLASKR_SETTINGS=../config.dev.cfg PYTHONPATH=. python3 scripts/benchmark_filter.py [rows] [needle]
+import sys
+import json
+import psycopg2.extras
+from psycopg2 import sql
+
+from server.database import get_connection, prepare_list_statement
+from server.database.gcodes import COLUMN_TYPES
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+NEEDLE = sys.argv[2] if len(sys.argv) > 2 else "benchy"
+COLUMNS = ["id", "path", "filename", "display", "absolute_path", "uploaded", "size"]
+
+
+def explain(cursor, statement):
+    cursor.execute(sql.SQL("EXPLAIN (ANALYZE, FORMAT JSON) {}").format(statement))
+    plan = cursor.fetchone()[0][0]
+    nodes = []
+    pending = [plan["Plan"]]
+    while pending:
+        node = pending.pop()
+        nodes.append(
+            "%s%s"
+            % (
+                node["Node Type"],
+                " on %s" % node["Index Name"] if "Index Name" in node else "",
+            )
+        )
+        pending.extend(node.get("Plans", []))
+    return plan["Execution Time"], nodes
+
+
+with get_connection() as connection:
+    cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if cursor.fetchone() is None:
+        print("pg_trgm extension is not available in this PostgreSQL installation")
+        sys.exit(1)
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public")
+    cursor.execute("DROP TABLE IF EXISTS benchmark_gcodes")
+    cursor.execute(
+        "CREATE TEMPORARY TABLE benchmark_gcodes (LIKE public.gcodes INCLUDING ALL)"
+    )
+    # keeps the ordering indexes, the copied trigram ones would spoil the
+    # measurement without the index
+    cursor.execute("""
+        SELECT indexname FROM pg_indexes
+        WHERE tablename = 'benchmark_gcodes' AND indexdef LIKE '%gin_trgm_ops%'
+        """)
+    for (index,) in cursor.fetchall():
+        cursor.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(index)))
+    cursor.execute(
+        """
+        INSERT INTO benchmark_gcodes (id, path, filename, display, absolute_path, uploaded, size)
+        SELECT i, 'uploads/' || md5(i::text),
+            CASE WHEN i %% 1000 = 0 THEN %s || '-' || md5(i::text) ELSE md5(i::text) END || '.gcode',
+            md5(i::text) || '.gcode', '/tmp/karmen-files/' || md5(i::text) || '.gcode',
+            now() - (i || ' minutes')::interval, i
+        FROM generate_series(1, %s) AS i
+        """,
+        (NEEDLE, ROWS),
+    )
+    statement = prepare_list_statement(
+        "benchmark_gcodes",
+        COLUMNS,
+        limit=200,
+        filter="filename:%s" % NEEDLE,
+        column_types=COLUMN_TYPES,
+    )
+    cursor.execute("ANALYZE benchmark_gcodes")
+    without_index = explain(cursor, statement)
+    cursor.execute(
+        "CREATE INDEX ON benchmark_gcodes USING gin (filename public.gin_trgm_ops)"
+    )
+    cursor.execute("ANALYZE benchmark_gcodes")
+    with_index = explain(cursor, statement)
+    cursor.execute("DROP TABLE benchmark_gcodes")
+    cursor.close()
+    print(statement.as_string(connection))
+
+print(
+    json.dumps(
+        {
+            "rows": ROWS,
+            "without_index": {"ms": without_index[0], "plan": without_index[1]},
+            "with_index": {"ms": with_index[0], "plan": with_index[1]},
+        },
+        indent=2,
+    )
+)
+if not any("Bitmap Index Scan" in node for node in with_index[1]):
+    print("The trigram index was not used")
+    sys.exit(1)
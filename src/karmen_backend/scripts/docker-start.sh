@@ -26,6 +26,7 @@ if [ "$SERVICE" = 'flask' ]; then
   test_flaskr_settings
   if [ "$ENV" = 'production' ]; then
     openresty
+    uwsgi --ini uwsgi-events.ini &
     uwsgi --ini uwsgi.ini
   else
     export FLASK_APP=server
@@ -50,11 +51,27 @@ elif [ "$SERVICE" = 'celery-worker' ]; then
     export FLASK_DEBUG=true
     watchmedo auto-restart --recursive -- celery -A server.celery worker --pidfile=/tmp/celeryworkerd.pid
   fi
+elif [ "$SERVICE" = 'printer-connector' ]; then
+  test_flaskr_settings
+  if [ "$ENV" = 'production' ]; then
+    python3 -m server.connector
+  else
+    export FLASK_DEBUG=true
+    watchmedo auto-restart --recursive -- python3 -m server.connector
+  fi
+elif [ "$SERVICE" = 'webcam-relay' ]; then
+  test_flaskr_settings
+  if [ "$ENV" = 'production' ]; then
+    python3 -m server.webcamrelay
+  else
+    export FLASK_DEBUG=true
+    watchmedo auto-restart --recursive -- python3 -m server.webcamrelay
+  fi
 elif [ "$SERVICE" = 'fake-printer' ]; then
   export FLASK_APP=fakeprinter
   export FLASK_DEBUG=true
   flask run --host=0.0.0.0 --port 8080
 else
-  echo "Unknown service ${SERVICE} encountered. I know of [flask, celery-beat and celery-worker, fake-printer]"
+  echo "Unknown service ${SERVICE} encountered. I know of [flask, celery-beat and celery-worker, printer-connector, webcam-relay, fake-printer]"
   exit 1
 fi
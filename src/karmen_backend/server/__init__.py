@@ -35,5 +35,10 @@ app.config["MAX_CONTENT_LENGTH"] = 1024 * 1024 * 1024
 CORS(app)
 celery = setup_celery(app)
 
+from server.services.files import UploadRequest
+
+# uploads are hashed while they are received, see server/services/files.py
+app.request_class = UploadRequest
+
 import server.routes
 import server.tasks
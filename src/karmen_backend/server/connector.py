@@ -0,0 +1,122 @@
+# Long running service keeping a subscription to the push API of every connected
+# printer. Run it with `python3 -m server.connector`. The regular printer checks
+# are only a fallback for printers with an active subscription.
+import asyncio
+import json
+from time import time
+
+import aiohttp
+
+from server import app, drivers
+from server.database import printers
+from server.services import circuitbreaker, pollschedule, printerstate
+from server.services.network import run_blocking
+
+
+def save_connected(raw_printer, printer):
+    if raw_printer["client_props"].get("connected"):
+        return
+    printers.update_printer(
+        name=printer.name,
+        hostname=printer.hostname,
+        ip=printer.ip,
+        client=printer.client_name(),
+        client_props={
+            "version": printer.client.version,
+            "connected": True,
+            "read_only": printer.client.read_only,
+        },
+    )
+    raw_printer["client_props"]["connected"] = True
+
+
+async def handle_message(raw_printer, printer, message, last, refreshed):
+    # returns when the push flag was refreshed last, it outlives a few messages
+    now = time()
+    if now - refreshed >= app.config.get("NETWORK_PUSH_TTL", 60) / 3:
+        await run_blocking(printerstate.set_push_active, printer.ip)
+        refreshed = now
+    if "connected" in message:
+        await run_blocking(save_connected, raw_printer, printer)
+    changes = {
+        field: value
+        for field, value in printer.handle_push_message(message).items()
+        if last.get(field) != value
+    }
+    if changes:
+        last.update(changes)
+        await run_blocking(printerstate.save, printer.ip, **changes)
+    return refreshed
+
+
+async def subscribe(raw_printer, session):
+    printer = drivers.get_printer_instance(raw_printer)
+    uri = "ws://%s/sockjs/websocket" % (printer.ip,)
+    last = {}
+    refreshed = 0
+    cancelled = False
+    try:
+        async with session.ws_connect(
+            uri, heartbeat=30, timeout=app.config.get("NETWORK_TIMEOUT", 10)
+        ) as ws:
+            app.logger.debug("Subscribed to %s" % uri)
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                try:
+                    message = json.loads(msg.data)
+                except ValueError:
+                    continue
+                refreshed = await handle_message(
+                    raw_printer, printer, message, last, refreshed
+                )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        app.logger.debug("Cannot subscribe to %s: %s" % (uri, e))
+    except asyncio.CancelledError:
+        # the printer was removed or the connector is stopping
+        cancelled = True
+        raise
+    finally:
+        await run_blocking(printerstate.clear_push_active, printer.ip)
+        if not cancelled:
+            # let the regular checks find out what happened to the printer
+            await run_blocking(pollschedule.reschedule, printer.ip, 0)
+
+
+def get_subscribable_printers():
+    return {
+        printer["ip"]: dict(printer)
+        for printer in printers.get_printers()
+        if printer["client_props"]
+        and printer["client_props"].get("connected")
+        and circuitbreaker.get_state(printer["ip"])["state"] != "open"
+    }
+
+
+def sync_subscriptions(subscriptions, known, session):
+    for ip in list(subscriptions.keys()):
+        if subscriptions[ip].done() or ip not in known:
+            subscriptions.pop(ip).cancel()
+    for ip, raw_printer in known.items():
+        if ip not in subscriptions:
+            subscriptions[ip] = asyncio.ensure_future(subscribe(raw_printer, session))
+
+
+async def supervise():
+    subscriptions = {}
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                sync_subscriptions(subscriptions, get_subscribable_printers(), session)
+            except Exception as e:
+                app.logger.error("Cannot synchronize printer subscriptions: %s", e)
+            await asyncio.sleep(app.config.get("NETWORK_PUSH_RESYNC", 10))
+
+
+def run():
+    app.logger.info("Starting the printer push connector...")
+    asyncio.get_event_loop().run_until_complete(supervise())
+
+
+if __name__ == "__main__":
+    run()
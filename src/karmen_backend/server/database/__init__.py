@@ -1,17 +1,27 @@
+import os
+import re
+import json
+import base64
+import binascii
+import datetime
+import threading
+from collections import deque
 from contextlib import contextmanager
+from time import time
 import psycopg2
 from psycopg2 import sql
 import psycopg2.extras
 import psycopg2.extensions
+import psycopg2.pool
 from server import app
+from server.database.instrumentation import InstrumentedConnection
 
 DSN = app.config["DB_DSN"]
-CONNECTION = None
 
 
 def connect():
     try:
-        connection = psycopg2.connect(DSN)
+        connection = psycopg2.connect(DSN, connection_factory=InstrumentedConnection)
         connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
         return connection
     except Exception as err:
@@ -19,22 +29,277 @@ def connect():
         raise err
 
 
+def is_healthy(connection, idle_for):
+    if connection.closed:
+        return False
+    # a connection that has been used just now is most likely fine, skip the round trip
+    if idle_for < app.config.get("DB_POOL_PING_AFTER", 5):
+        return True
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1")
+        cursor.close()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, minconn, maxconn, timeout):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        # connections inherited from a parent process cannot be used, nor closed
+        self.pid = os.getpid()
+        self.idle = deque()
+        self.size = 0
+
+    def getconn(self):
+        deadline = time() + self.timeout
+        while True:
+            with self.condition:
+                if self.pid != os.getpid():
+                    self.reset()
+                while not self.idle and self.size >= self.maxconn:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise psycopg2.pool.PoolError(
+                            "Timed out waiting for a database connection"
+                        )
+                    self.condition.wait(remaining)
+                if self.idle:
+                    connection, released = self.idle.pop()
+                else:
+                    connection, released = None, None
+                    self.size += 1
+            if connection is None:
+                try:
+                    return connect()
+                except Exception:
+                    self.discard()
+                    raise
+            if is_healthy(connection, time() - released):
+                return connection
+            self.discard(connection)
+
+    def putconn(self, connection):
+        with self.condition:
+            if self.pid != os.getpid():
+                return
+            if connection.closed or len(self.idle) >= self.minconn:
+                self.size -= 1
+                connection.close()
+            else:
+                self.idle.append((connection, time()))
+            self.condition.notify()
+
+    def discard(self, connection=None):
+        with self.condition:
+            if self.pid == os.getpid():
+                self.size -= 1
+                self.condition.notify()
+        if connection is not None and not connection.closed:
+            connection.close()
+
+    def get_stats(self):
+        with self.condition:
+            return {"size": self.size, "idle": len(self.idle)}
+
+
+POOL = ConnectionPool(
+    minconn=app.config.get("DB_POOL_MIN", 2),
+    maxconn=app.config.get("DB_POOL_MAX", 10),
+    timeout=app.config.get("DB_POOL_TIMEOUT", 5),
+)
+
+
+def release(connection, finish):
+    try:
+        finish()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        POOL.discard(connection)
+        raise
+    POOL.putconn(connection)
+
+
 @contextmanager
 def get_connection():
-    global CONNECTION
-    if not CONNECTION:
-        CONNECTION = connect()
+    connection = POOL.getconn()
     try:
-        yield CONNECTION
-    except Exception:
-        CONNECTION.rollback()
+        yield connection
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        # the server is gone, a fresh connection is opened on the next checkout
+        POOL.discard(connection)
+        raise
+    except BaseException:
+        # GeneratorExit included, a generator holding a connection might be closed early
+        release(connection, connection.rollback)
         raise
     else:
-        CONNECTION.commit()
+        release(connection, connection.commit)
+
+
+def parse_order_by(order_by, pk_column="id"):
+    if not order_by:
+        return pk_column, "ASC"
+    direction = order_by[0:1] if order_by[0:1] in ["+", "-"] else "+"
+    column = order_by[1:].strip() if order_by[0] == direction else order_by.strip()
+    return column, "DESC" if direction == "-" else "ASC"
+
+
+# A cursor points to the first row of a page. It carries both the value of the
+# ordering column and the primary key, so the page can be found by the index alone
+def encode_cursor(value, pk):
+    raw = json.dumps([value, pk], default=lambda v: v.isoformat())
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        value, pk = json.loads(raw.decode("utf-8"))
+    except (TypeError, ValueError, binascii.Error):
+        return None
+    # value is None for a row with an empty ordering column
+    if not isinstance(value, (str, int, float, type(None))) or not isinstance(pk, int):
+        return None
+    return value, pk
+
+
+# isoformat() of a timestamp with time zone as put into the cursor by encode_cursor
+CURSOR_TIMESTAMP = re.compile(
+    r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,6})?([+-]\d{2}:\d{2})?$"
+)
+
+
+# A cursor made for another ordering column, or a forged one, must not get into
+# the query, the database would refuse to compare the value with the column
+def is_cursor_value_valid(value, column_type="text", nullable=False):
+    if value is None:
+        return nullable
+    if column_type == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if column_type == "real":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if column_type == "timestamp":
+        if not isinstance(value, str) or not CURSOR_TIMESTAMP.match(value):
+            return False
+        # the pattern lets through dates such as 2019-02-30
+        try:
+            datetime.datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            return False
+        return True
+    return isinstance(value, str)
+
+
+def make_cursor(row, order_by=None, pk_column="id"):
+    column, _ = parse_order_by(order_by, pk_column)
+    return encode_cursor(row[column], row[pk_column])
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def get_json_values(value):
+    # "false" or "12" might be meant as a string as well, match both
+    values = [value]
+    try:
+        parsed = json.loads(value)
+        if parsed is None or isinstance(parsed, (bool, int, float)):
+            values.append(parsed)
+    except ValueError:
+        pass
+    return values
+
+
+def prepare_containment_condition(column, path, value):
+    documents = []
+    for candidate in get_json_values(value):
+        for key in reversed(path):
+            candidate = {key: candidate}
+        documents.append(
+            sql.SQL("{} @> {}::jsonb").format(
+                sql.Identifier(column), sql.Literal(json.dumps(candidate))
+            )
+        )
+    return sql.SQL("({})").format(sql.SQL(" OR ").join(documents))
+
+
+# column_type is one of integer, real, timestamp, json or text, path is a list of
+# keys inside a json column
+def prepare_filter_condition(column, value, column_type="text", path=None):
+    if column_type == "json" and path:
+        # served by the jsonb_path_ops GIN indexes
+        return prepare_containment_condition(column, path, value)
+    if column_type == "integer":
+        try:
+            return sql.SQL("{} = {}").format(
+                sql.Identifier(column), sql.Literal(int(value))
+            )
+        except ValueError:
+            return sql.SQL("FALSE")
+    if column_type == "timestamp":
+        # a whole day, the value is expected to be YYYY-MM-DD
+        try:
+            day = datetime.datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            return sql.SQL("FALSE")
+        return sql.SQL("{} >= {} AND {} < {}").format(
+            sql.Identifier(column),
+            sql.Literal(day),
+            sql.Identifier(column),
+            sql.Literal(day + datetime.timedelta(days=1)),
+        )
+    # text columns can use a trigram index, there is none for the json and real ones
+    target = sql.Identifier(column)
+    if column_type in ("json", "real"):
+        target = sql.SQL("cast({} as varchar)").format(target)
+    return sql.SQL("{} ILIKE {}").format(
+        target, sql.Literal("%%%s%%" % escape_like(value))
+    )
+
+
+# Rows with an empty ordering column come last in ascending order and first in
+# descending order, just as they are in the (column, pk) index. A page that can
+# cross between the empty and the filled part is looked up by two index range
+# scans, a single condition with OR would make the database walk the index from
+# the start. Returns the list of those conditions
+def prepare_keyset_conditions(
+    column, pk_column, direction, cursor, nullable=False, column_type="text"
+):
+    value, pk = cursor
+    literal = sql.Literal(value)
+    # the cursor value comes back as a double, a real column compared to it
+    # would never match the row the cursor was made from
+    if column_type == "real":
+        literal = sql.SQL("{}::real").format(literal)
+    operator = sql.SQL("<=" if direction == "DESC" else ">=")
+    if value is None and nullable:
+        empty = sql.SQL("{} IS NULL AND {} {} {}").format(
+            sql.Identifier(column), sql.Identifier(pk_column), operator, sql.Literal(pk)
+        )
+        if direction == "ASC":
+            return [empty]
+        return [empty, sql.SQL("{} IS NOT NULL").format(sql.Identifier(column))]
+    condition = sql.SQL("({}, {}) {} ({}, {})").format(
+        sql.Identifier(column),
+        sql.Identifier(pk_column),
+        operator,
+        literal,
+        sql.Literal(pk),
+    )
+    if nullable and direction == "ASC":
+        return [condition, sql.SQL("{} IS NULL").format(sql.Identifier(column))]
+    return [condition]
 
 
 def prepare_list_statement(
-    connection,
     tablename,
     columns,
     order_by=None,
@@ -42,92 +307,108 @@ def prepare_list_statement(
     start_with=None,
     filter=None,
     pk_column="id",
+    column_types=None,
+    sortable_columns=None,
+    nullable_columns=None,
 ):
-    where_clause = sql.SQL("")
+    conditions = []
+    keyset_conditions = []
     limit_clause = sql.SQL("")
-    order_by_clause = sql.SQL("ORDER BY {}").format(sql.Identifier(pk_column))
-    order_by_column = pk_column
-    order_by_direction = "ASC"
-
-    if order_by:
-        direction = order_by[0:1] if order_by[0:1] in ["+", "-"] else "+"
-        order_by_direction = "DESC" if direction == "-" else "ASC"
-        order_by_column = (
-            order_by[1:].strip() if order_by[0] == direction else order_by.strip()
-        )
-        order_by_clause = sql.SQL("ORDER BY {}, {}").format(
-            sql.SQL(" ").join(
-                [sql.Identifier(order_by_column), sql.SQL(order_by_direction)]
-            ),
-            sql.Identifier("id"),
+    order_by_column, order_by_direction = parse_order_by(order_by, pk_column)
+    # sorting by a column without a (column, pk) index means sorting the whole table
+    if (
+        sortable_columns is not None
+        and order_by_column != pk_column
+        and order_by_column not in sortable_columns
+    ):
+        raise ValueError("Cannot order by %s" % (order_by_column,))
+    # the primary key breaks ties in the same direction, so the row value
+    # comparison below matches the order exactly
+    order_by_clause = sql.SQL("ORDER BY {} {}").format(
+        sql.Identifier(pk_column), sql.SQL(order_by_direction)
+    )
+    if order_by_column != pk_column:
+        order_by_clause = sql.SQL("ORDER BY {} {}, {} {}").format(
+            sql.Identifier(order_by_column),
+            sql.SQL(order_by_direction),
+            sql.Identifier(pk_column),
+            sql.SQL(order_by_direction),
         )
 
     if start_with:
-        if order_by:
-            cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            statement = sql.SQL("SELECT {} FROM {} where {} = %s").format(
-                sql.SQL(", ").join([sql.Identifier(c) for c in columns]),
-                sql.Identifier(tablename),
-                sql.Identifier(pk_column),
+        cursor = decode_cursor(str(start_with))
+        # plain primary keys are still accepted when ordering by the primary key
+        if (
+            cursor is None
+            and str(start_with).isdigit()
+            and order_by_column == pk_column
+        ):
+            cursor = (int(start_with), int(start_with))
+        column_type = (column_types or {}).get(order_by_column, "text")
+        nullable = order_by_column in (nullable_columns or [])
+        if cursor is not None and is_cursor_value_valid(
+            cursor[0], column_type, nullable
+        ):
+            keyset_conditions = prepare_keyset_conditions(
+                order_by_column,
+                pk_column,
+                order_by_direction,
+                cursor,
+                nullable=nullable,
+                column_type=column_type,
             )
-            cursor.execute(statement.as_string(connection) % start_with)
-            data = cursor.fetchone()
-            cursor.close()
-            if data:
-                where_clause = sql.SQL("WHERE {} {} {}").format(
-                    sql.Identifier(order_by_column),
-                    sql.SQL("<=" if order_by_direction == "DESC" else ">="),
-                    sql.Literal(data[order_by_column]),
-                )
-            else:
-                where_clause = sql.SQL("WHERE id {} {}").format(
-                    sql.SQL("<=" if order_by_direction == "DESC" else ">="),
-                    sql.Literal(start_with),
-                )
-        else:
-            where_clause = sql.SQL("WHERE id >= {}").format(sql.Literal(start_with))
 
     if filter:
         filter_splitted = filter.split(":", 1)
-        if len(filter_splitted) == 2 and filter_splitted[0] in columns:
-            if start_with:
-                # TODO filter can work only with strings, the cast is slow
-                where_clause = sql.SQL(" ").join(
-                    [
-                        where_clause,
-                        sql.SQL(
-                            "AND cast({} as varchar) ~* cast({} as varchar)"
-                        ).format(
-                            sql.Identifier(filter_splitted[0]),
-                            sql.Literal(filter_splitted[1]),
-                        ),
-                    ]
-                )
-            else:
-                where_clause = sql.SQL(" ").join(
-                    [
-                        where_clause,
-                        sql.SQL(
-                            "WHERE cast({} as varchar) ~* cast({} as varchar)"
-                        ).format(
-                            sql.Identifier(filter_splitted[0]),
-                            sql.Literal(filter_splitted[1]),
-                        ),
-                    ]
+        # printer_data.name:value looks for the value under the name key
+        path = filter_splitted[0].split(".")
+        column = path.pop(0)
+        column_type = (column_types or {}).get(column, "text")
+        if (
+            len(filter_splitted) == 2
+            and column in columns
+            and (not path or column_type == "json")
+        ):
+            conditions.append(
+                prepare_filter_condition(
+                    column, filter_splitted[1], column_type, path=path
                 )
+            )
 
     if limit:
         limit_clause = sql.SQL(" ").join(
             [sql.SQL("limit"), sql.Literal(int(limit + 1))]
         )
 
+    def prepare_select(conditions):
+        where_clause = sql.SQL("")
+        if conditions:
+            where_clause = sql.SQL("WHERE {}").format(sql.SQL(" AND ").join(conditions))
+        return sql.SQL(" ").join(
+            [
+                sql.SQL("SELECT {} FROM {}").format(
+                    sql.SQL(", ").join([sql.Identifier(c) for c in columns]),
+                    sql.Identifier(tablename),
+                ),
+                where_clause,
+                order_by_clause,
+                limit_clause,
+            ]
+        )
+
+    if len(keyset_conditions) < 2:
+        return prepare_select(conditions + keyset_conditions)
+    # both parts are limited on their own, only a page or two of rows get sorted
     return sql.SQL(" ").join(
         [
-            sql.SQL("SELECT {} FROM {}").format(
-                sql.SQL(", ").join([sql.Identifier(c) for c in columns]),
-                sql.Identifier(tablename),
+            sql.SQL("SELECT * FROM ({}) AS page").format(
+                sql.SQL(" UNION ALL ").join(
+                    [
+                        sql.SQL("({})").format(prepare_select(conditions + [keyset]))
+                        for keyset in keyset_conditions
+                    ]
+                )
             ),
-            where_clause,
             order_by_clause,
             limit_clause,
         ]
@@ -1,20 +1,112 @@
 import psycopg2
+from psycopg2 import sql
 import psycopg2.extras
 from server.database import get_connection, prepare_list_statement
 
+# Filters on the columns not listed here are substring matches
+COLUMN_TYPES = {
+    "id": "integer",
+    "size": "integer",
+    "uploaded": "timestamp",
+    "bed_temperature": "integer",
+    "extruder_temperature": "integer",
+    "print_time": "integer",
+    "layer_count": "integer",
+    "filament_length": "real",
+    "filament_weight": "real",
+    "bounding_box": "json",
+    "stages": "json",
+}
+# Every column listed here has a (column, id) index, see V0004__sort_indexes.sql,
+# V0008__gcodes_metadata.sql and V0009__gcodes_analysis.sql
+SORTABLE_COLUMNS = [
+    "filename",
+    "display",
+    "path",
+    "uploaded",
+    "size",
+    "filament_type",
+    "printer_model",
+    "bed_temperature",
+    "extruder_temperature",
+    "print_time",
+    "filament_weight",
+]
+# Empty until the file is processed or when the slicer does not tell, the keyset
+# pagination has to expect NULLs in these
+NULLABLE_COLUMNS = [
+    "filament_type",
+    "printer_model",
+    "bed_temperature",
+    "extruder_temperature",
+    "print_time",
+    "filament_weight",
+]
+# Read from the file after upload, see server/services/gcodemeta.py
+METADATA_COLUMNS = [
+    "filament_type",
+    "printer_model",
+    "bed_temperature",
+    "extruder_temperature",
+]
+# Estimated after upload, see server/services/gcodeanalysis.py
+ANALYSIS_COLUMNS = [
+    "print_time",
+    "filament_length",
+    "filament_weight",
+    "layer_count",
+    "bounding_box",
+]
+# Everything derived from the file by the processing, the thumbnail column holds
+# the hash of the image, see server/services/gcodethumbnail.py
+DERIVED_COLUMNS = METADATA_COLUMNS + ANALYSIS_COLUMNS + ["thumbnail"]
+COLUMNS = [
+    "id",
+    "path",
+    "filename",
+    "display",
+    "absolute_path",
+    "uploaded",
+    "size",
+    "hash",
+    "state",
+    "stages",
+] + DERIVED_COLUMNS
+# Given on insert, the others are defaults
+INSERT_COLUMNS = [
+    "path",
+    "filename",
+    "display",
+    "absolute_path",
+    "size",
+    "hash",
+    "state",
+    "stages",
+] + DERIVED_COLUMNS
+# gcodes added without going through the processing, e.g. in tests, are complete
+INSERT_DEFAULTS = {"state": "ready", "stages": {}}
+JSON_COLUMNS = ["stages", "bounding_box"]
+INSERT_STATEMENT = "INSERT INTO gcodes (%s) values (%s)" % (
+    ", ".join(INSERT_COLUMNS),
+    ", ".join(["%s"] * len(INSERT_COLUMNS)),
+)
+
+
 # This intentionally selects limit+1 results in order to properly determine next start_with for pagination
 # Take that into account when processing results
+# start_with is a cursor made by make_cursor from the first row of the requested page
 def get_gcodes(order_by=None, limit=None, start_with=None, filter=None):
-    columns = ["id", "path", "filename", "display", "absolute_path", "uploaded", "size"]
     with get_connection() as connection:
         statement = prepare_list_statement(
-            connection,
             "gcodes",
-            columns,
+            COLUMNS,
             order_by=order_by,
             limit=limit,
             start_with=start_with,
             filter=filter,
+            column_types=COLUMN_TYPES,
+            sortable_columns=SORTABLE_COLUMNS,
+            nullable_columns=NULLABLE_COLUMNS,
         )
         cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
         cursor.execute(statement)
@@ -32,7 +124,7 @@ def get_gcode(id):
     with get_connection() as connection:
         cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
         cursor.execute(
-            "SELECT id, path, filename, display, absolute_path, uploaded, size from gcodes where id = %s",
+            "SELECT %s from gcodes where id = %%s" % (", ".join(COLUMNS),),
             (id,),
         )
         data = cursor.fetchone()
@@ -43,21 +135,86 @@ def get_gcode(id):
 def add_gcode(**kwargs):
     with get_connection() as connection:
         cursor = connection.cursor()
-        cursor.execute(
-            "INSERT INTO gcodes (path, filename, display, absolute_path, size) values (%s, %s, %s, %s, %s) RETURNING id",
+        values = dict(INSERT_DEFAULTS, **kwargs)
+        params = [
             (
-                kwargs["path"],
-                kwargs["filename"],
-                kwargs["display"],
-                kwargs["absolute_path"],
-                kwargs["size"],
-            ),
-        )
+                psycopg2.extras.Json(values[column])
+                if column in JSON_COLUMNS and values.get(column, None) is not None
+                else values.get(column, None)
+            )
+            for column in INSERT_COLUMNS
+        ]
+        if kwargs.get("hash", None) is None:
+            cursor.execute(INSERT_STATEMENT + " RETURNING id", params)
+        else:
+            # the blob is referenced by one more gcode, in the same statement
+            cursor.execute(
+                """
+                WITH gcode AS (
+                    %s
+                    RETURNING id, absolute_path, size, hash
+                ), blob AS (
+                    INSERT INTO gcode_blobs (hash, absolute_path, size, refs)
+                    SELECT hash, absolute_path, size, 1 FROM gcode
+                    ON CONFLICT (hash) DO UPDATE SET refs = gcode_blobs.refs + 1
+                )
+                SELECT id FROM gcode
+                """ % (INSERT_STATEMENT,),
+                params,
+            )
         data = cursor.fetchone()
         cursor.close()
         return data[0]
 
 
+# Marks a stage of the processing as done or failed together with the values it
+# derived from the file, see server/tasks/process_gcode.py
+def update_gcode_stage(id, stage, status, values=None):
+    values = {
+        column: (
+            psycopg2.extras.Json(value)
+            if column in JSON_COLUMNS and value is not None
+            else value
+        )
+        for column, value in (values or {}).items()
+        if column in DERIVED_COLUMNS
+    }
+    assignments = [
+        sql.SQL("stages = stages || jsonb_build_object({}, {})").format(
+            sql.Literal(stage), sql.Literal(status)
+        )
+    ] + [
+        sql.SQL("{} = {}").format(sql.Identifier(column), sql.Placeholder(column))
+        for column in values
+    ]
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            sql.SQL("UPDATE gcodes SET {} WHERE id = {}").format(
+                sql.SQL(", ").join(assignments), sql.Placeholder("id")
+            ),
+            dict(values, id=id),
+        )
+        cursor.close()
+
+
+# Once all stages ran, the gcode is ready unless any of them failed
+def finish_gcode_processing(id):
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            UPDATE gcodes SET state = CASE
+                WHEN EXISTS (SELECT 1 FROM jsonb_each_text(stages) WHERE value = 'failed')
+                THEN 'failed' ELSE 'ready' END
+            WHERE id = %s
+            """,
+            (id,),
+        )
+        cursor.close()
+
+
+# Returns the absolute path of the file no gcode refers to anymore, if any
 def delete_gcode(id):
     try:
         if isinstance(id, str):
@@ -65,6 +222,33 @@ def delete_gcode(id):
     except ValueError:
         pass
     with get_connection() as connection:
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM gcodes WHERE id = %s", (id,))
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.execute(
+            """
+            WITH gcode AS (
+                DELETE FROM gcodes WHERE id = %s RETURNING hash, absolute_path
+            ), blob AS (
+                UPDATE gcode_blobs SET refs = gcode_blobs.refs - 1 FROM gcode
+                WHERE gcode_blobs.hash = gcode.hash
+                RETURNING gcode_blobs.hash, gcode_blobs.refs
+            )
+            SELECT gcode.hash, gcode.absolute_path, blob.refs FROM gcode LEFT JOIN blob ON blob.hash = gcode.hash
+            """,
+            (id,),
+        )
+        data = cursor.fetchone()
+        if data is None:
+            cursor.close()
+            return None
+        if data["hash"] is None:
+            # uploaded before the blob storage, the file is its own
+            cursor.close()
+            return data["absolute_path"]
+        # somebody might have uploaded the same content in the meantime
+        cursor.execute(
+            "DELETE FROM gcode_blobs WHERE hash = %s AND refs <= 0 RETURNING absolute_path",
+            (data["hash"],),
+        )
+        data = cursor.fetchone()
         cursor.close()
+        return data["absolute_path"] if data else None
@@ -0,0 +1,168 @@
+import os
+import sys
+import threading
+from time import time, perf_counter
+import psycopg2.extensions
+from flask import g, has_request_context
+from server import app
+from server.services.cache import redis
+
+# Upper bounds (in ms) of the latency histogram buckets
+BUCKETS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+NAMES_KEY = "query_stats"
+
+
+def get_key(name):
+    return "query_stats_%s" % (name,)
+
+
+def get_bucket(ms):
+    for bound in BUCKETS:
+        if ms <= bound:
+            return "le_%s" % bound
+    return "le_inf"
+
+
+def get_statement_name(frame):
+    # statements are named after the function running them, e.g. printjobs.get_printjobs
+    module = frame.f_globals.get("__name__", "")
+    if module.startswith("server.database."):
+        module = module[len("server.database.") :]
+    return "%s.%s" % (module, frame.f_code.co_name)
+
+
+# Aggregates of the queries run by this process since the last flush. Every
+# process pushes them into redis now and then, so the metrics cover all of them.
+class QueryStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.pending = {}
+        self.flushed = time()
+
+    def record(self, name, ms, rows):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            stats = self.pending.setdefault(
+                name, {"count": 0, "rows": 0, "ms": 0.0, "buckets": {}}
+            )
+            stats["count"] += 1
+            stats["rows"] += rows
+            stats["ms"] += ms
+            bucket = get_bucket(ms)
+            stats["buckets"][bucket] = stats["buckets"].get(bucket, 0) + 1
+
+    def take(self, force=False):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            if not force and time() - self.flushed < app.config.get(
+                "DB_STATS_FLUSH_INTERVAL", 10
+            ):
+                return {}
+            pending = self.pending
+            self.pending = {}
+            self.flushed = time()
+            return pending
+
+
+STATS = QueryStats()
+
+
+def flush(force=False):
+    pending = STATS.take(force)
+    if not pending:
+        return
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for name, stats in pending.items():
+            key = get_key(name)
+            pipe.sadd(NAMES_KEY, name)
+            pipe.hincrby(key, "count", stats["count"])
+            pipe.hincrby(key, "rows", stats["rows"])
+            pipe.hincrbyfloat(key, "ms", stats["ms"])
+            for bucket, count in stats["buckets"].items():
+                pipe.hincrby(key, bucket, count)
+        pipe.execute()
+    except Exception as e:
+        app.logger.error("Cannot save query statistics into cache: %s", e)
+
+
+def load_stats():
+    names = sorted(name.decode("utf-8") for name in redis.smembers(NAMES_KEY))
+    pipe = redis.pipeline(transaction=False)
+    for name in names:
+        pipe.hgetall(get_key(name))
+    result = {}
+    for name, raw in zip(names, pipe.execute()):
+        raw = {k.decode("utf-8"): v.decode("utf-8") for k, v in raw.items()}
+        count = int(raw.get("count", 0))
+        ms = float(raw.get("ms", 0))
+        result[name] = {
+            "count": count,
+            "rows": int(raw.get("rows", 0)),
+            "total_ms": round(ms, 3),
+            "mean_ms": round(ms / count, 3) if count else 0,
+            "histogram": {
+                bucket: int(raw.get(bucket, 0))
+                for bucket in [get_bucket(bound) for bound in BUCKETS] + ["le_inf"]
+            },
+        }
+    return result
+
+
+def record(name, ms, rows, query):
+    STATS.record(name, ms, rows)
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+        g.query_ms = g.get("query_ms", 0.0) + ms
+    if ms >= app.config.get("DB_SLOW_QUERY_MS", 200):
+        if isinstance(query, bytes):
+            query = query.decode("utf-8", "replace")
+        app.logger.warning("Slow query %s took %.1f ms: %s", name, ms, query)
+    flush()
+
+
+class InstrumentedCursor:
+    def execute(self, query, vars=None):
+        frame = sys._getframe(1)
+        start = perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record(
+                get_statement_name(frame),
+                (perf_counter() - start) * 1000,
+                max(self.rowcount, 0),
+                self.query,
+            )
+
+
+# cursor factory -> its instrumented subclass
+CURSOR_CLASSES = {}
+
+
+def get_cursor_class(cursor_factory):
+    cursor_class = CURSOR_CLASSES.get(cursor_factory)
+    if cursor_class is None:
+        cursor_class = CURSOR_CLASSES[cursor_factory] = type(
+            "Instrumented%s" % cursor_factory.__name__,
+            (InstrumentedCursor, cursor_factory),
+            {},
+        )
+    return cursor_class
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    # the database functions pick their own cursor_factory, each of them is instrumented
+    def cursor(self, *args, **kwargs):
+        kwargs["cursor_factory"] = get_cursor_class(
+            kwargs.get("cursor_factory")
+            or self.cursor_factory
+            or psycopg2.extensions.cursor
+        )
+        return super().cursor(*args, **kwargs)
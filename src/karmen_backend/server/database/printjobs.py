@@ -2,19 +2,33 @@ import psycopg2
 import psycopg2.extras
 from server.database import get_connection, prepare_list_statement
 
+# Filters on the columns not listed here are substring matches
+COLUMN_TYPES = {
+    "id": "integer",
+    "gcode_id": "integer",
+    "started": "timestamp",
+    "gcode_data": "json",
+    "printer_data": "json",
+}
+# Every column listed here has a (column, id) index, see V0004__sort_indexes.sql
+SORTABLE_COLUMNS = ["started", "gcode_id", "printer_ip"]
+
+
 # This intentionally selects limit+1 results in order to properly determine next start_with for pagination
 # Take that into account when processing results
+# start_with is a cursor made by make_cursor from the first row of the requested page
 def get_printjobs(order_by=None, limit=None, start_with=None, filter=None):
     columns = ["id", "gcode_id", "printer_ip", "started", "gcode_data", "printer_data"]
     with get_connection() as connection:
         statement = prepare_list_statement(
-            connection,
             "printjobs",
             columns,
             order_by=order_by,
             limit=limit,
             start_with=start_with,
             filter=filter,
+            column_types=COLUMN_TYPES,
+            sortable_columns=SORTABLE_COLUMNS,
         )
         cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
         cursor.execute(statement)
@@ -23,6 +37,39 @@ def get_printjobs(order_by=None, limit=None, start_with=None, filter=None):
         return data
 
 
+def iterate_statement(statement, batch_size):
+    with get_connection() as connection:
+        # named cursors live only within a transaction
+        connection.autocommit = False
+        try:
+            cursor = connection.cursor(
+                "printjobs_export", cursor_factory=psycopg2.extras.DictCursor
+            )
+            cursor.itersize = batch_size
+            cursor.execute(statement)
+            for row in cursor:
+                yield row
+            cursor.close()
+        finally:
+            connection.rollback()
+            connection.autocommit = True
+
+
+# Rows are fetched from a server side cursor batch_size at a time, the whole
+# result is never held in memory. Raises ValueError right away for a bad order_by
+def iterate_printjobs(order_by=None, filter=None, batch_size=1000):
+    columns = ["id", "gcode_id", "printer_ip", "started", "gcode_data", "printer_data"]
+    statement = prepare_list_statement(
+        "printjobs",
+        columns,
+        order_by=order_by,
+        filter=filter,
+        column_types=COLUMN_TYPES,
+        sortable_columns=SORTABLE_COLUMNS,
+    )
+    return iterate_statement(statement, batch_size)
+
+
 def get_printjob(id):
     try:
         if isinstance(id, str):
@@ -40,11 +87,33 @@ def get_printjob(id):
         return data
 
 
+# The summary tables are updated by the same statement, so the statistics
+# never drift from the printjobs table
 def add_printjob(**kwargs):
     with get_connection() as connection:
         cursor = connection.cursor()
         cursor.execute(
-            "INSERT INTO printjobs (gcode_id, printer_ip, gcode_data, printer_data) values (%s, %s, %s, %s) RETURNING id",
+            """
+            WITH job AS (
+                INSERT INTO printjobs (gcode_id, printer_ip, gcode_data, printer_data) values (%s, %s, %s, %s)
+                RETURNING id, gcode_id, printer_ip, started, gcode_data
+            ), daily AS (
+                INSERT INTO printjob_stats_daily (printer_ip, day, jobs)
+                SELECT printer_ip, (started AT TIME ZONE 'UTC')::date, 1 FROM job
+                ON CONFLICT (printer_ip, day) DO UPDATE SET jobs = printjob_stats_daily.jobs + 1
+            ), printer AS (
+                INSERT INTO printer_stats (printer_ip, jobs, last_started)
+                SELECT printer_ip, 1, started FROM job
+                ON CONFLICT (printer_ip) DO UPDATE SET jobs = printer_stats.jobs + 1,
+                    last_started = GREATEST(printer_stats.last_started, EXCLUDED.last_started)
+            ), gcode AS (
+                INSERT INTO gcode_stats (gcode_id, filename, jobs)
+                SELECT gcode_id, gcode_data->>'filename', 1 FROM job
+                ON CONFLICT (gcode_id) DO UPDATE SET jobs = gcode_stats.jobs + 1,
+                    filename = COALESCE(EXCLUDED.filename, gcode_stats.filename)
+            )
+            SELECT id FROM job
+            """,
             (
                 kwargs["gcode_id"],
                 kwargs["printer_ip"],
@@ -65,7 +134,32 @@ def delete_printjob(id):
         pass
     with get_connection() as connection:
         cursor = connection.cursor()
-        cursor.execute("DELETE FROM printjobs WHERE id = %s", (id,))
+        cursor.execute(
+            """
+            WITH job AS (
+                DELETE FROM printjobs WHERE id = %s
+                RETURNING id, gcode_id, printer_ip, started
+            ), daily AS (
+                UPDATE printjob_stats_daily SET jobs = printjob_stats_daily.jobs - 1 FROM job
+                WHERE printjob_stats_daily.printer_ip = job.printer_ip
+                    AND printjob_stats_daily.day = (job.started AT TIME ZONE 'UTC')::date
+            ), printer AS (
+                -- the subquery still sees the deleted job, it has to be left out by hand
+                UPDATE printer_stats SET jobs = printer_stats.jobs - 1,
+                    last_started = CASE WHEN printer_stats.last_started > job.started
+                        THEN printer_stats.last_started
+                        ELSE (
+                            SELECT max(started) FROM printjobs
+                            WHERE printjobs.printer_ip = job.printer_ip AND printjobs.id <> job.id
+                        ) END
+                FROM job
+                WHERE printer_stats.printer_ip = job.printer_ip
+            )
+            UPDATE gcode_stats SET jobs = gcode_stats.jobs - 1 FROM job
+            WHERE gcode_stats.gcode_id = job.gcode_id
+            """,
+            (id,),
+        )
         cursor.close()
 
 
@@ -77,3 +171,40 @@ def update_gcode_data(gcode_id, gcode_data):
             (psycopg2.extras.Json(gcode_data), gcode_id),
         )
         cursor.close()
+
+
+# All of the statistics are read from the summary tables, the cost depends on
+# the number of printers, gcodes and days asked for, not on the job history
+def get_daily_stats(since):
+    with get_connection() as connection:
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.execute(
+            "SELECT printer_ip, day, jobs FROM printjob_stats_daily WHERE day >= %s AND jobs > 0 ORDER BY printer_ip, day",
+            (since,),
+        )
+        data = cursor.fetchall()
+        cursor.close()
+        return data
+
+
+def get_printer_stats():
+    with get_connection() as connection:
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.execute(
+            "SELECT printer_ip, jobs, last_started FROM printer_stats WHERE jobs > 0 ORDER BY printer_ip"
+        )
+        data = cursor.fetchall()
+        cursor.close()
+        return data
+
+
+def get_gcode_stats(limit):
+    with get_connection() as connection:
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.execute(
+            "SELECT gcode_id, filename, jobs FROM gcode_stats WHERE jobs > 0 ORDER BY jobs DESC, gcode_id ASC LIMIT %s",
+            (limit,),
+        )
+        data = cursor.fetchall()
+        cursor.close()
+        return data
@@ -1,7 +1,12 @@
+import os
+import threading
 import psycopg2
 import psycopg2.extras
 from server import app
-from server.database import get_connection
+from server.database import get_connection, connect
+
+# upsert_val notifies every process through this channel
+CHANNEL = "settings_changed"
 
 
 def normalize_val(val):
@@ -15,34 +20,103 @@ def normalize_val(val):
     return val
 
 
-def get_all_settings():
+def load_settings():
     with get_connection() as connection:
         cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
         cursor.execute("SELECT key, val FROM settings")
         data = cursor.fetchall()
         cursor.close()
-        return data
+        return {row["key"]: row["val"] for row in data}
 
 
-def get_val(key):
-    with get_connection() as connection:
-        cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute("SELECT key, val FROM settings where key = %s", (key,))
-        data = cursor.fetchone()
+# All of the settings held in the process. A dedicated connection LISTENs for
+# changes and checking it is a non blocking read of its socket, so a read from
+# a fresh cache does not cost a database round trip.
+class SettingsCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # the listening connection inherited from a parent process cannot be used
+        self.pid = os.getpid()
+        self.listener = None
+        self.values = None
+
+    def listen(self):
+        # has to be listening before the values are loaded, a change in between would be lost
+        self.listener = connect()
+        cursor = self.listener.cursor()
+        cursor.execute("LISTEN %s" % CHANNEL)
         cursor.close()
-        if data and data["val"] is not None:
-            return normalize_val(data["val"])
+
+    def is_stale(self):
         try:
-            return app.config[key.upper()]
-        except KeyError:
-            return None
+            self.listener.poll()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            app.logger.error("Cannot check for settings changes: %s", e)
+            self.listener.close()
+            self.listener = None
+            return True
+        if self.listener.notifies:
+            del self.listener.notifies[:]
+            return True
+        return False
+
+    def invalidate(self):
+        with self.lock:
+            self.values = None
+
+    def get_all(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            if self.listener is None:
+                try:
+                    self.listen()
+                except Exception as e:
+                    app.logger.error("Cannot listen for settings changes: %s", e)
+                    self.listener = None
+                    return load_settings()
+                self.values = None
+            elif self.is_stale():
+                self.values = None
+            if self.values is None:
+                self.values = load_settings()
+            return self.values
+
+
+CACHE = SettingsCache()
+
+
+def get_all_settings():
+    return [{"key": key, "val": val} for key, val in CACHE.get_all().items()]
+
+
+def get_val(key):
+    val = CACHE.get_all().get(key)
+    if val is not None:
+        return normalize_val(val)
+    try:
+        return app.config[key.upper()]
+    except KeyError:
+        return None
 
 
 def upsert_val(key, val):
     with get_connection() as connection:
         cursor = connection.cursor()
+        # the notification is delivered when the change is committed
         cursor.execute(
-            "INSERT INTO settings (key, val) values (%s, %s) ON CONFLICT ON CONSTRAINT settings_key_uqc DO UPDATE SET val = %s",
-            (key.lower(), val, val),
+            """
+            WITH upserted AS (
+                INSERT INTO settings (key, val) values (%s, %s) ON CONFLICT ON CONSTRAINT settings_key_uqc DO UPDATE SET val = %s
+                RETURNING key
+            )
+            SELECT pg_notify(%s, key) FROM upserted
+            """,
+            (key.lower(), val, val, CHANNEL),
         )
         cursor.close()
+    # the other processes are notified, this one must not wait for it
+    CACHE.invalidate()
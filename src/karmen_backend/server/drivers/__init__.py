@@ -1,4 +1,4 @@
-from server.drivers.octoprint import Octoprint
+from server.drivers.octoprint import Octoprint, AsyncOctoprint
 
 
 def get_printer_instance(printer):
@@ -8,3 +8,14 @@ def get_printer_instance(printer):
         return Octoprint(**printer)
 
     raise RuntimeError("Printer has an unknown client %s defined" % printer["client"])
+
+
+def get_async_printer_instance(printer, session=None):
+    if not "client" in printer:
+        raise RuntimeError("Printer has no client defined")
+    if printer["client"] == "octoprint":
+        instance = AsyncOctoprint(**printer)
+        instance.session = session
+        return instance
+
+    raise RuntimeError("Printer has an unknown client %s defined" % printer["client"])
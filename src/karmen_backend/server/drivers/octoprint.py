@@ -2,7 +2,13 @@ import json
 import re
 
 from server import app
-from server.services.network import get_uri, post_uri
+from server.services.network import (
+    get_uri,
+    post_uri,
+    async_get_uri,
+    async_post_uri,
+    run_blocking,
+)
 from server.drivers.utils import (
     PrinterClientInfo,
     PrinterDriver,
@@ -52,38 +58,39 @@ class Octoprint(PrinterDriver):
     # TODO move this code outside of this driver, the sniffing code should discover a variety of drivers
     def sniff(self):
         request = get_uri(self.ip, endpoint="/api/version")
+        settings_req = None
+        if request is not None and request.status_code == 403:
+            settings_req = get_uri(self.ip, endpoint="/api/settings")
+        self.client = self.handle_sniff(request, settings_req)
+
+    def handle_sniff(self, request, settings_req=None):
         if request is None:
             app.logger.debug(
                 "%s is not responding on /api/version - not octoprint" % self.ip
             )
-            self.client = PrinterClientInfo({}, False)
-            return
+            return PrinterClientInfo({}, False)
         if request.status_code == 403:
             app.logger.debug(
                 "%s is responding with %s on /api/version - might be access-protected octoprint"
                 % (self.ip, request.status_code)
             )
-            settings_req = get_uri(self.ip, endpoint="/api/settings")
             if settings_req and settings_req.status_code == 200:
                 app.logger.debug(
                     "%s is responding with 200 on /api/settings - probably access-protected octoprint"
                     % self.ip
                 )
-                self.client = PrinterClientInfo({}, True, True)
-            else:
-                app.logger.debug(
-                    "%s is responding with %s on /api/settings - probably not octoprint"
-                    % (self.ip, settings_req.status_code)
-                )
-                self.client = PrinterClientInfo({}, False)
-            return
+                return PrinterClientInfo({}, True, True)
+            app.logger.debug(
+                "%s is responding with %s on /api/settings - probably not octoprint"
+                % (self.ip, settings_req.status_code if settings_req else None)
+            )
+            return PrinterClientInfo({}, False)
         if request.status_code != 200:
             app.logger.debug(
                 "%s is responding with %s on /api/version - not accessible"
                 % (self.ip, request.status_code)
             )
-            self.client = PrinterClientInfo({}, False)
-            return
+            return PrinterClientInfo({}, False)
         try:
             data = request.json()
             if "text" not in data:
@@ -91,23 +98,20 @@ class Octoprint(PrinterDriver):
                     "%s is responding with unfamiliar JSON %s on /api/version - probably not octoprint"
                     % (self.ip, data)
                 )
-                self.client = PrinterClientInfo(data, False)
-                return
+                return PrinterClientInfo(data, False)
         except json.decoder.JSONDecodeError:
             app.logger.debug(
                 "%s is not responding with JSON on /api/version - probably not octoprint"
                 % self.ip
             )
-            self.client = PrinterClientInfo({}, False)
-            return
+            return PrinterClientInfo({}, False)
         if re.match(r"^octoprint", data["text"], re.IGNORECASE) is None:
             app.logger.debug(
                 "%s is responding with %s on /api/version - probably not octoprint"
                 % (self.ip, data["text"])
             )
-            self.client = PrinterClientInfo(data, False)
-            return
-        self.client = PrinterClientInfo(data, True)
+            return PrinterClientInfo(data, False)
+        return PrinterClientInfo(data, True)
 
     def status(self):
         request = None
@@ -115,6 +119,9 @@ class Octoprint(PrinterDriver):
             request = get_uri(self.ip, endpoint="/api/printer?exclude=history")
             if not request:
                 self.client.connected = False
+        return self.handle_status(request)
+
+    def handle_status(self, request):
         if request is not None and request.status_code == 200:
             try:
                 data = request.json()
@@ -138,6 +145,9 @@ class Octoprint(PrinterDriver):
             request = get_uri(self.ip, endpoint="/api/settings")
             if not request:
                 self.client.connected = False
+        return self.handle_webcam(request)
+
+    def handle_webcam(self, request):
         if request is not None and request.status_code == 200:
             try:
                 data = request.json()
@@ -166,6 +176,9 @@ class Octoprint(PrinterDriver):
             request = get_uri(self.ip, endpoint="/api/job")
             if not request:
                 self.client.connected = False
+        return self.handle_job(request)
+
+    def handle_job(self, request):
         if request is not None and request.status_code == 200:
             try:
                 data = request.json()
@@ -183,38 +196,163 @@ class Octoprint(PrinterDriver):
         else:
             return {}
 
-    def upload_and_start_job(self, gcode_disk_path, path=None):
+    def handle_push_message(self, message):
+        # Converts a message from the octoprint push API (/sockjs) into the shapes
+        # returned by status() and job(). Messages without printer state yield nothing.
+        if "current" not in message:
+            return {}
+        current = message["current"]
+        try:
+            state = current["state"]["text"]
+            # temperatures are not part of every message
+            if current.get("temps"):
+                self.push_temperature = {
+                    k: v for k, v in current["temps"][-1].items() if k != "time"
+                }
+            data = {
+                "status": {
+                    "state": state,
+                    "temperature": getattr(self, "push_temperature", {}),
+                },
+                "job": {},
+            }
+            if not re.match(r"Operational|Offline", state):
+                data["job"] = {
+                    "name": current["job"]["file"]["display"],
+                    "completion": current["progress"]["completion"],
+                    "printTimeLeft": current["progress"]["printTimeLeft"],
+                    "printTime": current["progress"]["printTime"],
+                }
+            return data
+        except (KeyError, TypeError):
+            return {}
+
+    def upload_and_start_job(self, gcode_disk_path, path=None, filename=None):
         request = None
         if self.client.connected:
-            status = self.status()
-            if status["state"] != "Operational":
-                raise PrinterDriverException(
-                    "Printer is printing, cannot start another print"
-                )
+            self.check_operational(self.status())
             request = post_uri(
                 self.ip,
                 endpoint="/api/files/local",
-                files={"file": open(gcode_disk_path, "rb")},
-                data={
-                    "path": "karmen" if not path else "karmen/%s" % path,
-                    "print": True,
+                files={
+                    "file": self.get_upload_file(open(gcode_disk_path, "rb"), filename)
                 },
+                data=self.get_upload_data(path),
             )
             if not request:
                 self.client.connected = False
         # TODO improve return value
         return bool(request is not None and request.status_code == 201)
 
+    def check_operational(self, status):
+        if status["state"] != "Operational":
+            raise PrinterDriverException(
+                "Printer is printing, cannot start another print"
+            )
+
+    def get_upload_file(self, gcode, filename=None):
+        # stored gcodes are named by their content, the printer gets the real name
+        return (filename, gcode) if filename else gcode
+
+    def get_upload_data(self, path=None):
+        return {"path": "karmen" if not path else "karmen/%s" % path, "print": True}
+
     def modify_current_job(self, action):
-        if action not in ("cancel", "start", "toggle"):
-            raise PrinterDriverException("Action %s is not allowed" % (action,))
         request = None
+        body = self.get_job_command(action)
         if self.client.connected:
-            body = {"command": action}
-            if action == "toggle":
-                body = {"command": "pause", "action": "toggle"}
             request = post_uri(self.ip, endpoint="/api/job", json=body)
             if not request:
                 self.client.connected = False
         # TODO improve return value
         return bool(request is not None and request.status_code == 204)
+
+    def get_job_command(self, action):
+        if action not in ("cancel", "start", "toggle"):
+            raise PrinterDriverException("Action %s is not allowed" % (action,))
+        if action == "toggle":
+            return {"command": "pause", "action": "toggle"}
+        return {"command": action}
+
+
+# Coroutine based variant of the driver that does not block a whole worker
+# for every network round trip. Responses are evaluated by the same code
+class AsyncOctoprint(Octoprint):
+    # shared aiohttp.ClientSession, a new one is created for every request if not set
+    session = None
+
+    async def is_alive(self):
+        request = await async_get_uri(
+            self.ip, endpoint="/api/version", session=self.session
+        )
+        if request is None or request.status_code != 200:
+            self.client.connected = False
+        else:
+            if not self.client.connected:
+                await self.sniff()
+                self.client.connected = True
+        return self.client.connected
+
+    async def sniff(self):
+        request = await async_get_uri(
+            self.ip, endpoint="/api/version", session=self.session
+        )
+        settings_req = None
+        if request is not None and request.status_code == 403:
+            settings_req = await async_get_uri(
+                self.ip, endpoint="/api/settings", session=self.session
+            )
+        self.client = self.handle_sniff(request, settings_req)
+
+    async def get_connected(self, endpoint):
+        request = None
+        if self.client.connected:
+            request = await async_get_uri(
+                self.ip, endpoint=endpoint, session=self.session
+            )
+            if not request:
+                self.client.connected = False
+        return request
+
+    async def status(self):
+        return self.handle_status(
+            await self.get_connected("/api/printer?exclude=history")
+        )
+
+    async def webcam(self):
+        return self.handle_webcam(await self.get_connected("/api/settings"))
+
+    async def job(self):
+        return self.handle_job(await self.get_connected("/api/job"))
+
+    async def upload_and_start_job(self, gcode_disk_path, path=None, filename=None):
+        request = None
+        if self.client.connected:
+            self.check_operational(await self.status())
+            # a large gcode on a slow disk would hold up every other printer,
+            # aiohttp reads the chunks of a file object in an executor as well
+            gcode = await run_blocking(open, gcode_disk_path, "rb")
+            try:
+                request = await async_post_uri(
+                    self.ip,
+                    endpoint="/api/files/local",
+                    files={"file": self.get_upload_file(gcode, filename)},
+                    data=self.get_upload_data(path),
+                    session=self.session,
+                )
+            finally:
+                await run_blocking(gcode.close)
+            if not request:
+                self.client.connected = False
+        return bool(request is not None and request.status_code == 201)
+
+    async def modify_current_job(self, action):
+        request = None
+        body = self.get_job_command(action)
+        if self.client.connected:
+            request = await async_post_uri(
+                self.ip, endpoint="/api/job", json=body, session=self.session
+            )
+            if not request:
+                self.client.connected = False
+        return bool(request is not None and request.status_code == 204)
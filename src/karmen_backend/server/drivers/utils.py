@@ -13,6 +13,15 @@ class PrinterDriver(abc.ABC):
     def client_name(self):
         pass
 
+    def client_info(self):
+        # the client as it is presented over the API
+        return {
+            "name": self.client_name(),
+            "version": self.client.version,
+            "connected": self.client.connected,
+            "readonly": self.client.read_only,
+        }
+
     @abc.abstractmethod
     def is_alive(self):
         pass
@@ -34,7 +43,7 @@ class PrinterDriver(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def upload_and_start_job(self, gcode_path):
+    def upload_and_start_job(self, gcode_path, path=None, filename=None):
         pass
 
 
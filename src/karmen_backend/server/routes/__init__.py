@@ -20,3 +20,4 @@ import server.routes.settings
 import server.routes.gcodes
 import server.routes.printjobs
 import server.routes.octoprintemulator
+import server.routes.metrics
@@ -4,8 +4,12 @@ import datetime
 from flask import jsonify, request, abort, send_file
 from flask_cors import cross_origin
 from server import app, __version__
-from server.database import gcodes, printjobs
+from server.database import gcodes, printjobs, make_cursor
 from server.services import files
+from server.tasks.process_gcode import process_gcode, get_initial_stages
+
+# in seconds
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
 
 
 def make_gcode_response(gcode, fields=None):
@@ -17,7 +21,19 @@ def make_gcode_response(gcode, fields=None):
         "absolute_path",
         "uploaded",
         "size",
+        "state",
+        "stages",
+        "filament_type",
+        "printer_model",
+        "bed_temperature",
+        "extruder_temperature",
+        "print_time",
+        "filament_length",
+        "filament_weight",
+        "layer_count",
+        "bounding_box",
         "data",
+        "thumbnail",
     ]
     fields = fields if fields else flist
     response = {}
@@ -26,6 +42,11 @@ def make_gcode_response(gcode, fields=None):
             if field == "data":
                 response["data"] = "/gcodes/%s/data" % (gcode["id"],)
                 continue
+            if field == "thumbnail":
+                # most gcodes have none, clients should not ask for them in vain
+                if gcode["thumbnail"]:
+                    response["thumbnail"] = "/gcodes/%s/thumbnail" % (gcode["id"],)
+                continue
             response[field] = gcode[field]
     if "uploaded" in response:
         response["uploaded"] = response["uploaded"].isoformat()
@@ -45,21 +66,17 @@ def gcodes_list():
             limit = 200
     except ValueError:
         limit = 200
+    # an opaque cursor, invalid ones are ignored by the database layer
+    start_with = request.args.get("start_with", None)
+    fields = [f for f in request.args.get("fields", "").split(",") if f]
+    filter_crit = request.args.get("filter", None)
     try:
-        start_with = (
-            int(request.args.get("start_with"))
-            if request.args.get("start_with")
-            else None
+        gcodes_record_set = gcodes.get_gcodes(
+            order_by=order_by, limit=limit, start_with=start_with, filter=filter_crit
         )
-        if start_with and start_with <= 0:
-            start_with = None
     except ValueError:
-        start_with = None
-    fields = [f for f in request.args.get("fields", "").split(",") if f]
-    filter_crit = request.args.get("filter", None)
-    gcodes_record_set = gcodes.get_gcodes(
-        order_by=order_by, limit=limit, start_with=start_with, filter=filter_crit
-    )
+        # not a sortable column
+        return abort(400)
     response = {"items": gcode_list}
     next_record = None
     if len(gcodes_record_set) > int(limit):
@@ -77,7 +94,7 @@ def gcodes_list():
     if filter_crit:
         parts.append("filter=%s" % filter_crit)
     if next_record:
-        parts.append("start_with=%s" % next_record["id"])
+        parts.append("start_with=%s" % make_cursor(next_record, order_by))
         response["next"] = (
             "%s?%s" % (next_href, "&".join(parts)) if parts else next_href
         )
@@ -108,27 +125,23 @@ def gcode_create():
 
     try:
         saved = files.save(incoming, request.form.get("path", "/"))
-        gcode_id = gcodes.add_gcode(
-            path=saved["path"],
-            filename=saved["filename"],
-            display=saved["display"],
-            absolute_path=saved["absolute_path"],
-            size=saved["size"],
-        )
+        saved.update(state="processing", stages=get_initial_stages())
+        with files.blob_lock(saved["hash"]):
+            gcode_id = gcodes.add_gcode(**saved)
+            files.restore(incoming, saved)
     except (IOError, OSError) as e:
         return abort(e, 500)
+    # the rest is derived from the file in the background
+    process_gcode(gcode_id)
     return (
         jsonify(
             make_gcode_response(
-                {
-                    "id": gcode_id,
-                    "path": saved["path"],
-                    "filename": saved["filename"],
-                    "display": saved["display"],
-                    "absolute_path": saved["absolute_path"],
-                    "uploaded": datetime.datetime.now(),
-                    "size": saved["size"],
-                }
+                dict(
+                    {column: None for column in gcodes.DERIVED_COLUMNS},
+                    id=gcode_id,
+                    uploaded=datetime.datetime.now(),
+                    **saved
+                )
             )
         ),
         201,
@@ -151,25 +164,47 @@ def gcode_file(id):
         return abort(404)
 
 
+@app.route("/gcodes/<id>/thumbnail", methods=["GET", "OPTIONS"])
+@cross_origin()
+def gcode_thumbnail(id):
+    gcode = gcodes.get_gcode(id)
+    if gcode is None or not gcode["thumbnail"]:
+        return abort(404)
+    try:
+        response = send_file(
+            files.get_thumbnail_path(gcode["absolute_path"]),
+            mimetype="image/png",
+            cache_timeout=THUMBNAIL_MAX_AGE,
+        )
+    except FileNotFoundError:
+        return abort(404)
+    # the file of a gcode never changes, neither does its thumbnail
+    response.cache_control.public = True
+    response.set_etag(gcode["thumbnail"])
+    return response.make_conditional(request)
+
+
 @app.route("/gcodes/<id>", methods=["DELETE", "OPTIONS"])
 @cross_origin()
 def gcode_delete(id):
     gcode = gcodes.get_gcode(id)
     if gcode is None:
         return abort(404)
-    try:
-        files.remove(gcode["absolute_path"])
-    except IOError:
-        pass
-    finally:
-        gcodes.delete_gcode(id)
-        printjobs.update_gcode_data(
-            gcode["id"],
-            {
-                "id": gcode["id"],
-                "filename": gcode["filename"],
-                "size": gcode["size"],
-                "available": False,
-            },
-        )
+    with files.blob_lock(gcode["hash"]):
+        unreferenced = gcodes.delete_gcode(id)
+        # the content might be shared with other gcodes
+        if unreferenced:
+            try:
+                files.remove(unreferenced)
+            except IOError:
+                pass
+    printjobs.update_gcode_data(
+        gcode["id"],
+        {
+            "id": gcode["id"],
+            "filename": gcode["filename"],
+            "size": gcode["size"],
+            "available": False,
+        },
+    )
     return "", 204
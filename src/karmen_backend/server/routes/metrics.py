@@ -0,0 +1,35 @@
+from flask import jsonify, g, abort
+from flask_cors import cross_origin
+from server import app
+from server.database import POOL, instrumentation
+from server.services import network
+
+
+@app.after_request
+def add_server_timing(response):
+    if app.debug and g.get("query_count"):
+        response.headers.add(
+            "Server-Timing",
+            'db;dur=%.3f;desc="%s queries"' % (g.query_ms, g.query_count),
+        )
+    return response
+
+
+@app.route("/metrics", methods=["GET", "OPTIONS"])
+@cross_origin()
+def metrics():
+    instrumentation.flush(force=True)
+    try:
+        queries = instrumentation.load_stats()
+    except Exception as e:
+        app.logger.error("Cannot load query statistics from cache: %s", e)
+        return abort(503)
+    return jsonify(
+        {
+            "queries": queries,
+            # the pools belong to the process that served this request
+            "pool": POOL.get_stats(),
+            # keep-alive connections to the printers, new vs. reused
+            "printer_connections": network.get_pool_stats(),
+        }
+    )
@@ -6,6 +6,7 @@ from flask_cors import cross_origin
 from server import app, __version__
 from server.database import gcodes
 from server.services import files
+from server.tasks.process_gcode import process_gcode, get_initial_stages
 
 
 @app.route("/octoprint-emulator/api/version", methods=["GET", "OPTIONS"])
@@ -30,15 +31,14 @@ def upload():
 
     try:
         saved = files.save(incoming, request.form.get("path", "/"))
-        gcodes.add_gcode(
-            path=saved["path"],
-            filename=saved["filename"],
-            display=saved["display"],
-            absolute_path=saved["absolute_path"],
-            size=saved["size"],
-        )
+        saved.update(state="processing", stages=get_initial_stages())
+        with files.blob_lock(saved["hash"]):
+            gcode_id = gcodes.add_gcode(**saved)
+            files.restore(incoming, saved)
     except (IOError, OSError) as e:
         return abort(e, 500)
+    # the slicers wait for the response, the rest is done in the background
+    process_gcode(gcode_id)
 
     return (
         jsonify(
@@ -1,4 +1,7 @@
 import re
+import json
+from time import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import requests
 from flask import jsonify, request, abort, Response, stream_with_context
@@ -8,30 +11,83 @@ from server.database import printers
 from server.database import network_devices
 from server.database import printjobs
 from server import drivers
-from server.services import network
+from server.services import network, printerstate, circuitbreaker, webcam
 
+# Shared by all requests handled by this worker process, so the number of threads
+# talking to the printers stays bounded no matter how many listings run at once
+FANOUT_EXECUTOR = ThreadPoolExecutor(
+    max_workers=app.config.get("NETWORK_FANOUT_WORKERS", 16)
+)
 
-def make_printer_response(printer, fields):
+
+def make_printer_response(printer, fields, max_age=None):
     printer_inst = drivers.get_printer_instance(printer)
     data = {
-        "client": {
-            "name": printer_inst.client_name(),
-            "version": printer_inst.client.version,
-            "connected": printer_inst.client.connected,
-            "readonly": printer_inst.client.read_only,
-        },
+        "client": printer_inst.client_info(),
         "name": printer_inst.name,
         "hostname": printer_inst.hostname,
         "ip": printer_inst.ip,
+        "circuit_breaker": circuitbreaker.get_state(printer_inst.ip),
     }
+    requested = [f for f in printerstate.FIELDS if f in fields]
+    if requested:
+        # Answer from the snapshot kept by check_printers, probe the printer only
+        # for parts that are missing or older than max_age seconds
+        snapshot = printerstate.load(printer_inst.ip)
+        refreshed = {}
+        now = time()
+        for field in requested:
+            cached = snapshot.get(field)
+            if cached and (max_age is None or now - cached["updated"] <= max_age):
+                data[field] = cached["value"]
+            else:
+                data[field] = refreshed[field] = getattr(printer_inst, field)()
+        if refreshed:
+            printerstate.save(printer_inst.ip, **refreshed)
+    return add_proxied_webcam(printer_inst.ip, data)
+
+
+def make_printer_snapshot_response(printer):
+    # never talks to the printer, everything comes from the snapshot
+    data = make_printer_response(printer, [])
+    # a printer added since the last check, or after redis lost its data, has no
+    # snapshot yet, the clients expect all the fields anyway
+    data.update(
+        {
+            "status": {"state": "Unknown", "temperature": {}},
+            "webcam": {"message": "Stream not accessible"},
+            "job": {},
+        }
+    )
+    for field, cached in printerstate.load(printer["ip"]).items():
+        if field in printerstate.FIELDS:
+            data[field] = cached["value"]
+    return add_proxied_webcam(printer["ip"], data)
+
+
+def add_proxied_webcam(ip, data):
+    if "webcam" in data and "stream" in data["webcam"]:
+        data["webcam"]["proxied"] = "/proxied-webcam/%s" % (ip,)
+    return data
+
+
+def get_max_age():
+    try:
+        max_age = float(request.args.get("max_age"))
+        return max_age if max_age >= 0 else None
+    except (TypeError, ValueError):
+        return None
+
+
+def make_printer_timeout_response(printer, fields):
+    data = make_printer_response(printer, [])
+    data["timed_out"] = True
     if "status" in fields:
-        data["status"] = printer_inst.status()
+        data["status"] = {"state": "Printer did not respond in time", "temperature": {}}
     if "webcam" in fields:
-        data["webcam"] = printer_inst.webcam()
-        if "stream" in data["webcam"]:
-            data["webcam"]["proxied"] = "/proxied-webcam/%s" % (printer_inst.ip,)
+        data["webcam"] = {"message": "Stream not accessible"}
     if "job" in fields:
-        data["job"] = printer_inst.job()
+        data["job"] = {}
     return data
 
 
@@ -40,12 +96,73 @@ def make_printer_response(printer, fields):
 def printers_list():
     device_list = []
     fields = [f for f in request.args.get("fields", "").split(",") if f]
-    for printer in printers.get_printers():
-        # TODO this should somehow go in parallel
-        device_list.append(make_printer_response(printer, fields))
+    max_age = get_max_age()
+    printer_list = printers.get_printers()
+    futures = [
+        FANOUT_EXECUTOR.submit(make_printer_response, printer, fields, max_age)
+        for printer in printer_list
+    ]
+    # One deadline for the whole listing, slow printers cannot stall the others
+    wait(futures, timeout=app.config.get("NETWORK_FANOUT_DEADLINE", 15))
+    for printer, future in zip(printer_list, futures):
+        if future.done():
+            # a broken printer cannot fail the whole listing either
+            try:
+                device_list.append(future.result())
+            except Exception as e:
+                app.logger.error("Cannot get printer %s: %s", printer["ip"], e)
+                device_list.append(make_printer_timeout_response(printer, fields))
+        else:
+            future.cancel()
+            device_list.append(make_printer_timeout_response(printer, fields))
     return jsonify({"items": device_list})
 
 
+def format_event(event, data):
+    return "event: %s\ndata: %s\n\n" % (event, json.dumps(data))
+
+
+@app.route("/printers/events", methods=["GET", "OPTIONS"])
+@cross_origin()
+def printers_events():
+    # Subscribe before taking the snapshot so no change can fall in between
+    pubsub = printerstate.subscribe()
+    if pubsub is None:
+        return abort(503)
+    items = [make_printer_snapshot_response(p) for p in printers.get_printers()]
+    keepalive = app.config.get("EVENTS_KEEPALIVE", 15)
+
+    def generate():
+        try:
+            yield format_event("snapshot", {"items": items})
+            while True:
+                event = printerstate.get_event(pubsub, keepalive)
+                if event is None:
+                    # a comment line, keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                elif event.get("deleted"):
+                    yield format_event("delete", {"ip": event["ip"]})
+                else:
+                    yield format_event(
+                        "change",
+                        {
+                            "ip": event["ip"],
+                            "fields": add_proxied_webcam(event["ip"], event["fields"]),
+                        },
+                    )
+        except Exception as e:
+            # the client reconnects on its own and gets a fresh snapshot
+            app.logger.error("Printer state events stream interrupted: %s", e)
+        finally:
+            pubsub.close()
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/printers", methods=["POST", "OPTIONS"])
 @cross_origin()
 def printer_create():
@@ -94,7 +211,7 @@ def printer_detail(ip):
     printer = printers.get_printer(ip)
     if printer is None:
         return abort(404)
-    return jsonify(make_printer_response(printer, fields))
+    return jsonify(make_printer_response(printer, fields, get_max_age()))
 
 
 @app.route("/printers/<ip>", methods=["DELETE", "OPTIONS"])
@@ -104,6 +221,7 @@ def printer_delete(ip):
     if printer is None:
         return abort(404)
     printers.delete_printer(ip)
+    printerstate.delete(ip)
     for device in network_devices.get_network_devices(printer["ip"]):
         device["disabled"] = True
         network_devices.upsert_network_device(**device)
@@ -158,20 +276,54 @@ def printer_modify_job(ip):
         return abort(400, e)
 
 
+@app.route("/printers/<ip>/webcam/snapshot", methods=["GET", "OPTIONS"])
+@cross_origin()
+def printer_webcam_snapshot(ip):
+    printer = printers.get_printer(ip)
+    if printer is None:
+        return abort(404)
+    width = request.args.get("w", None)
+    if width is not None:
+        try:
+            width = int(width)
+        except ValueError:
+            return abort(400)
+        if width not in app.config.get("WEBCAM_SNAPSHOT_WIDTHS", []):
+            return abort(400)
+    cached = printerstate.load(ip).get("webcam")
+    if cached:
+        stream = cached["value"].get("stream")
+    else:
+        stream = drivers.get_printer_instance(printer).webcam().get("stream")
+    if not stream:
+        return abort(404)
+    snapshot = webcam.get_snapshot(ip, stream, width)
+    if snapshot is None:
+        return abort(404)
+    return Response(
+        snapshot,
+        mimetype="image/jpeg",
+        headers={
+            "Cache-Control": "max-age=%s"
+            % (app.config.get("WEBCAM_SNAPSHOT_MAX_AGE", 5),)
+        },
+    )
+
+
 @app.route("/proxied-webcam/<ip>", methods=["GET", "OPTIONS"])
 @cross_origin()
 def printer_webcam(ip):
-    # This is very inefficient and should not be used in production. Use the nginx
-    # redis based proxy pass instead
+    # This is very inefficient and should not be used in production, every viewer
+    # opens its own connection to the printer. Use the webcam-relay service instead
     # TODO maybe we can drop this in the dev env as well
     printer = printers.get_printer(ip)
     if printer is None:
         return abort(404)
     printer_inst = drivers.get_printer_instance(printer)
-    webcam = printer_inst.webcam()
-    if "stream" not in webcam:
+    webcam_settings = printer_inst.webcam()
+    if "stream" not in webcam_settings:
         return abort(404)
-    req = requests.get(webcam["stream"], stream=True)
+    req = requests.get(webcam_settings["stream"], stream=True)
     return Response(
         stream_with_context(req.iter_content()),
         content_type=req.headers["content-type"],
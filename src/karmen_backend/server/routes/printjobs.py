@@ -1,14 +1,20 @@
-from flask import jsonify, request, abort
+import io
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+
+from flask import jsonify, request, abort, Response
 from flask_cors import cross_origin
 from server import app, drivers
-from server.database import printjobs, printers, gcodes
+from server.database import printjobs, printers, gcodes, make_cursor
+
+PRINTJOB_FIELDS = ["id", "started", "gcode_data", "printer_data"]
 
 
 def make_printjob_response(printjob, fields=None):
-    flist = ["id", "started", "gcode_data", "printer_data"]
-    fields = fields if fields else flist
+    fields = fields if fields else PRINTJOB_FIELDS
     response = {}
-    for field in flist:
+    for field in PRINTJOB_FIELDS:
         if field in fields:
             response[field] = printjob[field]
     if "started" in response:
@@ -35,7 +41,7 @@ def printjob_create():
     try:
         printer_inst = drivers.get_printer_instance(printer)
         uploaded = printer_inst.upload_and_start_job(
-            gcode["absolute_path"], gcode["path"]
+            gcode["absolute_path"], gcode["path"], gcode["filename"]
         )
         if not uploaded:
             return abort(500, "Cannot upload the g-code to the printer")
@@ -74,21 +80,17 @@ def printjobs_list():
             limit = 200
     except ValueError:
         limit = 200
+    # an opaque cursor, invalid ones are ignored by the database layer
+    start_with = request.args.get("start_with", None)
+    fields = [f for f in request.args.get("fields", "").split(",") if f]
+    filter_crit = request.args.get("filter", None)
     try:
-        start_with = (
-            int(request.args.get("start_with"))
-            if request.args.get("start_with")
-            else None
+        printjobs_record_set = printjobs.get_printjobs(
+            order_by=order_by, limit=limit, start_with=start_with, filter=filter_crit
         )
-        if start_with and start_with <= 0:
-            start_with = None
     except ValueError:
-        start_with = None
-    fields = [f for f in request.args.get("fields", "").split(",") if f]
-    filter_crit = request.args.get("filter", None)
-    printjobs_record_set = printjobs.get_printjobs(
-        order_by=order_by, limit=limit, start_with=start_with, filter=filter_crit
-    )
+        # not a sortable column
+        return abort(400)
     response = {"items": printjob_list}
     next_record = None
     if len(printjobs_record_set) > int(limit):
@@ -106,7 +108,7 @@ def printjobs_list():
     if filter_crit:
         parts.append("filter=%s" % filter_crit)
     if next_record:
-        parts.append("start_with=%s" % next_record["id"])
+        parts.append("start_with=%s" % make_cursor(next_record, order_by))
         response["next"] = (
             "%s?%s" % (next_href, "&".join(parts)) if parts else next_href
         )
@@ -114,6 +116,135 @@ def printjobs_list():
     return jsonify(response)
 
 
+def make_export_chunk(rows, export_format, fields):
+    if export_format == "ndjson":
+        return "".join(
+            "%s\n" % json.dumps(make_printjob_response(row, fields)) for row in rows
+        )
+    output = io.StringIO()
+    writer = csv.writer(output)
+    for row in rows:
+        response = make_printjob_response(row, fields)
+        writer.writerow(
+            [
+                json.dumps(value) if isinstance(value, (dict, list)) else value
+                for value in response.values()
+            ]
+        )
+    return output.getvalue()
+
+
+@app.route("/printjobs/export", methods=["GET", "OPTIONS"])
+@cross_origin()
+def printjobs_export():
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ["ndjson", "csv"]:
+        return abort(400)
+    order_by = request.args.get("order_by", "")
+    if "," in order_by:
+        return abort(400)
+    if order_by in ["gcode_data", "printer_data"]:
+        order_by = ""
+    requested = request.args.get("fields", "").split(",")
+    # in the order of the csv columns
+    fields = [f for f in PRINTJOB_FIELDS if f in requested] or PRINTJOB_FIELDS
+    batch_size = app.config.get("EXPORT_BATCH_SIZE", 1000)
+    try:
+        rows = printjobs.iterate_printjobs(
+            order_by=order_by,
+            filter=request.args.get("filter", None),
+            batch_size=batch_size,
+        )
+    except ValueError:
+        # not a sortable column
+        return abort(400)
+
+    def generate():
+        if export_format == "csv":
+            header = io.StringIO()
+            csv.writer(header).writerow(fields)
+            yield header.getvalue()
+        batch = []
+        try:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    yield make_export_chunk(batch, export_format, fields)
+                    batch = []
+            if batch:
+                yield make_export_chunk(batch, export_format, fields)
+        finally:
+            # gives the database connection back when the client goes away
+            rows.close()
+
+    return Response(
+        generate(),
+        mimetype="application/x-ndjson" if export_format == "ndjson" else "text/csv",
+        headers={
+            "Content-Disposition": "attachment; filename=printjobs.%s" % export_format
+        },
+    )
+
+
+@app.route("/printjobs/stats", methods=["GET", "OPTIONS"])
+@cross_origin()
+def printjobs_stats():
+    try:
+        days = int(request.args.get("days", 30))
+        if days < 1 or days > 366:
+            days = 30
+    except ValueError:
+        days = 30
+    try:
+        limit = int(request.args.get("gcodes", 10))
+        if limit < 1 or limit > 100:
+            limit = 10
+    except ValueError:
+        limit = 10
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    per_day = {}
+    for row in printjobs.get_daily_stats(since):
+        per_day.setdefault(row["printer_ip"], []).append(
+            {"day": row["day"].isoformat(), "jobs": row["jobs"]}
+        )
+    total = sum(day["jobs"] for history in per_day.values() for day in history)
+    printer_list = []
+    for row in printjobs.get_printer_stats():
+        history = per_day.get(row["printer_ip"], [])
+        jobs = sum(day["jobs"] for day in history)
+        printer_list.append(
+            {
+                "printer_ip": row["printer_ip"],
+                "jobs_total": row["jobs"],
+                "last_started": (
+                    row["last_started"].isoformat() if row["last_started"] else None
+                ),
+                "jobs": jobs,
+                "jobs_per_day": history,
+                # share of the days in the period with at least one started job
+                "utilisation": round(len(history) / days, 4),
+                # share of all jobs started in the period
+                "jobs_ratio": round(jobs / total, 4) if total else 0,
+            }
+        )
+    return jsonify(
+        {
+            "since": since.isoformat(),
+            "days": days,
+            "jobs": total,
+            "printers": printer_list,
+            "gcodes": [
+                {
+                    "gcode_id": row["gcode_id"],
+                    "filename": row["filename"],
+                    "jobs": row["jobs"],
+                }
+                for row in printjobs.get_gcode_stats(limit)
+            ],
+        }
+    )
+
+
 @app.route("/printjobs/<id>", methods=["GET", "OPTIONS"])
 @cross_origin()
 def printjob_detail(id):
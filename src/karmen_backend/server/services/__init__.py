@@ -1,2 +1,8 @@
 import server.services.network
 import server.services.files
+import server.services.cache
+import server.services.printerstate
+import server.services.circuitbreaker
+import server.services.pollschedule
+import server.services.locks
+import server.services.webcam
@@ -0,0 +1,8 @@
+import redis
+
+from server import app
+
+redis = redis.Redis(
+    host=app.config["WEBCAM_PROXY_CACHE_HOST"],
+    port=app.config["WEBCAM_PROXY_CACHE_PORT"],
+)
@@ -0,0 +1,77 @@
+from time import time
+
+from server import app
+from server.services.cache import redis
+
+# Shared by all uwsgi and celery processes through redis. After NETWORK_BREAKER_THRESHOLD
+# consecutive failures the calls to a printer fail fast. Once the backoff passes, a single
+# half-open probe is let through, every further failure doubles the backoff.
+
+
+def get_key(ip):
+    return "circuit_breaker_%s" % (ip,)
+
+
+def get_backoff(failures):
+    threshold = app.config.get("NETWORK_BREAKER_THRESHOLD", 3)
+    backoff = app.config.get("NETWORK_BREAKER_BACKOFF", 10) * 2 ** max(
+        failures - threshold, 0
+    )
+    return min(backoff, app.config.get("NETWORK_BREAKER_MAX_BACKOFF", 600))
+
+
+def get_state(ip):
+    try:
+        data = redis.hgetall(get_key(ip))
+    except Exception as e:
+        app.logger.error("Cannot load circuit breaker state from cache: %s", e)
+        data = {}
+    failures = int(data.get(b"failures", 0))
+    retry_at = float(data[b"retry_at"]) if b"retry_at" in data else None
+    if retry_at is None:
+        state = "closed"
+    elif retry_at > time():
+        state = "open"
+    else:
+        state = "half-open"
+    return {"state": state, "failures": failures, "retry_at": retry_at}
+
+
+def allow(ip):
+    state = get_state(ip)
+    if state["state"] == "closed":
+        return True
+    if state["state"] == "open":
+        return False
+    # only one of the processes gets to probe the printer
+    try:
+        return bool(
+            redis.set(
+                "%s_probe" % get_key(ip),
+                1,
+                nx=True,
+                ex=int(app.config.get("NETWORK_TIMEOUT", 10)) + 1,
+            )
+        )
+    except Exception as e:
+        app.logger.error("Cannot save circuit breaker probe into cache: %s", e)
+        return True
+
+
+def record_success(ip):
+    try:
+        redis.delete(get_key(ip), "%s_probe" % get_key(ip))
+    except Exception as e:
+        app.logger.error("Cannot reset circuit breaker state in cache: %s", e)
+
+
+def record_failure(ip):
+    try:
+        failures = redis.hincrby(get_key(ip), "failures", 1)
+        if failures >= app.config.get("NETWORK_BREAKER_THRESHOLD", 3):
+            pipe = redis.pipeline()
+            pipe.hset(get_key(ip), "retry_at", time() + get_backoff(failures))
+            pipe.delete("%s_probe" % get_key(ip))
+            pipe.execute()
+    except Exception as e:
+        app.logger.error("Cannot save circuit breaker state into cache: %s", e)
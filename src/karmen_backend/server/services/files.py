@@ -1,41 +1,159 @@
 import os
-import re
-from time import time
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from time import time, sleep
+from flask import Request
 from werkzeug.utils import secure_filename
 
 from server import app
+from server.services import locks
+
+# seconds, registering or removing a blob takes a couple of queries
+BLOB_LOCK_TTL = 30
+
+
+def get_blob_dir():
+    return os.path.join(app.config["UPLOAD_FOLDER"], "blobs")
+
+
+def get_blob_path(hash):
+    return os.path.join(get_blob_dir(), hash[0:2], hash)
+
+
+# Uploads are written straight into the blob storage and hashed on the way, the
+# content is neither read nor copied again once it is known
+class HashingStream:
+    def __init__(self):
+        os.makedirs(get_blob_dir(), exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(
+            dir=get_blob_dir(), prefix=".upload-", delete=False
+        )
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def store(self):
+        self.file.flush()
+        hash = self.digest.hexdigest()
+        destination = get_blob_path(hash)
+        # known content is not kept twice, the upload itself stays around until
+        # close() so the blob can be put back, see restore()
+        if not os.path.exists(destination):
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            try:
+                os.link(self.file.name, destination)
+            except FileExistsError:
+                pass
+        return hash, destination
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.file.name)
+        except FileNotFoundError:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+# Only the gcode uploads go to the blob storage, other multipart requests are
+# left to werkzeug
+HASHED_ENDPOINTS = ("gcode_create", "upload")
+
+
+class UploadRequest(Request):
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        if self.endpoint in HASHED_ENDPOINTS:
+            return HashingStream()
+        return super()._get_file_stream(
+            total_content_length, content_type, filename, content_length
+        )
+
+
+# Held while a gcode referencing the blob is added or while the last one is
+# deleted together with the file, so the two never interleave
+@contextmanager
+def blob_lock(hash):
+    if hash is None:
+        yield
+        return
+    name = "gcode_blob_%s" % (hash,)
+    deadline = time() + BLOB_LOCK_TTL
+    token = locks.acquire(name, BLOB_LOCK_TTL)
+    while token is None and time() < deadline:
+        sleep(0.05)
+        token = locks.acquire(name, BLOB_LOCK_TTL)
+    try:
+        yield
+    finally:
+        if token is not None:
+            locks.release(name, token)
 
 
 def save(incoming, path):
     original_filename = incoming.filename
     filename = secure_filename(original_filename)
-    destination_dir = os.path.join(app.config["UPLOAD_FOLDER"], path)
-    destination = os.path.join(destination_dir, filename)
-
-    # fix potentially non-existent paths
-    os.makedirs(destination_dir, exist_ok=True)
-    # name duplicities
-    if os.path.exists(destination):
-        original_filename = re.sub(
-            r"(\..+)", r"-" + re.escape(repr(round(time()))) + r"\1", incoming.filename
-        )
-        filename = secure_filename(original_filename)
-        destination = os.path.join(destination_dir, filename)
-    # TODO detect more parameters
-    # ; filament_type = PLA
-    # M140 S60 ; set bed temp
-    # M104 S215 ; set extruder temp
-    # ; printer_model = MK3
-    incoming.save(destination)
-    size = os.stat(destination).st_size
-    return {
-        "path": path,
-        "filename": filename,
-        "display": original_filename,
-        "absolute_path": destination,
-        "size": size,
-    }
+    stream = incoming.stream
+    if not isinstance(stream, HashingStream):
+        stream = HashingStream()
+        try:
+            shutil.copyfileobj(incoming.stream, stream)
+        except Exception:
+            stream.close()
+            raise
+        # closed along with the upload, restore() might still need it
+        incoming.stream = stream
+    hash, destination = stream.store()
+    return dict(
+        path=path,
+        filename=filename,
+        display=original_filename,
+        absolute_path=destination,
+        size=stream.size,
+        hash=hash,
+    )
+
+
+# A delete of the same content running between save() and the insert of the
+# gcode might have removed the blob, it is put back from the upload. Call it with
+# the blob lock held, once the gcode is inserted
+def restore(incoming, saved):
+    stream = incoming.stream
+    if not isinstance(stream, HashingStream):
+        return
+    destination = get_blob_path(stream.digest.hexdigest())
+    if destination == saved["absolute_path"] and not os.path.exists(destination):
+        stream.store()
+
+
+# Shared by all gcodes with the same content, just like the file itself
+def get_thumbnail_path(absolute_path):
+    return "%s.thumbnail.png" % (absolute_path,)
+
+
+def save_thumbnail(absolute_path, image):
+    destination = get_thumbnail_path(absolute_path)
+    # written aside first, a request for the thumbnail never gets half of it
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(destination), prefix=".thumbnail-", delete=False
+    ) as thumbnail:
+        thumbnail.write(image)
+    os.replace(thumbnail.name, destination)
+    return destination
 
 
 def remove(absolute_path):
     os.remove(absolute_path)
+    try:
+        os.remove(get_thumbnail_path(absolute_path))
+    except FileNotFoundError:
+        pass
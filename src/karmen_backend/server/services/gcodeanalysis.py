@@ -0,0 +1,250 @@
+import numpy as np
+
+# The file is read in chunks of this many bytes, the memory needed does not grow with the file
+CHUNK_SIZE = 8 * 1024 * 1024
+
+X, Y, Z, E, F = range(5)
+AXES = b"XYZEF"
+# numbers are read from a window of this many bytes after the axis letter
+NUMBER_WIDTH = 12
+
+# commands as tokenized, anything else is skipped
+OTHER, MOVE, SET, ABSOLUTE, RELATIVE, ABSOLUTE_E, RELATIVE_E = range(7)
+MODES = [ABSOLUTE, RELATIVE, ABSOLUTE_E, RELATIVE_E]
+
+DELIMITER = np.zeros(256, dtype=bool)
+DELIMITER[list(b" \t\r\n;")] = True
+NUMERIC = np.zeros(256, dtype=bool)
+NUMERIC[list(b"0123456789.-+")] = True
+
+# g/cm3 by filament_type, see server/services/gcodemeta.py
+DENSITIES = {
+    "PLA": 1.24,
+    "PETG": 1.27,
+    "ABS": 1.04,
+    "ASA": 1.07,
+    "PC": 1.20,
+    "NYLON": 1.14,
+    "PA": 1.14,
+    "TPU": 1.21,
+    "FLEX": 1.21,
+    "HIPS": 1.04,
+    "PVA": 1.19,
+}
+DEFAULT_DENSITY = 1.24
+# mm/min, until the first F parameter shows up
+DEFAULT_FEEDRATE = 1500
+
+
+def get_density(filament_type):
+    return DENSITIES.get((filament_type or "").upper(), DEFAULT_DENSITY)
+
+
+def to_floats(raw):
+    raw = np.where(raw == b"", b"nan", raw)
+    try:
+        return raw.astype(np.float64)
+    except ValueError:
+        # a malformed number somewhere, only then go value by value
+        return np.vectorize(to_float, otypes=[np.float64])(raw)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def get_commands(data, starts):
+    first, second, third, fourth = [data[starts + i] for i in range(4)]
+    commands = np.full(starts.size, OTHER, dtype=np.int8)
+    g = first == ord("G")
+    commands[g & ((second == ord("0")) | (second == ord("1"))) & DELIMITER[third]] = (
+        MOVE
+    )
+    nine = g & (second == ord("9")) & DELIMITER[fourth]
+    commands[nine & (third == ord("2"))] = SET
+    commands[nine & (third == ord("0"))] = ABSOLUTE
+    commands[nine & (third == ord("1"))] = RELATIVE
+    eight = (first == ord("M")) & (second == ord("8")) & DELIMITER[fourth]
+    commands[eight & (third == ord("2"))] = ABSOLUTE_E
+    commands[eight & (third == ord("3"))] = RELATIVE_E
+    return commands
+
+
+def tokenize(chunk):
+    # -> commands (n,) and their parameters (n, 5), missing parameters are nan.
+    # Works on the raw bytes, the chunk has to end with a newline
+    size = len(chunk)
+    data = np.frombuffer(chunk + b" " * (NUMBER_WIDTH + 4), dtype=np.uint8)
+    ends = np.flatnonzero(data[:size] == ord("\n"))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    commands = get_commands(data, starts)
+    lines = np.flatnonzero(commands != OTHER)
+    rows = np.full(starts.size, -1)
+    rows[lines] = np.arange(lines.size)
+    # where the comment starts on each line, if there is one
+    comments = ends.copy()
+    semicolons = np.flatnonzero(data[:size] == ord(";"))
+    if semicolons.size:
+        np.minimum.at(
+            comments, np.searchsorted(starts, semicolons, "right") - 1, semicolons
+        )
+    params = np.full((lines.size, 5), np.nan)
+    window = np.arange(1, NUMBER_WIDTH + 1)
+    for axis, letter in enumerate(AXES):
+        found = np.flatnonzero(data[:size] == letter)
+        line = np.searchsorted(starts, found, "right") - 1
+        keep = (rows[line] >= 0) & (found < comments[line])
+        found, line = found[keep], line[keep]
+        # the number goes on until the first byte that cannot be part of it
+        digits = data[found[:, None] + window]
+        length = np.argmin(NUMERIC[digits], axis=1)
+        digits[window[None, :] > length[:, None]] = 0
+        numbers = np.ascontiguousarray(digits).view("S%d" % NUMBER_WIDTH).ravel()
+        params[rows[line], axis] = to_floats(numbers)
+    return commands[lines], params
+
+
+def fill_forward(values, initial):
+    # nan takes the last known value, the very first ones take initial
+    values = np.concatenate(([initial], values))
+    known = np.where(np.isnan(values), 0, np.arange(values.size))
+    return values[np.maximum.accumulate(known)][1:]
+
+
+def get_move_times(lengths, directions, speeds, acceleration):
+    # Trapezoidal speed profiles. The speed at each junction is the lower of the
+    # two feedrates scaled by how straight the toolpath continues, then each move
+    # accelerates from its entry speed, cruises and decelerates to its exit speed
+    if lengths.size == 0:
+        return lengths
+    cosines = np.clip(np.sum(directions[:-1] * directions[1:], axis=1), 0, 1)
+    junctions = np.minimum(speeds[:-1], speeds[1:]) * cosines
+    entry = np.concatenate(([0.0], junctions))
+    exit = np.concatenate((junctions, [0.0]))
+    accelerating = (speeds**2 - entry**2) / (2 * acceleration)
+    decelerating = (speeds**2 - exit**2) / (2 * acceleration)
+    cruising = lengths - accelerating - decelerating
+    # too short to reach the feedrate, the peak speed is where both ramps meet
+    peak = np.sqrt(np.maximum((2 * acceleration * lengths + entry**2 + exit**2) / 2, 0))
+    peak = np.maximum(peak, np.maximum(entry, exit))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trapezoid = (
+            (speeds - entry) / acceleration
+            + (speeds - exit) / acceleration
+            + cruising / speeds
+        )
+    triangle = (2 * peak - entry - exit) / acceleration
+    times = np.where(cruising >= 0, trapezoid, triangle)
+    return np.where(lengths > 0, times, 0)
+
+
+class Analysis:
+    def __init__(self, acceleration):
+        self.acceleration = acceleration
+        self.position = np.zeros(4)
+        self.feedrate = DEFAULT_FEEDRATE
+        self.relative = False
+        self.relative_e = False
+        self.time = 0.0
+        self.filament = 0.0
+        self.layers = np.empty(0)
+        self.minimum = np.full(3, np.inf)
+        self.maximum = np.full(3, -np.inf)
+
+    def feed(self, commands, params):
+        # the positioning modes switch only a few times per file, the rows
+        # between two switches are processed at once
+        modes = np.flatnonzero(np.isin(commands, MODES))
+        start = 0
+        for index in list(modes) + [commands.size]:
+            if index > start:
+                self.feed_moves(commands[start:index], params[start:index])
+            if index < commands.size:
+                command = commands[index]
+                if command in (ABSOLUTE, RELATIVE):
+                    self.relative = self.relative_e = command == RELATIVE
+                else:
+                    self.relative_e = command == RELATIVE_E
+            start = index + 1
+
+    def feed_moves(self, commands, params):
+        moving = commands == MOVE
+        positions = np.empty((commands.size, 4))
+        for axis in [X, Y, Z, E]:
+            values = params[:, axis]
+            relative = self.relative_e if axis == E else self.relative
+            if relative:
+                steps = np.where(moving & ~np.isnan(values), values, 0)
+                positions[:, axis] = self.position[axis] + np.cumsum(steps)
+            else:
+                # a G92 changes the coordinates the following moves are measured from
+                positions[:, axis] = fill_forward(values, self.position[axis])
+        deltas = positions - np.vstack((self.position, positions[:-1]))
+        feedrates = fill_forward(np.where(moving, params[:, F], np.nan), self.feedrate)
+        self.position = positions[-1]
+        self.feedrate = feedrates[-1]
+
+        deltas = deltas[moving]
+        ends = positions[moving]
+        starts = ends - deltas
+        distances = np.sqrt(np.sum(deltas[:, :3] ** 2, axis=1))
+        # a move of the extruder alone, e.g. a retraction
+        lengths = np.where(distances > 0, distances, np.abs(deltas[:, E]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            directions = np.where(
+                distances[:, None] > 0, deltas[:, :3] / distances[:, None], 0
+            )
+        speeds = np.maximum(feedrates[moving] / 60, 0.1)
+        self.time += float(
+            np.sum(get_move_times(lengths, directions, speeds, self.acceleration))
+        )
+        self.filament += float(np.sum(deltas[:, E]))
+
+        printing = (deltas[:, E] > 0) & (np.sum(deltas[:, :2] ** 2, axis=1) > 0)
+        if printing.any():
+            points = np.vstack((starts[printing, :3], ends[printing, :3]))
+            self.minimum = np.minimum(self.minimum, points.min(axis=0))
+            self.maximum = np.maximum(self.maximum, points.max(axis=0))
+            self.layers = np.union1d(self.layers, np.round(ends[printing, Z], 3))
+
+    def get_result(self, filament_diameter, filament_density):
+        length = max(self.filament, 0)
+        volume = length * np.pi * (filament_diameter / 2) ** 2 / 1000
+        bounding_box = None
+        if np.all(np.isfinite(self.minimum)):
+            bounding_box = {
+                "min": [round(float(v), 3) for v in self.minimum],
+                "max": [round(float(v), 3) for v in self.maximum],
+            }
+        return {
+            "print_time": int(round(self.time)),
+            "filament_length": round(length, 2),
+            "filament_weight": round(float(volume * filament_density), 2),
+            "layer_count": int(self.layers.size),
+            "bounding_box": bounding_box,
+        }
+
+
+def analyze(
+    path, filament_type=None, filament_diameter=1.75, acceleration=1000, chunk_size=None
+):
+    analysis = Analysis(acceleration)
+    chunk_size = chunk_size or CHUNK_SIZE
+    rest = b""
+    with open(path, "rb") as gcode:
+        while True:
+            data = gcode.read(chunk_size)
+            if not data:
+                break
+            data = rest + data
+            # the last line might continue in the next chunk
+            end = data.rfind(b"\n") + 1
+            rest = data[end:]
+            if end:
+                analysis.feed(*tokenize(data[:end]))
+    if rest:
+        analysis.feed(*tokenize(rest + b"\n"))
+    return analysis.get_result(filament_diameter, get_density(filament_type))
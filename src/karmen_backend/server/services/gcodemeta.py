@@ -0,0 +1,95 @@
+import mmap
+import re
+
+# The slicers write their settings and the start gcode at the very beginning and
+# a summary at the very end, only these are read, no matter how large the file is
+HEADER_SIZE = 512 * 1024
+FOOTER_SIZE = 128 * 1024
+
+# One pass over a region matches either a "; key = value" comment or a temperature command
+LINE = re.compile(
+    rb"^[ \t]*(?:"
+    rb";[ \t]*(?P<key>[A-Za-z_.]+)[ \t]*[=:][ \t]*(?P<value>[^\r\n]*?)"
+    rb"|(?P<command>M104|M109|M140|M190)(?:[ \t][^\r\n;]*?)?[ \t]S(?P<temperature>\d+(?:\.\d+)?)[^\r\n]*"
+    rb")[ \t]*\r?$",
+    re.MULTILINE,
+)
+
+# comment key (lowercase) -> field, PrusaSlicer and Slic3r style first, then Cura
+COMMENTS = {
+    b"filament_type": "filament_type",
+    b"printer_model": "printer_model",
+    b"target_machine.name": "printer_model",
+    # only used when there is no temperature command
+    b"bed_temperature": "bed_temperature",
+    b"temperature": "extruder_temperature",
+}
+
+COMMANDS = {
+    b"M104": "extruder_temperature",
+    b"M109": "extruder_temperature",
+    b"M140": "bed_temperature",
+    b"M190": "bed_temperature",
+}
+
+FIELDS = ["filament_type", "printer_model", "bed_temperature", "extruder_temperature"]
+
+
+def to_temperature(value):
+    try:
+        temperature = int(round(float(value)))
+    except ValueError:
+        return None
+    # the end gcode switches the heaters off
+    return temperature if temperature > 0 else None
+
+
+def to_text(value):
+    # multi extruder setups list one value per extruder
+    value = value.split(b";")[0].strip().decode("utf-8", "replace")
+    return value[0:255] if value else None
+
+
+def scan(data, start, end, commands, comments):
+    for match in LINE.finditer(data, start, end):
+        if match.group("command"):
+            field = COMMANDS[match.group("command")]
+            if commands.get(field) is None:
+                commands[field] = to_temperature(match.group("temperature"))
+        else:
+            field = COMMENTS.get(match.group("key").lower())
+            if field is not None and comments.get(field) is None:
+                if field in ("bed_temperature", "extruder_temperature"):
+                    comments[field] = to_temperature(match.group("value"))
+                else:
+                    comments[field] = to_text(match.group("value"))
+        if all(
+            commands.get(f) is not None or comments.get(f) is not None for f in FIELDS
+        ):
+            return
+
+
+def extract(path):
+    commands = {}
+    comments = {}
+    with open(path, "rb") as gcode:
+        try:
+            data = mmap.mmap(gcode.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return {field: None for field in FIELDS}
+        try:
+            size = len(data)
+            # regions end at a line boundary, a cut line could give a wrong value
+            header_end = size
+            if size > HEADER_SIZE:
+                header_end = data.rfind(b"\n", 0, HEADER_SIZE) + 1
+            scan(data, 0, header_end, commands, comments)
+            footer_start = max(header_end, size - FOOTER_SIZE)
+            if footer_start < size:
+                scan(data, footer_start, size, commands, comments)
+        finally:
+            data.close()
+    values = {field: comments.get(field) for field in FIELDS}
+    values.update((f, v) for f, v in commands.items() if v is not None)
+    return values
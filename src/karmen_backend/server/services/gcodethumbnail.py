@@ -0,0 +1,41 @@
+import re
+import base64
+import binascii
+
+# PrusaSlicer and the Cura thumbnail plugins put the images at the very beginning
+# of the file, nothing else is read
+HEADER_SIZE = 1024 * 1024
+
+# "; thumbnail begin 220x124 12345", base64 lines, "; thumbnail end". Newer slicers
+# write "thumbnail_JPG begin" or "thumbnail_QOI begin" for other formats, those are skipped
+THUMBNAIL = re.compile(
+    rb"^;[ \t]*thumbnail begin[ \t]+(?P<width>\d+)x(?P<height>\d+)[^\r\n]*\r?\n"
+    rb"(?P<data>(?:;[ \t]*[A-Za-z0-9+/=]*[ \t]*\r?\n)*?)"
+    rb";[ \t]*thumbnail end",
+    re.MULTILINE,
+)
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def decode(data):
+    try:
+        image = base64.b64decode(re.sub(rb"[;\s]", b"", data), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return image if image.startswith(PNG_SIGNATURE) else None
+
+
+# Returns the largest of the embedded PNG images, or None
+def extract(path):
+    with open(path, "rb") as gcode:
+        data = gcode.read(HEADER_SIZE)
+    largest = None
+    largest_size = 0
+    for match in THUMBNAIL.finditer(data):
+        size = int(match.group("width")) * int(match.group("height"))
+        if size <= largest_size:
+            continue
+        image = decode(match.group("data"))
+        if image is not None:
+            largest, largest_size = image, size
+    return largest
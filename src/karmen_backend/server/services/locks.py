@@ -0,0 +1,34 @@
+from uuid import uuid4
+
+from server import app
+from server.services.cache import redis
+
+# Deletes the lock only if it is still held by the same owner
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_key(name):
+    return "lock_%s" % (name,)
+
+
+def acquire(name, ttl):
+    token = uuid4().hex
+    try:
+        if redis.set(get_key(name), token, nx=True, ex=int(ttl)):
+            return token
+        return None
+    except Exception as e:
+        app.logger.error("Cannot acquire lock %s, proceeding without it: %s", name, e)
+        return token
+
+
+def release(name, token):
+    try:
+        redis.register_script(RELEASE_SCRIPT)(keys=[get_key(name)], args=[token])
+    except Exception as e:
+        app.logger.error("Cannot release lock %s: %s", name, e)
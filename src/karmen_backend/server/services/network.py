@@ -1,8 +1,26 @@
+import asyncio
+import functools
+import json as jsonlib
+import os
 import subprocess
 import re
+import threading
+from time import time
+
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 from server import app
+from server.services import circuitbreaker
+
+# One keep-alive session per printer host, so the repeated probes do not pay
+# for a new TCP handshake every time. Maps host -> (session, last used timestamp)
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+# Connection counters of sessions that were already closed
+CLOSED_SESSIONS_STATS = {"new": 0, "reused": 0}
 
 
 def do_arp_scan(network_interface):
@@ -40,6 +58,67 @@ def get_avahi_hostname(ip):
         return match[0][1]
 
 
+def make_session():
+    retries = Retry(
+        total=app.config.get("NETWORK_RETRIES", 0),
+        backoff_factor=app.config.get("NETWORK_RETRY_BACKOFF", 0.5),
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=app.config.get("NETWORK_POOL_SIZE", 2),
+        max_retries=retries,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session_stats(session):
+    stats = {"new": 0, "reused": 0}
+    # the same adapter is mounted for both http and https
+    for adapter in set(session.adapters.values()):
+        for key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            stats["new"] += pool.num_connections
+            stats["reused"] += max(pool.num_requests - pool.num_connections, 0)
+    return stats
+
+
+def close_session(host):
+    session, _ = SESSIONS.pop(host)
+    for key, value in get_session_stats(session).items():
+        CLOSED_SESSIONS_STATS[key] += value
+    session.close()
+
+
+def get_session(host):
+    idle_ttl = app.config.get("NETWORK_POOL_IDLE_TTL", 60)
+    now = time()
+    with SESSIONS_LOCK:
+        # the printers tend to drop idle keep-alive connections anyway
+        idle = [h for h, (_, used) in SESSIONS.items() if now - used > idle_ttl]
+        for idle_host in idle:
+            close_session(idle_host)
+        if host not in SESSIONS:
+            SESSIONS[host] = (make_session(), now)
+        session, _ = SESSIONS[host]
+        SESSIONS[host] = (session, now)
+        return session
+
+
+def get_pool_stats():
+    with SESSIONS_LOCK:
+        stats = dict(CLOSED_SESSIONS_STATS)
+        for session, _ in SESSIONS.values():
+            for key, value in get_session_stats(session).items():
+                stats[key] += value
+        stats["sessions"] = len(SESSIONS)
+        return stats
+
+
 def get_uri(ip, endpoint="/", protocol="http", timeout=None):
     timeout = timeout if timeout else app.config.get("NETWORK_TIMEOUT", 10)
     request = None
@@ -48,10 +127,15 @@ def get_uri(ip, endpoint="/", protocol="http", timeout=None):
     if endpoint[0] != "/":
         endpoint = "/%s" % (endpoint,)
     uri = "%s://%s%s" % (protocol, ip, endpoint)
+    if not circuitbreaker.allow(ip):
+        app.logger.debug("Circuit breaker is open, not calling %s" % (uri))
+        return request
     try:
-        request = requests.get(uri, timeout=timeout)
+        request = get_session(ip).get(uri, timeout=timeout)
+        circuitbreaker.record_success(ip)
     except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
         app.logger.debug("Cannot call %s" % (uri))
+        circuitbreaker.record_failure(ip)
     return request
 
 
@@ -69,8 +153,116 @@ def post_uri(
     if endpoint[0] != "/":
         endpoint = "/%s" % (endpoint,)
     uri = "%s://%s%s" % (protocol, ip, endpoint)
+    if not circuitbreaker.allow(ip):
+        app.logger.debug("Circuit breaker is open, not calling %s" % (uri))
+        return request
     try:
-        request = requests.post(uri, timeout=timeout, files=files, data=data, json=json)
+        request = get_session(ip).post(
+            uri, timeout=timeout, files=files, data=data, json=json
+        )
+        circuitbreaker.record_success(ip)
     except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
         app.logger.debug("Cannot call %s" % (uri))
+        circuitbreaker.record_failure(ip)
+    return request
+
+
+class AsyncResponse:
+    # Mimics the parts of requests.Response the drivers are working with
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def json(self):
+        return jsonlib.loads(self.content.decode("utf-8"))
+
+
+def make_form_data(files=None, data=None):
+    form = aiohttp.FormData()
+    for key, value in (data or {}).items():
+        form.add_field(key, str(value))
+    for key, value in (files or {}).items():
+        # a (filename, file) pair like requests accepts it
+        if isinstance(value, tuple):
+            filename, value = value
+        else:
+            filename = os.path.basename(getattr(value, "name", key))
+        form.add_field(key, value, filename=filename)
+    return form
+
+
+async def run_blocking(function, *args, **kwargs):
+    # redis and database calls block, the event loop must not wait for them
+    return await asyncio.get_event_loop().run_in_executor(
+        None, functools.partial(function, *args, **kwargs)
+    )
+
+
+async def async_request(method, uri, timeout, session=None, **kwargs):
+    if session is None:
+        async with aiohttp.ClientSession() as own_session:
+            return await async_request(method, uri, timeout, own_session, **kwargs)
+    async with session.request(
+        method, uri, timeout=aiohttp.ClientTimeout(total=timeout), **kwargs
+    ) as response:
+        return AsyncResponse(response.status, await response.read())
+
+
+async def async_get_uri(ip, endpoint="/", protocol="http", timeout=None, session=None):
+    timeout = timeout if timeout else app.config.get("NETWORK_TIMEOUT", 10)
+    request = None
+    if ip is None:
+        return request
+    if endpoint[0] != "/":
+        endpoint = "/%s" % (endpoint,)
+    uri = "%s://%s%s" % (protocol, ip, endpoint)
+    if not await run_blocking(circuitbreaker.allow, ip):
+        app.logger.debug("Circuit breaker is open, not calling %s" % (uri))
+        return request
+    try:
+        request = await async_request("GET", uri, timeout, session)
+        await run_blocking(circuitbreaker.record_success, ip)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        app.logger.debug("Cannot call %s" % (uri))
+        await run_blocking(circuitbreaker.record_failure, ip)
+    return request
+
+
+async def async_post_uri(
+    ip,
+    endpoint="/",
+    protocol="http",
+    timeout=None,
+    files=None,
+    data=None,
+    json=None,
+    session=None,
+):
+    timeout = timeout if timeout else app.config.get("NETWORK_TIMEOUT", 10)
+    request = None
+    if ip is None:
+        return request
+    if (json and data) or (json and files):
+        raise Exception("Cannot pass json and data/files at the same time")
+
+    if endpoint[0] != "/":
+        endpoint = "/%s" % (endpoint,)
+    uri = "%s://%s%s" % (protocol, ip, endpoint)
+    if not await run_blocking(circuitbreaker.allow, ip):
+        app.logger.debug("Circuit breaker is open, not calling %s" % (uri))
+        return request
+    try:
+        if json is not None:
+            request = await async_request("POST", uri, timeout, session, json=json)
+        else:
+            request = await async_request(
+                "POST", uri, timeout, session, data=make_form_data(files, data)
+            )
+        await run_blocking(circuitbreaker.record_success, ip)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        app.logger.debug("Cannot call %s" % (uri))
+        await run_blocking(circuitbreaker.record_failure, ip)
     return request
@@ -0,0 +1,44 @@
+from time import time
+
+from server import app
+from server.services.cache import redis
+
+# Sorted set of printer IPs scored by the time of their next check
+SCHEDULE_KEY = "printers_schedule"
+
+# Picks the due printers and postpones them by a lease in a single atomic step, so
+# overlapping scheduler ticks never dispatch the same printer twice. The check itself
+# then reschedules the printer according to its state.
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+for _, ip in ipairs(due) do
+    redis.call('ZADD', KEYS[1], ARGV[2], ip)
+end
+return due
+"""
+
+
+def sync(ips):
+    # newly added printers are due right away, removed ones are dropped
+    ips = set(ips)
+    pipe = redis.pipeline()
+    if ips:
+        pipe.zadd(SCHEDULE_KEY, {ip: time() for ip in ips}, nx=True)
+    stale = [ip.decode("utf-8") for ip in redis.zrange(SCHEDULE_KEY, 0, -1)]
+    stale = [ip for ip in stale if ip not in ips]
+    if stale:
+        pipe.zrem(SCHEDULE_KEY, *stale)
+    pipe.execute()
+
+
+def pop_due(limit=100):
+    now = time()
+    lease = now + app.config.get("NETWORK_POLL_LEASE", 60)
+    due = redis.register_script(POP_DUE_SCRIPT)(
+        keys=[SCHEDULE_KEY], args=[now, lease, limit]
+    )
+    return [ip.decode("utf-8") for ip in due]
+
+
+def reschedule(ip, interval):
+    redis.zadd(SCHEDULE_KEY, {ip: time() + interval})
@@ -0,0 +1,123 @@
+import json
+from time import time
+
+from server import app
+from server.services.cache import redis
+
+# Parts of the printer state that are probed over the network and kept in the snapshot
+FIELDS = ("status", "webcam", "job")
+
+
+def get_key(ip):
+    return "printer_state_%s" % (ip,)
+
+
+# Every change of the snapshot is announced here, see GET /printers/events
+EVENTS_CHANNEL = "printer_state_events"
+
+
+def get_value(raw):
+    try:
+        return json.loads(raw)["value"]
+    except (TypeError, KeyError, UnicodeDecodeError, json.decoder.JSONDecodeError):
+        return None
+
+
+def save(ip, **fields):
+    # every part carries its own timestamp as they might be refreshed independently
+    now = time()
+    key = get_key(ip)
+
+    # runs again when another process changes the snapshot in between, so every
+    # change is announced exactly once
+    def update(pipe):
+        previous = dict(zip(fields.keys(), pipe.hmget(key, *fields.keys())))
+        changes = {}
+        pipe.multi()
+        for field, value in fields.items():
+            pipe.hset(key, field, json.dumps({"value": value, "updated": now}))
+            # compare the serialized forms, tuples become lists on the way through redis
+            if json.dumps(get_value(previous.get(field)), sort_keys=True) != json.dumps(
+                value, sort_keys=True
+            ):
+                changes[field] = value
+        if changes:
+            pipe.publish(EVENTS_CHANNEL, json.dumps({"ip": ip, "fields": changes}))
+
+    try:
+        redis.transaction(update, key)
+    except Exception as e:
+        app.logger.error("Cannot save printer state snapshot into cache: %s", e)
+
+
+def load(ip):
+    try:
+        raw = redis.hgetall(get_key(ip))
+    except Exception as e:
+        app.logger.error("Cannot load printer state snapshot from cache: %s", e)
+        return {}
+    snapshot = {}
+    for field, value in raw.items():
+        try:
+            snapshot[field.decode("utf-8")] = json.loads(value)
+        except (UnicodeDecodeError, json.decoder.JSONDecodeError):
+            continue
+    return snapshot
+
+
+def delete(ip):
+    try:
+        pipe = redis.pipeline()
+        pipe.delete(get_key(ip))
+        pipe.publish(EVENTS_CHANNEL, json.dumps({"ip": ip, "deleted": True}))
+        pipe.execute()
+    except Exception as e:
+        app.logger.error("Cannot delete printer state snapshot from cache: %s", e)
+
+
+def subscribe():
+    try:
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(EVENTS_CHANNEL)
+        return pubsub
+    except Exception as e:
+        app.logger.error("Cannot subscribe to printer state events: %s", e)
+        return None
+
+
+def get_event(pubsub, timeout):
+    # None when nothing happened within timeout seconds
+    message = pubsub.get_message(timeout=timeout)
+    if not message or message.get("type") != "message":
+        return None
+    try:
+        return json.loads(message["data"])
+    except (TypeError, UnicodeDecodeError, json.decoder.JSONDecodeError):
+        return None
+
+
+def get_push_key(ip):
+    return "printer_push_%s" % (ip,)
+
+
+def set_push_active(ip):
+    # refreshed with every message coming through the push connector
+    try:
+        redis.set(get_push_key(ip), 1, ex=app.config.get("NETWORK_PUSH_TTL", 60))
+    except Exception as e:
+        app.logger.error("Cannot save push connection state into cache: %s", e)
+
+
+def clear_push_active(ip):
+    try:
+        redis.delete(get_push_key(ip))
+    except Exception as e:
+        app.logger.error("Cannot delete push connection state from cache: %s", e)
+
+
+def is_push_active(ip):
+    try:
+        return bool(redis.exists(get_push_key(ip)))
+    except Exception as e:
+        app.logger.error("Cannot load push connection state from cache: %s", e)
+        return False
@@ -0,0 +1,141 @@
+import io
+from time import sleep
+
+import requests
+from PIL import Image
+
+from server import app
+from server.services import locks
+from server.services.cache import redis
+
+JPEG_START = b"\xff\xd8"
+JPEG_END = b"\xff\xd9"
+
+
+def get_key(ip, width=None):
+    return "webcam_snapshot_%s_%s" % (ip, width or "full")
+
+
+def get_failure_key(ip):
+    return "webcam_snapshot_%s_failed" % (ip,)
+
+
+def get_frame(stream_url):
+    # Reads the stream only until the first complete JPEG image shows up
+    max_size = app.config.get("WEBCAM_SNAPSHOT_MAX_SIZE", 5 * 1024 * 1024)
+    try:
+        req = requests.get(
+            stream_url, stream=True, timeout=app.config.get("NETWORK_TIMEOUT", 10)
+        )
+    except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
+        app.logger.debug("Cannot call %s" % (stream_url))
+        return None
+    try:
+        if req.status_code != 200:
+            return None
+        data = bytearray()
+        start = -1
+        for chunk in req.iter_content(chunk_size=16384):
+            # only the new bytes are searched, the overlap catches a marker
+            # split between two chunks
+            offset = max(len(data) - len(JPEG_END) + 1, 0)
+            data += chunk
+            if start < 0:
+                start = data.find(JPEG_START, offset)
+            if start >= 0:
+                end = data.find(JPEG_END, max(offset, start + len(JPEG_START)))
+                if end >= 0:
+                    return bytes(data[start : end + len(JPEG_END)])
+            if len(data) > max_size:
+                break
+    except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
+        app.logger.debug("Cannot read %s" % (stream_url))
+    finally:
+        req.close()
+    return None
+
+
+def scale(frame, width):
+    image = Image.open(io.BytesIO(frame))
+    if image.width <= width:
+        return frame
+    height = max(int(image.height * width / image.width), 1)
+    output = io.BytesIO()
+    image.convert("RGB").resize((width, height), Image.BILINEAR).save(
+        output, format="JPEG", quality=80
+    )
+    return output.getvalue()
+
+
+def capture(ip, stream_url):
+    frame = get_frame(stream_url)
+    if frame is None:
+        # lets the waiting requests give up right away
+        try:
+            redis.set(
+                get_failure_key(ip), 1, ex=app.config.get("WEBCAM_SNAPSHOT_MAX_AGE", 5)
+            )
+        except Exception as e:
+            app.logger.error("Cannot save webcam snapshot failure into cache: %s", e)
+        return {}
+    variants = {None: frame}
+    try:
+        for width in app.config.get("WEBCAM_SNAPSHOT_WIDTHS", []):
+            variants[width] = scale(frame, width)
+    except (OSError, ValueError) as e:
+        app.logger.error("Cannot scale webcam snapshot of %s: %s", ip, e)
+        return {None: frame}
+    try:
+        pipe = redis.pipeline()
+        for width, data in variants.items():
+            pipe.set(
+                get_key(ip, width),
+                data,
+                ex=app.config.get("WEBCAM_SNAPSHOT_MAX_AGE", 5),
+            )
+        pipe.delete(get_failure_key(ip))
+        pipe.execute()
+    except Exception as e:
+        app.logger.error("Cannot save webcam snapshot into cache: %s", e)
+    return variants
+
+
+def load(ip, width=None):
+    try:
+        return redis.get(get_key(ip, width))
+    except Exception as e:
+        app.logger.error("Cannot load webcam snapshot from cache: %s", e)
+        return None
+
+
+def has_failed(ip):
+    try:
+        return redis.get(get_failure_key(ip)) is not None
+    except Exception as e:
+        app.logger.error("Cannot load webcam snapshot failure from cache: %s", e)
+        return False
+
+
+def get_snapshot(ip, stream_url, width=None):
+    snapshot = load(ip, width)
+    if snapshot is not None:
+        return snapshot
+    if has_failed(ip):
+        return None
+    timeout = app.config.get("NETWORK_TIMEOUT", 10)
+    token = locks.acquire("webcam_snapshot_%s" % (ip,), timeout + 1)
+    if token is None:
+        # somebody else is capturing right now, wait for the result instead
+        for _ in range(int(timeout * 10)):
+            sleep(0.1)
+            snapshot = load(ip, width)
+            if snapshot is not None:
+                return snapshot
+            if has_failed(ip):
+                return None
+        return None
+    try:
+        variants = capture(ip, stream_url)
+    finally:
+        locks.release("webcam_snapshot_%s" % (ip,), token)
+    return variants.get(width, variants.get(None))
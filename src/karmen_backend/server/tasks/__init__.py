@@ -1,3 +1,5 @@
 import server.tasks.sniff_printer
 import server.tasks.discover_printers
 import server.tasks.check_printers
+import server.tasks.schedule_printer_checks
+import server.tasks.process_gcode
@@ -1,41 +1,163 @@
-import redis
+import asyncio
+import json
+import re
+from time import time
+
+import aiohttp
+
+from celery import chord
 from server import app, celery
 from server.database import printers
 from server import drivers
+from server.services import circuitbreaker, locks, pollschedule, printerstate
+from server.services.cache import redis
+
+
+def get_check_interval(printer, status):
+    if not printer.client.connected:
+        # back off from printers that keep failing
+        failures = circuitbreaker.get_state(printer.ip)["failures"]
+        return min(
+            app.config.get("NETWORK_POLL_OFFLINE", 60) * 2 ** max(failures - 1, 0),
+            app.config.get("NETWORK_POLL_OFFLINE_MAX", 600),
+        )
+    if printerstate.is_push_active(printer.ip):
+        # the push connector keeps the state fresh, this is just a fallback
+        return app.config.get("NETWORK_POLL_PUSH", 120)
+    if re.match(r"^(Printing|Pausing|Paused|Resuming|Cancelling)", status["state"]):
+        return app.config.get("NETWORK_POLL_PRINTING", 5)
+    return app.config.get("NETWORK_POLL_IDLE", 30)
+
 
-redis = redis.Redis(
-    host=app.config["WEBCAM_PROXY_CACHE_HOST"],
-    port=app.config["WEBCAM_PROXY_CACHE_PORT"],
-)
+def save_printer_check(printer, webcam, status, job):
+    if printer.client.connected:
+        try:
+            if "stream" in webcam:
+                redis.set("webcam_%s" % (printer.ip,), webcam["stream"])
+            else:
+                redis.delete("webcam_%s" % (printer.ip,))
+        except Exception as e:
+            app.logger.error("Cannot save webcam proxy information into cache: %s", e)
+    # the connection and the breaker are not part of the snapshot, they are
+    # saved along so that their changes reach the event stream as well
+    printerstate.save(
+        printer.ip,
+        status=status,
+        webcam=webcam,
+        job=job,
+        client=printer.client_info(),
+        circuit_breaker=circuitbreaker.get_state(printer.ip),
+    )
+
+    printers.update_printer(
+        name=printer.name,
+        hostname=printer.hostname,
+        ip=printer.ip,
+        client=printer.client_name(),
+        client_props={
+            "version": printer.client.version,
+            "connected": printer.client.connected,
+            "read_only": printer.client.read_only,
+        },
+    )
+
+
+async def fetch_printer(raw_printer, session):
+    printer = drivers.get_async_printer_instance(raw_printer, session)
+    await printer.is_alive()
+    webcam = await printer.webcam()
+    status = await printer.status()
+    return printer, webcam, status, await printer.job()
+
+
+async def fetch_printers(raw_printers):
+    # the whole batch waits for the network at once, over a shared connection pool
+    async with aiohttp.ClientSession() as session:
+        return await asyncio.gather(
+            *[fetch_printer(raw_printer, session) for raw_printer in raw_printers],
+            return_exceptions=True
+        )
+
+
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@celery.task(name="check_printers_batch")
+def check_printers_batch(raw_printers):
+    summary = {"checked": 0, "skipped": 0}
+    # printers still being checked by a previous or a parallel run are skipped
+    tokens = {}
+    locked = []
+    for raw_printer in raw_printers:
+        lock_name = "check_printer_%s" % (raw_printer["ip"],)
+        token = locks.acquire(lock_name, app.config.get("NETWORK_CHECK_LOCK_TTL", 60))
+        if token is None:
+            app.logger.debug(
+                "%s is already being checked, skipping" % raw_printer["ip"]
+            )
+            summary["skipped"] += 1
+        else:
+            tokens[lock_name] = token
+            locked.append(raw_printer)
+    try:
+        if not locked:
+            return summary
+        for raw_printer, result in zip(locked, run_async(fetch_printers(locked))):
+            if isinstance(result, Exception):
+                app.logger.error("Cannot check %s: %s", raw_printer["ip"], result)
+                summary["skipped"] += 1
+                continue
+            printer, webcam, status, job = result
+            save_printer_check(printer, webcam, status, job)
+            pollschedule.reschedule(printer.ip, get_check_interval(printer, status))
+            summary["checked"] += 1
+        return summary
+    finally:
+        for lock_name, token in tokens.items():
+            locks.release(lock_name, token)
+
+
+@celery.task(name="summarize_check_printers")
+def summarize_check_printers(batch_summaries, started):
+    summary = {
+        "started": started,
+        "duration": time() - started,
+        "checked": sum(s["checked"] for s in batch_summaries),
+        "skipped": sum(s["skipped"] for s in batch_summaries),
+    }
+    app.logger.info(
+        "Checked %s printers (%s skipped) in %.2f s"
+        % (summary["checked"], summary["skipped"], summary["duration"])
+    )
+    try:
+        redis.set("check_printers_summary", json.dumps(summary))
+    except Exception as e:
+        app.logger.error("Cannot save check_printers summary into cache: %s", e)
+    return summary
+
+
+def dispatch_printer_checks(raw_printers):
+    # the printers are checked in parallel batches, the summary of the whole
+    # run is recorded once all of them finish
+    batch_size = app.config.get("NETWORK_CHECK_BATCH_SIZE", 10)
+    batches = [
+        raw_printers[i : i + batch_size]
+        for i in range(0, len(raw_printers), batch_size)
+    ]
+    chord(check_printers_batch.s(batch) for batch in batches)(
+        summarize_check_printers.s(time())
+    )
 
 
 @celery.task(name="check_printers")
 def check_printers():
     app.logger.debug("Checking known printers...")
-    for raw_printer in printers.get_printers():
-        printer = drivers.get_printer_instance(raw_printer)
-        printer.is_alive()
-
-        if printer.client.connected:
-            webcam = printer.webcam()
-            try:
-                if "stream" in webcam:
-                    redis.set("webcam_%s" % (printer.ip,), webcam["stream"])
-                else:
-                    redis.delete("webcam_%s" % (printer.ip,))
-            except Exception as e:
-                app.logger.error(
-                    "Cannot save webcam proxy information into cache: %s", e
-                )
-
-        printers.update_printer(
-            name=printer.name,
-            hostname=printer.hostname,
-            ip=printer.ip,
-            client=printer.client_name(),
-            client_props={
-                "version": printer.client.version,
-                "connected": printer.client.connected,
-                "read_only": printer.client.read_only,
-            },
-        )
+    raw_printers = [dict(printer) for printer in printers.get_printers()]
+    if not raw_printers:
+        return
+    dispatch_printer_checks(raw_printers)
@@ -0,0 +1,86 @@
+import hashlib
+from celery import chain
+from server import app, celery
+from server.database import gcodes
+from server.services import files, gcodemeta, gcodeanalysis, gcodethumbnail
+
+# Everything derived from an uploaded file, in the order it is done. The hash
+# is known as soon as the upload is received, see server/services/files.py
+STAGES = ["hash", "metadata", "thumbnail", "analysis"]
+
+
+def get_initial_stages():
+    return dict({stage: "pending" for stage in STAGES}, hash="done")
+
+
+def extract_metadata(gcode):
+    return gcodemeta.extract(gcode["absolute_path"])
+
+
+def extract_thumbnail(gcode):
+    image = gcodethumbnail.extract(gcode["absolute_path"])
+    if image is None:
+        return {"thumbnail": None}
+    files.save_thumbnail(gcode["absolute_path"], image)
+    return {"thumbnail": hashlib.sha256(image).hexdigest()}
+
+
+def analyze(gcode):
+    return gcodeanalysis.analyze(
+        gcode["absolute_path"],
+        filament_type=gcode["filament_type"],
+        filament_diameter=app.config.get("GCODE_ANALYSIS_FILAMENT_DIAMETER", 1.75),
+        acceleration=app.config.get("GCODE_ANALYSIS_ACCELERATION", 1000),
+    )
+
+
+def run_stage(gcode_id, stage, function):
+    gcode = gcodes.get_gcode(gcode_id)
+    if gcode is None:
+        # deleted in the meantime
+        return
+    try:
+        values = function(gcode)
+    except Exception as e:
+        # the other stages might still work out
+        app.logger.error("Cannot run %s of gcode %s: %s", stage, gcode_id, e)
+        gcodes.update_gcode_stage(gcode_id, stage, "failed")
+        return
+    gcodes.update_gcode_stage(gcode_id, stage, "done", values)
+
+
+@celery.task(name="extract_gcode_metadata")
+def extract_gcode_metadata(gcode_id):
+    run_stage(gcode_id, "metadata", extract_metadata)
+
+
+@celery.task(name="extract_gcode_thumbnail")
+def extract_gcode_thumbnail(gcode_id):
+    run_stage(gcode_id, "thumbnail", extract_thumbnail)
+
+
+@celery.task(name="analyze_gcode")
+def analyze_gcode(gcode_id):
+    run_stage(gcode_id, "analysis", analyze)
+
+
+@celery.task(name="finish_gcode_processing")
+def finish_gcode_processing(gcode_id):
+    gcodes.finish_gcode_processing(gcode_id)
+
+
+def get_pipeline(gcode_id):
+    return [
+        extract_gcode_metadata.si(gcode_id),
+        extract_gcode_thumbnail.si(gcode_id),
+        analyze_gcode.si(gcode_id),
+        finish_gcode_processing.si(gcode_id),
+    ]
+
+
+def process_gcode(gcode_id):
+    try:
+        chain(*get_pipeline(gcode_id)).delay()
+    except Exception as e:
+        # the upload is kept anyway, it just stays in processing
+        app.logger.error("Cannot start processing gcode %s: %s", gcode_id, e)
@@ -0,0 +1,19 @@
+from server import app, celery
+from server.database import printers
+from server.services import pollschedule
+from server.tasks.check_printers import dispatch_printer_checks, get_check_interval
+
+
+@celery.task(name="schedule_printer_checks")
+def schedule_printer_checks():
+    raw_printers = {printer["ip"]: dict(printer) for printer in printers.get_printers()}
+    pollschedule.sync(list(raw_printers.keys()))
+    due = []
+    for ip in pollschedule.pop_due():
+        # removed meanwhile, the next sync drops it from the schedule
+        if ip not in raw_printers:
+            continue
+        app.logger.debug("Printer %s is due for a check" % ip)
+        due.append(raw_printers[ip])
+    if due:
+        dispatch_printer_checks(due)
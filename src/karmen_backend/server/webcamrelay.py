@@ -0,0 +1,191 @@
+# Long running service relaying the webcam streams of the printers. Every stream
+# is pulled from the printer at most once, no matter how many viewers watch it,
+# and only while somebody is watching. Run it with `python3 -m server.webcamrelay`.
+import asyncio
+from collections import deque
+from time import time
+
+import aiohttp
+from aiohttp import web
+
+from server import app
+from server.services.cache import redis
+
+BOUNDARY = "frame"
+# frame rate is reported as an average over this many seconds
+FPS_WINDOW = 5
+
+# ip -> Stream, only the streams with at least one viewer
+STREAMS = {}
+
+
+class Stream:
+    def __init__(self, ip, uri, session):
+        self.ip = ip
+        self.uri = uri
+        self.session = session
+        self.viewers = set()
+        self.frames = 0
+        self.dropped = 0
+        self.frame_times = deque(maxlen=100 * FPS_WINDOW)
+        self.started = time()
+        self.task = asyncio.ensure_future(self.pull())
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=1)
+        self.viewers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.viewers.discard(queue)
+
+    def publish(self, frame):
+        self.frames += 1
+        self.frame_times.append(time())
+        for queue in self.viewers:
+            if queue.full():
+                # the viewer did not keep up, it gets the newest frame instead
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(frame)
+
+    def close(self):
+        for queue in self.viewers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def get_fps(self):
+        since = time() - FPS_WINDOW
+        return round(len([t for t in self.frame_times if t > since]) / FPS_WINDOW, 2)
+
+    def get_stats(self):
+        return {
+            "ip": self.ip,
+            "viewers": len(self.viewers),
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "fps": self.get_fps(),
+            "started": self.started,
+        }
+
+    async def pull(self):
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=app.config.get("NETWORK_TIMEOUT", 10),
+            sock_read=app.config.get("NETWORK_TIMEOUT", 10),
+        )
+        try:
+            async with self.session.get(self.uri, timeout=timeout) as resp:
+                reader = aiohttp.MultipartReader(resp.headers, resp.content)
+                while True:
+                    part = await reader.next()
+                    if part is None:
+                        break
+                    content_type = part.headers.get(
+                        aiohttp.hdrs.CONTENT_TYPE, "image/jpeg"
+                    )
+                    self.publish((content_type, await part.read()))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            app.logger.debug("Cannot relay webcam stream %s: %s" % (self.uri, e))
+        finally:
+            self.close()
+
+
+def get_stream_uri(ip):
+    try:
+        uri = redis.get("webcam_%s" % (ip,))
+    except Exception as e:
+        app.logger.error("Cannot load webcam proxy information from cache: %s", e)
+        return None
+    return uri.decode("utf-8") if uri else None
+
+
+def get_stream(ip, session):
+    stream = STREAMS.get(ip)
+    if stream is None or stream.task.done():
+        uri = get_stream_uri(ip)
+        if uri is None:
+            return None
+        stream = STREAMS[ip] = Stream(ip, uri, session)
+    return stream
+
+
+def leave_stream(stream, queue):
+    stream.unsubscribe(queue)
+    if not stream.viewers:
+        # nobody is watching, do not keep the printer busy
+        stream.task.cancel()
+        if STREAMS.get(stream.ip) is stream:
+            del STREAMS[stream.ip]
+
+
+def format_frame(content_type, data):
+    return (
+        (
+            "--%s\r\nContent-Type: %s\r\nContent-Length: %s\r\n\r\n"
+            % (BOUNDARY, content_type, len(data))
+        ).encode("utf-8")
+        + data
+        + b"\r\n"
+    )
+
+
+async def webcam(request):
+    stream = get_stream(request.match_info["ip"], request.app["session"])
+    if stream is None:
+        raise web.HTTPNotFound()
+    queue = stream.subscribe()
+    try:
+        response = web.StreamResponse(
+            headers={
+                "Content-Type": "multipart/x-mixed-replace; boundary=%s" % BOUNDARY,
+                "Cache-Control": "no-cache",
+                "Access-Control-Allow-Origin": "*",
+            }
+        )
+        await response.prepare(request)
+        while True:
+            frame = await queue.get()
+            if frame is None:
+                break
+            await response.write(format_frame(*frame))
+    except ConnectionResetError:
+        pass
+    finally:
+        leave_stream(stream, queue)
+    return response
+
+
+async def stats(request):
+    return web.json_response(
+        {"items": [stream.get_stats() for stream in STREAMS.values()]}
+    )
+
+
+async def start_session(application):
+    application["session"] = aiohttp.ClientSession()
+
+
+async def close_session(application):
+    for stream in list(STREAMS.values()):
+        stream.task.cancel()
+    await application["session"].close()
+
+
+def make_app():
+    application = web.Application()
+    application.router.add_get("/proxied-webcam/{ip}", webcam)
+    application.router.add_get("/webcam-streams", stats)
+    application.on_startup.append(start_session)
+    application.on_cleanup.append(close_session)
+    return application
+
+
+def run():
+    app.logger.info("Starting the webcam relay...")
+    web.run_app(make_app(), port=app.config.get("WEBCAM_RELAY_PORT", 9765))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,61 @@
+import datetime
+import unittest
+
+from server.database import (
+    encode_cursor,
+    decode_cursor,
+    is_cursor_value_valid,
+    make_cursor,
+)
+
+
+class CursorTest(unittest.TestCase):
+    def test_roundtrip(self):
+        self.assertEqual(
+            decode_cursor(encode_cursor("file.gcode", 12)), ("file.gcode", 12)
+        )
+
+    def test_datetime(self):
+        value = datetime.datetime(2019, 10, 1, 12, 0, tzinfo=datetime.timezone.utc)
+        self.assertEqual(
+            decode_cursor(encode_cursor(value, 3)), ("2019-10-01T12:00:00+00:00", 3)
+        )
+
+    def test_empty_value(self):
+        self.assertEqual(decode_cursor(encode_cursor(None, 3)), (None, 3))
+
+    def test_invalid(self):
+        self.assertEqual(decode_cursor("asdfasdf"), None)
+        self.assertEqual(decode_cursor("12"), None)
+        self.assertEqual(decode_cursor(encode_cursor({"a": 1}, 3)), None)
+        self.assertEqual(decode_cursor(encode_cursor("a", "b")), None)
+
+    def test_make_cursor(self):
+        row = {"id": 5, "filename": "file.gcode"}
+        self.assertEqual(make_cursor(row), encode_cursor(5, 5))
+        self.assertEqual(make_cursor(row, "-filename"), encode_cursor("file.gcode", 5))
+
+    def test_value_valid(self):
+        self.assertTrue(is_cursor_value_valid("file.gcode"))
+        self.assertTrue(is_cursor_value_valid(12, "integer"))
+        self.assertTrue(is_cursor_value_valid(12, "real"))
+        self.assertTrue(is_cursor_value_valid(0.01, "real"))
+        self.assertTrue(is_cursor_value_valid("2019-10-01T12:00:00+00:00", "timestamp"))
+        self.assertTrue(
+            is_cursor_value_valid("2019-10-01T12:00:00.123456+02:00", "timestamp")
+        )
+        self.assertTrue(is_cursor_value_valid(None, "integer", nullable=True))
+
+    def test_value_invalid(self):
+        self.assertFalse(is_cursor_value_valid(12))
+        self.assertFalse(is_cursor_value_valid(None))
+        self.assertFalse(is_cursor_value_valid("12", "integer"))
+        self.assertFalse(is_cursor_value_valid(1.5, "integer"))
+        self.assertFalse(is_cursor_value_valid(True, "integer"))
+        self.assertFalse(is_cursor_value_valid("abc", "real"))
+        self.assertFalse(is_cursor_value_valid("abc", "timestamp"))
+        self.assertFalse(is_cursor_value_valid(12, "timestamp"))
+        self.assertFalse(is_cursor_value_valid("2019-10-01", "timestamp"))
+        self.assertFalse(
+            is_cursor_value_valid("2019-02-30T00:00:00+00:00", "timestamp")
+        )
@@ -0,0 +1,160 @@
+import unittest
+import mock
+
+import psycopg2.extras
+from server import app
+from server.database import get_connection, instrumentation
+from server.database.instrumentation import QueryStats, get_bucket
+
+
+class GetBucketTest(unittest.TestCase):
+    def test_bucket(self):
+        self.assertEqual(get_bucket(0.2), "le_1")
+        self.assertEqual(get_bucket(5), "le_5")
+        self.assertEqual(get_bucket(6), "le_10")
+        self.assertEqual(get_bucket(10000), "le_inf")
+
+
+class QueryStatsTest(unittest.TestCase):
+    def test_record(self):
+        stats = QueryStats()
+        stats.record("a.b", 3, 10)
+        stats.record("a.b", 30, 2)
+        self.assertEqual(
+            stats.take(force=True),
+            {
+                "a.b": {
+                    "count": 2,
+                    "rows": 12,
+                    "ms": 33.0,
+                    "buckets": {"le_5": 1, "le_50": 1},
+                }
+            },
+        )
+        self.assertEqual(stats.take(force=True), {})
+
+    def test_take_waits_for_interval(self):
+        stats = QueryStats()
+        stats.record("a.b", 3, 10)
+        self.assertEqual(stats.take(), {})
+        stats.flushed = 0
+        self.assertTrue("a.b" in stats.take())
+
+    def test_reset_after_fork(self):
+        stats = QueryStats()
+        stats.record("a.b", 3, 10)
+        stats.pid = -1
+        self.assertEqual(stats.take(force=True), {})
+
+
+class InstrumentedCursorTest(unittest.TestCase):
+    def setUp(self):
+        instrumentation.STATS.take(force=True)
+
+    def run_statement(self, **kwargs):
+        with get_connection() as connection:
+            cursor = connection.cursor(**kwargs)
+            cursor.execute("SELECT generate_series(1, 3)")
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+    def test_records_statement(self):
+        self.run_statement()
+        stats = instrumentation.STATS.take(force=True)
+        self.assertEqual(
+            list(stats.keys()), ["tests.database.test_instrumentation.run_statement"]
+        )
+        self.assertEqual(
+            stats["tests.database.test_instrumentation.run_statement"]["count"], 1
+        )
+        self.assertEqual(
+            stats["tests.database.test_instrumentation.run_statement"]["rows"], 3
+        )
+
+    def test_keeps_cursor_factory(self):
+        rows = self.run_statement(cursor_factory=psycopg2.extras.DictCursor)
+        self.assertTrue(isinstance(rows[0], psycopg2.extras.DictRow))
+        self.assertTrue(
+            "tests.database.test_instrumentation.run_statement"
+            in instrumentation.STATS.take(force=True)
+        )
+
+    def test_records_failed_statement(self):
+        with self.assertRaises(psycopg2.errors.UndefinedTable):
+            with get_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT * FROM nonexistent_table")
+        stats = instrumentation.STATS.take(force=True)
+        self.assertEqual(
+            stats["tests.database.test_instrumentation.test_records_failed_statement"][
+                "count"
+            ],
+            1,
+        )
+
+    @mock.patch.object(app.logger, "warning")
+    def test_logs_slow_query(self, mock_warning):
+        with mock.patch.dict(app.config, {"DB_SLOW_QUERY_MS": 0}):
+            self.run_statement()
+        self.assertEqual(mock_warning.call_count, 1)
+        self.assertEqual(
+            mock_warning.call_args[0][1],
+            "tests.database.test_instrumentation.run_statement",
+        )
+        self.assertTrue("generate_series" in mock_warning.call_args[0][3])
+
+    @mock.patch.object(app.logger, "warning")
+    def test_quiet_fast_query(self, mock_warning):
+        self.run_statement()
+        self.assertEqual(mock_warning.call_count, 0)
+
+
+class FlushTest(unittest.TestCase):
+    def setUp(self):
+        instrumentation.STATS.take(force=True)
+
+    @mock.patch("server.database.instrumentation.redis")
+    def test_flush(self, mock_redis):
+        instrumentation.STATS.record("a.b", 3, 10)
+        instrumentation.flush(force=True)
+        pipe = mock_redis.pipeline.return_value
+        pipe.sadd.assert_called_with("query_stats", "a.b")
+        pipe.hincrby.assert_any_call("query_stats_a.b", "count", 1)
+        pipe.hincrby.assert_any_call("query_stats_a.b", "rows", 10)
+        pipe.hincrby.assert_any_call("query_stats_a.b", "le_5", 1)
+        pipe.hincrbyfloat.assert_called_with("query_stats_a.b", "ms", 3)
+        self.assertEqual(pipe.execute.call_count, 1)
+
+    @mock.patch("server.database.instrumentation.redis")
+    def test_flush_nothing(self, mock_redis):
+        instrumentation.flush(force=True)
+        self.assertEqual(mock_redis.pipeline.call_count, 0)
+
+    @mock.patch("server.database.instrumentation.redis")
+    def test_flush_survives_redis_failure(self, mock_redis):
+        mock_redis.pipeline.return_value.execute.side_effect = Exception("down")
+        instrumentation.STATS.record("a.b", 3, 10)
+        instrumentation.flush(force=True)
+
+    @mock.patch("server.database.instrumentation.redis")
+    def test_load_stats(self, mock_redis):
+        mock_redis.smembers.return_value = {b"a.b"}
+        mock_redis.pipeline.return_value.execute.return_value = [
+            {
+                b"count": b"2",
+                b"rows": b"12",
+                b"ms": b"33.5",
+                b"le_5": b"1",
+                b"le_50": b"1",
+            }
+        ]
+        stats = instrumentation.load_stats()
+        self.assertEqual(stats["a.b"]["count"], 2)
+        self.assertEqual(stats["a.b"]["rows"], 12)
+        self.assertEqual(stats["a.b"]["total_ms"], 33.5)
+        self.assertEqual(stats["a.b"]["mean_ms"], 16.75)
+        self.assertEqual(stats["a.b"]["histogram"]["le_5"], 1)
+        self.assertEqual(stats["a.b"]["histogram"]["le_50"], 1)
+        self.assertEqual(stats["a.b"]["histogram"]["le_1"], 0)
+        self.assertEqual(stats["a.b"]["histogram"]["le_inf"], 0)
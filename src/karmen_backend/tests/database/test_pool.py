@@ -0,0 +1,93 @@
+import unittest
+import mock
+import psycopg2
+import psycopg2.pool
+
+from server.database import ConnectionPool, get_connection
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool(minconn=1, maxconn=2, timeout=0.1)
+
+    def tearDown(self):
+        for connection, _ in self.pool.idle:
+            connection.close()
+
+    def test_reuse(self):
+        connection = self.pool.getconn()
+        self.pool.putconn(connection)
+        self.assertEqual(self.pool.getconn(), connection)
+        self.pool.putconn(connection)
+        self.assertEqual(self.pool.get_stats(), {"size": 1, "idle": 1})
+
+    def test_keep_only_minconn_idle(self):
+        first = self.pool.getconn()
+        second = self.pool.getconn()
+        self.pool.putconn(first)
+        self.pool.putconn(second)
+        self.assertEqual(self.pool.get_stats(), {"size": 1, "idle": 1})
+        self.assertTrue(second.closed)
+
+    def test_checkout_timeout(self):
+        first = self.pool.getconn()
+        second = self.pool.getconn()
+        with self.assertRaises(psycopg2.pool.PoolError):
+            self.pool.getconn()
+        self.pool.putconn(first)
+        self.pool.putconn(second)
+
+    def test_replace_closed_connection(self):
+        connection = self.pool.getconn()
+        self.pool.putconn(connection)
+        connection.close()
+        fresh = self.pool.getconn()
+        self.assertNotEqual(fresh, connection)
+        self.assertFalse(fresh.closed)
+        self.assertEqual(self.pool.get_stats(), {"size": 1, "idle": 0})
+        self.pool.putconn(fresh)
+
+    @mock.patch.dict("server.app.config", {"DB_POOL_PING_AFTER": 0})
+    def test_replace_dead_connection(self):
+        connection = self.pool.getconn()
+        self.pool.putconn(connection)
+        with mock.patch("server.database.is_healthy", side_effect=[False, True]):
+            fresh = self.pool.getconn()
+        self.assertNotEqual(fresh, connection)
+        self.assertTrue(connection.closed)
+        self.pool.putconn(fresh)
+
+    def test_reset_after_fork(self):
+        connection = self.pool.getconn()
+        self.pool.putconn(connection)
+        with mock.patch("server.database.os.getpid", return_value=-1):
+            fresh = self.pool.getconn()
+            self.assertNotEqual(fresh, connection)
+            self.pool.putconn(fresh)
+        connection.close()
+
+
+class GetConnectionTest(unittest.TestCase):
+    def test_discard_on_operational_error(self):
+        with mock.patch("server.database.POOL") as mock_pool:
+            with self.assertRaises(psycopg2.OperationalError):
+                with get_connection():
+                    raise psycopg2.OperationalError("server closed the connection")
+            self.assertEqual(mock_pool.discard.call_count, 1)
+            self.assertEqual(mock_pool.putconn.call_count, 0)
+
+    def test_rollback_on_error(self):
+        with mock.patch("server.database.POOL") as mock_pool:
+            with self.assertRaises(ValueError):
+                with get_connection():
+                    raise ValueError()
+            connection = mock_pool.getconn.return_value
+            self.assertEqual(connection.rollback.call_count, 1)
+            mock_pool.putconn.assert_called_with(connection)
+
+    def test_query(self):
+        with get_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            self.assertEqual(cursor.fetchone(), (1,))
+            cursor.close()
@@ -1,6 +1,9 @@
 import unittest
+import mock
+from time import sleep
 
-from server.database.settings import normalize_val
+from server.database import settings
+from server.database.settings import normalize_val, SettingsCache
 
 
 class NormalizeValTest(unittest.TestCase):
@@ -28,3 +31,66 @@ class NormalizeValTest(unittest.TestCase):
         self.assertEqual(normalize_val("False"), False)
         self.assertEqual(normalize_val("off"), False)
         self.assertEqual(normalize_val("Off"), False)
+
+
+class SettingsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = SettingsCache()
+        self.orig = settings.get_val("network_timeout")
+
+    def tearDown(self):
+        settings.upsert_val("network_timeout", self.orig)
+        if self.cache.listener is not None:
+            self.cache.listener.close()
+
+    def wait_for_change(self, key, val):
+        for _ in range(50):
+            if self.cache.get_all().get(key) == val:
+                return True
+            sleep(0.02)
+        return False
+
+    @mock.patch("server.database.settings.load_settings", return_value={"a": "1"})
+    def test_loads_once(self, mock_load):
+        self.assertEqual(self.cache.get_all(), {"a": "1"})
+        self.assertEqual(self.cache.get_all(), {"a": "1"})
+        self.assertEqual(mock_load.call_count, 1)
+
+    def test_notified_of_changes(self):
+        self.cache.get_all()
+        # written through another connection, as another process would
+        settings.upsert_val("network_timeout", "12")
+        self.assertTrue(self.wait_for_change("network_timeout", "12"))
+        settings.upsert_val("network_timeout", "13")
+        self.assertTrue(self.wait_for_change("network_timeout", "13"))
+
+    def test_invalidated_locally(self):
+        settings.upsert_val("network_timeout", "14")
+        self.assertEqual(settings.get_val("network_timeout"), 14)
+
+    @mock.patch("server.database.settings.load_settings", return_value={"a": "1"})
+    def test_reloads_when_listener_dies(self, mock_load):
+        self.cache.get_all()
+        self.cache.listener.close()
+        self.assertEqual(self.cache.get_all(), {"a": "1"})
+        self.assertEqual(self.cache.listener, None)
+        self.cache.get_all()
+        self.assertTrue(self.cache.listener is not None)
+        self.assertEqual(mock_load.call_count, 3)
+
+    @mock.patch("server.database.settings.load_settings", return_value={"a": "1"})
+    @mock.patch("server.database.settings.connect", side_effect=Exception("down"))
+    def test_uncached_without_listener(self, mock_connect, mock_load):
+        self.cache.get_all()
+        self.cache.get_all()
+        self.assertEqual(mock_load.call_count, 2)
+
+    @mock.patch("server.database.settings.load_settings", return_value={"a": "1"})
+    def test_reset_after_fork(self, mock_load):
+        self.cache.get_all()
+        listener = self.cache.listener
+        self.cache.pid = -1
+        self.cache.get_all()
+        self.assertTrue(self.cache.listener is not listener)
+        self.assertEqual(mock_load.call_count, 2)
+        listener.close()
@@ -0,0 +1,135 @@
+import unittest
+
+from psycopg2 import sql
+
+from server.database import (
+    get_connection,
+    prepare_list_statement,
+    encode_cursor,
+    gcodes,
+    printjobs,
+)
+
+
+# By default any plan that has to sort looks prohibitively expensive
+def get_plan_nodes(statement, disabled=("enable_sort", "enable_seqscan")):
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        for setting in disabled:
+            cursor.execute(sql.SQL("SET {} = off").format(sql.Identifier(setting)))
+        try:
+            cursor.execute(sql.SQL("EXPLAIN (FORMAT JSON) {}").format(statement))
+            plan = cursor.fetchone()[0][0]["Plan"]
+        finally:
+            for setting in disabled:
+                cursor.execute(sql.SQL("RESET {}").format(sql.Identifier(setting)))
+            cursor.close()
+    nodes = []
+    pending = [plan]
+    while pending:
+        node = pending.pop()
+        nodes.append((node["Node Type"], node.get("Index Name")))
+        pending.extend(node.get("Plans", []))
+    return nodes
+
+
+class SortIndexesTest(unittest.TestCase):
+    def assertIndexOrder(
+        self, tablename, column, order_by, start_with=None, column_types=None
+    ):
+        statement = prepare_list_statement(
+            tablename,
+            ["id", column],
+            order_by=order_by,
+            limit=20,
+            start_with=start_with,
+            column_types=column_types,
+        )
+        nodes = get_plan_nodes(statement)
+        self.assertTrue(
+            all(node_type != "Sort" for node_type, _ in nodes),
+            "%s is sorted in memory: %s" % (order_by, nodes),
+        )
+        expected = (
+            "%s_pkey" % tablename
+            if column == "id"
+            else "%s_%s_id_idx" % (tablename, column)
+        )
+        self.assertTrue(
+            any(index == expected for _, index in nodes),
+            "%s does not use %s: %s" % (order_by, expected, nodes),
+        )
+
+    def test_gcodes(self):
+        for column in ["id"] + gcodes.SORTABLE_COLUMNS:
+            self.assertIndexOrder("gcodes", column, column)
+            self.assertIndexOrder("gcodes", column, "-%s" % column)
+
+    def test_printjobs(self):
+        for column in ["id"] + printjobs.SORTABLE_COLUMNS:
+            self.assertIndexOrder("printjobs", column, column)
+            self.assertIndexOrder("printjobs", column, "-%s" % column)
+
+    def test_keyset_page(self):
+        self.assertIndexOrder(
+            "gcodes", "filename", "-filename", encode_cursor("file.gcode", 10)
+        )
+        self.assertIndexOrder(
+            "printjobs",
+            "started",
+            "started",
+            encode_cursor("2019-10-01T12:00:00+00:00", 10),
+            printjobs.COLUMN_TYPES,
+        )
+
+    def test_keyset_page_empty_values(self):
+        # the filled and the empty part are each looked up by the index
+        for order_by, value in [
+            ("bed_temperature", 60),
+            ("-bed_temperature", None),
+        ]:
+            statement = prepare_list_statement(
+                "gcodes",
+                ["id", "bed_temperature"],
+                order_by=order_by,
+                limit=20,
+                start_with=encode_cursor(value, 10),
+                column_types=gcodes.COLUMN_TYPES,
+                nullable_columns=gcodes.NULLABLE_COLUMNS,
+            )
+            nodes = get_plan_nodes(statement)
+            indexes = [
+                index for _, index in nodes if index == "gcodes_bed_temperature_id_idx"
+            ]
+            self.assertEqual(len(indexes), 2, "%s: %s" % (order_by, nodes))
+            self.assertTrue(
+                all(node_type != "Sort" for node_type, _ in nodes),
+                "%s is sorted in memory: %s" % (order_by, nodes),
+            )
+
+    def test_reject_unindexed_column(self):
+        with self.assertRaises(ValueError):
+            prepare_list_statement(
+                "gcodes",
+                ["id", "absolute_path"],
+                order_by="absolute_path",
+                sortable_columns=gcodes.SORTABLE_COLUMNS,
+            )
+
+
+class JsonIndexesTest(unittest.TestCase):
+    def test_containment_filter(self):
+        for column in ["gcode_data", "printer_data"]:
+            statement = prepare_list_statement(
+                "printjobs",
+                ["id", column],
+                limit=20,
+                filter="%s.name:file" % column,
+                column_types=printjobs.COLUMN_TYPES,
+            )
+            # the tiny test tables are always cheaper to scan whole
+            nodes = get_plan_nodes(statement, disabled=("enable_seqscan",))
+            self.assertTrue(
+                any(index == "printjobs_%s_idx" % column for _, index in nodes),
+                "%s filter does not use the index: %s" % (column, nodes),
+            )
@@ -1,7 +1,7 @@
 import unittest
 
-from server.drivers import get_printer_instance
-from server.drivers.octoprint import Octoprint
+from server.drivers import get_printer_instance, get_async_printer_instance
+from server.drivers.octoprint import Octoprint, AsyncOctoprint
 
 
 class GetWithFallbackTest(unittest.TestCase):
@@ -20,3 +20,19 @@ class GetWithFallbackTest(unittest.TestCase):
             {"client": "octoprint", "hostname": "octoprinter", "ip": "1.2.3.4"}
         )
         self.assertTrue(isinstance(octoprinter, Octoprint))
+
+
+class GetAsyncInstanceTest(unittest.TestCase):
+    def test_throws_on_unknown_client(self):
+        with self.assertRaises(RuntimeError) as context:
+            get_async_printer_instance({"client": "unknown"})
+            self.assertTrue("unknown client unknown" in str(context.exception))
+
+    def test_returns_async_octoprint_instance(self):
+        session = object()
+        octoprinter = get_async_printer_instance(
+            {"client": "octoprint", "hostname": "octoprinter", "ip": "1.2.3.4"},
+            session=session,
+        )
+        self.assertTrue(isinstance(octoprinter, AsyncOctoprint))
+        self.assertIs(octoprinter.session, session)
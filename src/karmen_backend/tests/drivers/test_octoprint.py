@@ -1,11 +1,14 @@
 import os
+import asyncio
 import unittest
 import json
 import mock
 import tempfile
+import threading
 
 from server.drivers.utils import PrinterClientInfo, PrinterDriverException
-from server.drivers.octoprint import Octoprint
+from server.drivers.octoprint import Octoprint, AsyncOctoprint
+from server.services.network import AsyncResponse
 
 
 class OctoprintConstructor(unittest.TestCase):
@@ -456,6 +459,26 @@ class OctoprintUploadAndStartJobTest(unittest.TestCase):
         self.assertEqual(kwargs["data"], {"path": "karmen", "print": True})
         self.assertEqual(kwargs["files"]["file"].name, self.file_mock.name)
 
+    @mock.patch("server.drivers.octoprint.get_uri")
+    @mock.patch("server.drivers.octoprint.post_uri")
+    def test_upload_job_filename(self, mock_post_uri, mock_get_uri):
+        mock_get_uri.return_value.status_code = 200
+        mock_get_uri.return_value.json.return_value = {
+            "state": {"text": "Operational"},
+            "temperature": {},
+        }
+        mock_post_uri.return_value.status_code = 201
+        printer = Octoprint("192.168.1.15", client=PrinterClientInfo(connected=True))
+        result = printer.upload_and_start_job(
+            self.file_mock.name, filename="whistle_v2.gcode"
+        )
+        self.assertTrue(result)
+        args, kwargs = mock_post_uri.call_args
+        filename, gcode = kwargs["files"]["file"]
+        self.assertEqual(filename, "whistle_v2.gcode")
+        self.assertEqual(gcode.name, self.file_mock.name)
+        gcode.close()
+
     @mock.patch("server.drivers.octoprint.get_uri")
     @mock.patch("server.drivers.octoprint.post_uri")
     def test_upload_job_path_ok(self, mock_post_uri, mock_get_uri):
@@ -614,3 +637,276 @@ class OctoprintModifyCurrentJobTest(unittest.TestCase):
             printer.modify_current_job("random")
 
         self.assertTrue("random is not allowed" in str(ctx.exception))
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def make_async_call(responses):
+    async def mock_call(ip, endpoint="/", **kwargs):
+        for prefix, response in responses.items():
+            if endpoint.startswith(prefix):
+                return response
+        return None
+
+    return mock_call
+
+
+class AsyncOctoprintTest(unittest.TestCase):
+    @mock.patch("server.drivers.octoprint.async_get_uri")
+    def test_is_alive_sniffs(self, mock_get_uri):
+        mock_get_uri.side_effect = make_async_call(
+            {"/api/version": AsyncResponse(200, b'{"text": "OctoPrint 1.3.11"}')}
+        )
+        printer = AsyncOctoprint("192.168.1.15")
+        self.assertTrue(run(printer.is_alive()))
+        self.assertTrue(printer.client.connected)
+        self.assertEqual(printer.client.version, {"text": "OctoPrint 1.3.11"})
+        self.assertEqual(mock_get_uri.call_count, 2)
+
+    @mock.patch("server.drivers.octoprint.async_get_uri")
+    def test_is_alive_disconnected(self, mock_get_uri):
+        mock_get_uri.side_effect = make_async_call({})
+        printer = AsyncOctoprint(
+            "192.168.1.15", client=PrinterClientInfo(connected=True)
+        )
+        self.assertFalse(run(printer.is_alive()))
+        self.assertFalse(printer.client.connected)
+
+    @mock.patch("server.drivers.octoprint.async_get_uri")
+    def test_sniff_access_protected(self, mock_get_uri):
+        mock_get_uri.side_effect = make_async_call(
+            {
+                "/api/version": AsyncResponse(403, b""),
+                "/api/settings": AsyncResponse(200, b"{}"),
+            }
+        )
+        printer = AsyncOctoprint("192.168.1.15")
+        run(printer.sniff())
+        self.assertTrue(printer.client.connected)
+        self.assertTrue(printer.client.read_only)
+
+    @mock.patch("server.drivers.octoprint.async_get_uri")
+    def test_same_shapes_as_sync_driver(self, mock_get_uri):
+        mock_get_uri.side_effect = make_async_call(
+            {
+                "/api/printer": AsyncResponse(
+                    200,
+                    json.dumps(
+                        {"state": {"text": "Printing"}, "temperature": {"bed": 60}}
+                    ).encode("utf-8"),
+                ),
+                "/api/settings": AsyncResponse(
+                    200,
+                    json.dumps(
+                        {
+                            "webcam": {
+                                "webcamEnabled": True,
+                                "streamUrl": "/webcam/?action=stream",
+                                "flipH": False,
+                                "flipV": True,
+                                "rotate90": False,
+                            }
+                        }
+                    ).encode("utf-8"),
+                ),
+                "/api/job": AsyncResponse(
+                    200,
+                    json.dumps(
+                        {
+                            "state": "Printing",
+                            "job": {"file": {"display": "file.gcode"}},
+                            "progress": {
+                                "completion": 50,
+                                "printTimeLeft": 10,
+                                "printTime": 10,
+                            },
+                        }
+                    ).encode("utf-8"),
+                ),
+            }
+        )
+        printer = AsyncOctoprint(
+            "192.168.1.15", client=PrinterClientInfo(connected=True)
+        )
+        self.assertEqual(
+            run(printer.status()), {"state": "Printing", "temperature": {"bed": 60}}
+        )
+        self.assertEqual(
+            run(printer.webcam()),
+            {
+                "message": "OK",
+                "stream": "http://192.168.1.15/webcam/?action=stream",
+                "flipHorizontal": False,
+                "flipVertical": True,
+                "rotate90": False,
+            },
+        )
+        self.assertEqual(
+            run(printer.job()),
+            {
+                "name": "file.gcode",
+                "completion": 50,
+                "printTimeLeft": 10,
+                "printTime": 10,
+            },
+        )
+
+    @mock.patch("server.drivers.octoprint.async_get_uri")
+    def test_status_disconnect(self, mock_get_uri):
+        mock_get_uri.side_effect = make_async_call({})
+        printer = AsyncOctoprint(
+            "192.168.1.15", client=PrinterClientInfo(connected=True)
+        )
+        self.assertEqual(
+            run(printer.status()),
+            {"state": "Printer is not responding", "temperature": {}},
+        )
+        self.assertFalse(printer.client.connected)
+
+    @mock.patch("server.drivers.octoprint.async_post_uri")
+    @mock.patch("server.drivers.octoprint.async_get_uri")
+    def test_upload_job_ok(self, mock_get_uri, mock_post_uri):
+        mock_get_uri.side_effect = make_async_call(
+            {
+                "/api/printer": AsyncResponse(
+                    200, b'{"state": {"text": "Operational"}, "temperature": {}}'
+                )
+            }
+        )
+        mock_post_uri.side_effect = make_async_call(
+            {"/api/files/local": AsyncResponse(201, b"")}
+        )
+        with tempfile.NamedTemporaryFile() as gcode:
+            printer = AsyncOctoprint(
+                "192.168.1.15", client=PrinterClientInfo(connected=True)
+            )
+            self.assertTrue(run(printer.upload_and_start_job(gcode.name, "a/b")))
+        args, kwargs = mock_post_uri.call_args
+        self.assertEqual(kwargs["data"], {"path": "karmen/a/b", "print": True})
+
+    @mock.patch("server.drivers.octoprint.async_post_uri")
+    @mock.patch("server.drivers.octoprint.async_get_uri")
+    def test_upload_job_file_off_loop(self, mock_get_uri, mock_post_uri):
+        mock_get_uri.side_effect = make_async_call(
+            {
+                "/api/printer": AsyncResponse(
+                    200, b'{"state": {"text": "Operational"}, "temperature": {}}'
+                )
+            }
+        )
+        mock_post_uri.side_effect = make_async_call(
+            {"/api/files/local": AsyncResponse(201, b"")}
+        )
+        threads = []
+        real_open = open
+
+        def record_open(name, *args, **kwargs):
+            if name == gcode.name:
+                threads.append(threading.get_ident())
+            return real_open(name, *args, **kwargs)
+
+        with tempfile.NamedTemporaryFile() as gcode:
+            printer = AsyncOctoprint(
+                "192.168.1.15", client=PrinterClientInfo(connected=True)
+            )
+            with mock.patch("builtins.open", side_effect=record_open):
+                self.assertTrue(run(printer.upload_and_start_job(gcode.name)))
+        # the event loop runs in this thread
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+        self.assertTrue(mock_post_uri.call_args[1]["files"]["file"].closed)
+
+    @mock.patch("server.drivers.octoprint.async_post_uri")
+    def test_modify_job_toggle_ok(self, mock_post_uri):
+        mock_post_uri.side_effect = make_async_call(
+            {"/api/job": AsyncResponse(204, b"")}
+        )
+        printer = AsyncOctoprint(
+            "192.168.1.15", client=PrinterClientInfo(connected=True)
+        )
+        self.assertTrue(run(printer.modify_current_job("toggle")))
+        args, kwargs = mock_post_uri.call_args
+        self.assertEqual(kwargs["json"], {"command": "pause", "action": "toggle"})
+
+    def test_unknown_action(self):
+        printer = AsyncOctoprint(
+            "192.168.1.15", client=PrinterClientInfo(connected=True)
+        )
+        with self.assertRaises(PrinterDriverException):
+            run(printer.modify_current_job("random"))
+
+
+class OctoprintPushMessageTest(unittest.TestCase):
+    def test_ignore_other_messages(self):
+        printer = Octoprint("192.168.1.15")
+        self.assertEqual(printer.handle_push_message({"event": {}}), {})
+
+    def test_operational(self):
+        printer = Octoprint("192.168.1.15")
+        self.assertEqual(
+            printer.handle_push_message(
+                {
+                    "current": {
+                        "state": {"text": "Operational"},
+                        "temps": [{"time": 1, "tool0": {"actual": 20}}],
+                    }
+                }
+            ),
+            {
+                "status": {
+                    "state": "Operational",
+                    "temperature": {"tool0": {"actual": 20}},
+                },
+                "job": {},
+            },
+        )
+
+    def test_keep_temperature(self):
+        printer = Octoprint("192.168.1.15")
+        printer.handle_push_message(
+            {
+                "current": {
+                    "state": {"text": "Operational"},
+                    "temps": [{"time": 1, "tool0": {"actual": 20}}],
+                }
+            }
+        )
+        result = printer.handle_push_message(
+            {"current": {"state": {"text": "Operational"}, "temps": []}}
+        )
+        self.assertEqual(result["status"]["temperature"], {"tool0": {"actual": 20}})
+
+    def test_printing(self):
+        printer = Octoprint("192.168.1.15")
+        result = printer.handle_push_message(
+            {
+                "current": {
+                    "state": {"text": "Printing"},
+                    "job": {"file": {"display": "file.gcode"}},
+                    "progress": {
+                        "completion": 10,
+                        "printTimeLeft": 100,
+                        "printTime": 10,
+                    },
+                }
+            }
+        )
+        self.assertEqual(
+            result["job"],
+            {
+                "name": "file.gcode",
+                "completion": 10,
+                "printTimeLeft": 100,
+                "printTime": 10,
+            },
+        )
+
+    def test_malformed(self):
+        printer = Octoprint("192.168.1.15")
+        self.assertEqual(printer.handle_push_message({"current": {"state": {}}}), {})
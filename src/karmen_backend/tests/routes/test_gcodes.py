@@ -6,7 +6,9 @@ import mock
 from time import time
 
 from server import app
-from server.database import gcodes, printjobs
+from server.database import gcodes, printjobs, encode_cursor
+from server.tasks.process_gcode import get_pipeline
+from tests.services.test_gcodethumbnail import make_png, make_block
 
 
 class ListRoute(unittest.TestCase):
@@ -71,6 +73,11 @@ class ListRoute(unittest.TestCase):
             response = c.get("/gcodes?limit=3&order_by=id,filename")
             self.assertEqual(response.status_code, 400)
 
+    def test_order_by_unindexed_column(self):
+        with app.test_client() as c:
+            response = c.get("/gcodes?order_by=absolute_path")
+            self.assertEqual(response.status_code, 400)
+
     def test_start_with(self):
         with app.test_client() as c:
             response = c.get("/gcodes?limit=3&start_with=2")
@@ -85,15 +92,18 @@ class ListRoute(unittest.TestCase):
             self.assertTrue(
                 response.json["items"][2]["id"] > response.json["items"][1]["id"]
             )
+            next_id = int(response.json["items"][2]["id"]) + 1
             self.assertEqual(
                 response.json["next"],
-                "/gcodes?limit=3&start_with=%s"
-                % str(int(response.json["items"][2]["id"]) + 1),
+                "/gcodes?limit=3&start_with=%s" % encode_cursor(next_id, next_id),
             )
 
     def test_start_with_non_existent(self):
         with app.test_client() as c:
-            response = c.get("/gcodes?limit=3&start_with=99999&order_by=uploaded")
+            response = c.get(
+                "/gcodes?limit=3&start_with=%s&order_by=uploaded"
+                % encode_cursor("2999-01-01T00:00:00+00:00", 99999)
+            )
             self.assertEqual(response.status_code, 200)
             self.assertTrue("items" in response.json)
             self.assertTrue(len(response.json["items"]) == 0)
@@ -120,6 +130,142 @@ class ListRoute(unittest.TestCase):
                 response.json["items"][2]["id"] > response.json["items"][1]["id"]
             )
 
+    def test_paginate_ties(self):
+        rand = repr(round(time()))
+        gcode_ids = [
+            gcodes.add_gcode(
+                path="a/b/c",
+                filename="tie-%s" % rand,
+                display="file-display",
+                absolute_path="/ab/a/b/c",
+                size=123,
+            )
+            for _ in range(0, 5)
+        ]
+        seen = []
+        with app.test_client() as c:
+            uri = "/gcodes?limit=2&order_by=-size&filter=filename:tie-%s" % rand
+            while uri:
+                response = c.get(uri)
+                self.assertEqual(response.status_code, 200)
+                seen.extend([item["id"] for item in response.json["items"]])
+                uri = response.json.get("next")
+        self.assertEqual(seen, sorted(gcode_ids, reverse=True))
+        for gcode_id in gcode_ids:
+            gcodes.delete_gcode(gcode_id)
+
+    def paginate(self, uri):
+        seen = []
+        with app.test_client() as c:
+            while uri:
+                response = c.get(uri)
+                self.assertEqual(response.status_code, 200)
+                seen.extend([item["id"] for item in response.json["items"]])
+                uri = response.json.get("next")
+                # a cursor that does not move on would page forever
+                self.assertTrue(len(seen) <= 100, "%s does not end" % uri)
+        return seen
+
+    def test_paginate_empty_values(self):
+        rand = repr(round(time()))
+        values = [None, 60, None, 60, 90, None]
+        gcode_ids = []
+        for value in values:
+            gcode_id = gcodes.add_gcode(
+                path="a/b/c",
+                filename="empty-%s" % rand,
+                display="file-display",
+                absolute_path="/ab/a/b/c",
+                size=123,
+            )
+            gcode_ids.append(gcode_id)
+            gcodes.update_gcode_stage(
+                gcode_id,
+                "metadata",
+                "done",
+                {
+                    "filament_type": None if value is None else "PLA %s" % value,
+                    "printer_model": None if value is None else "MK3 %s" % value,
+                    "bed_temperature": value,
+                    "extruder_temperature": value,
+                    "print_time": value,
+                },
+            )
+        # the empty ones come last, just as in the index
+        filled = sorted((v, i) for v, i in zip(values, gcode_ids) if v is not None)
+        ascending = [i for _, i in filled] + [
+            i for v, i in zip(values, gcode_ids) if v is None
+        ]
+        for column in [
+            "filament_type",
+            "printer_model",
+            "bed_temperature",
+            "extruder_temperature",
+            "print_time",
+        ]:
+            for limit in [1, 2, 4]:
+                uri = "/gcodes?limit=%s&order_by=%s&filter=filename:empty-%s"
+                self.assertEqual(
+                    self.paginate(uri % (limit, column, rand)), ascending, column
+                )
+                self.assertEqual(
+                    self.paginate(uri % (limit, "-%s" % column, rand)),
+                    list(reversed(ascending)),
+                    column,
+                )
+        for gcode_id in gcode_ids:
+            gcodes.delete_gcode(gcode_id)
+
+    def test_paginate_filament_weight(self):
+        rand = repr(round(time()))
+        # none of these is exact in a real column
+        weights = [0.01, 1.23, None, 0.01, 2.7]
+        gcode_ids = []
+        for weight in weights:
+            gcode_id = gcodes.add_gcode(
+                path="a/b/c",
+                filename="weight-%s" % rand,
+                display="file-display",
+                absolute_path="/ab/a/b/c",
+                size=123,
+            )
+            gcode_ids.append(gcode_id)
+            gcodes.update_gcode_stage(
+                gcode_id, "analysis", "done", {"filament_weight": weight}
+            )
+        filled = sorted((w, i) for w, i in zip(weights, gcode_ids) if w is not None)
+        ascending = [i for _, i in filled] + [
+            i for w, i in zip(weights, gcode_ids) if w is None
+        ]
+        uri = "/gcodes?limit=1&order_by=%s&filter=filename:weight-%s"
+        self.assertEqual(self.paginate(uri % ("filament_weight", rand)), ascending)
+        self.assertEqual(
+            self.paginate(uri % ("-filament_weight", rand)), list(reversed(ascending))
+        )
+        for gcode_id in gcode_ids:
+            gcodes.delete_gcode(gcode_id)
+
+    def test_ignore_start_with_other_type(self):
+        # forged, or made for another ordering column
+        with app.test_client() as c:
+            for order_by, value in [
+                ("uploaded", "abc"),
+                ("uploaded", "2019-02-30T00:00:00+00:00"),
+                ("size", "abc"),
+                ("-size", 1.5),
+                ("filename", 12),
+                ("bed_temperature", "abc"),
+                ("filament_weight", "abc"),
+                ("display", None),
+                ("id", "abc"),
+            ]:
+                response = c.get(
+                    "/gcodes?limit=3&order_by=%s&start_with=%s"
+                    % (order_by, encode_cursor(value, 1))
+                )
+                self.assertEqual(response.status_code, 200, order_by)
+                self.assertTrue("items" in response.json)
+
     def test_ignore_start_with_str(self):
         with app.test_client() as c:
             response = c.get("/gcodes?limit=3&start_with=asdfasdf")
@@ -210,6 +356,42 @@ class ListRoute(unittest.TestCase):
             for gcode_id in gcode_ids:
                 gcodes.delete_gcode(gcode_id)
 
+    def test_filter_typed_columns(self):
+        gcode_id = gcodes.add_gcode(
+            path="a/b/c",
+            filename="typed.gcode",
+            display="file-display",
+            absolute_path="/ab/a/b/c",
+            size=987654,
+        )
+        gcode = gcodes.get_gcode(gcode_id)
+        with app.test_client() as c:
+            response = c.get("/gcodes?filter=size:987654")
+            self.assertEqual([i["id"] for i in response.json["items"]], [gcode_id])
+            response = c.get("/gcodes?filter=id:%s" % gcode_id)
+            self.assertEqual([i["id"] for i in response.json["items"]], [gcode_id])
+            response = c.get(
+                "/gcodes?filter=uploaded:%s&order_by=-id&limit=1"
+                % gcode["uploaded"].strftime("%Y-%m-%d")
+            )
+            self.assertEqual([i["id"] for i in response.json["items"]], [gcode_id])
+            response = c.get("/gcodes?filter=size:big")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["items"]), 0)
+            response = c.get("/gcodes?filter=uploaded:yesterday")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["items"]), 0)
+        gcodes.delete_gcode(gcode_id)
+
+    def test_filter_no_wildcards(self):
+        with app.test_client() as c:
+            response = c.get("/gcodes?filter=filename:%25")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["items"]), 0)
+            response = c.get("/gcodes?filter=filename:file_")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["items"]), 0)
+
     def test_filter_ignore_bad_column(self):
         with app.test_client() as c:
             response = c.get("/gcodes?filter=random:file1")
@@ -257,15 +439,19 @@ class CreateRoute(unittest.TestCase):
             "display": "display",
             "absolute_path": "abspath",
             "size": 123,
+            "hash": "00" * 32,
         },
     )
-    def test_upload(self, mocked_save):
+    @mock.patch("server.routes.gcodes.process_gcode")
+    def test_upload(self, mocked_process, mocked_save):
         with app.test_client() as c:
             data = dict(file=(io.BytesIO(b"my file contents"), "some.gcode"))
             response = c.post("/gcodes", data=data, content_type="multipart/form-data")
             self.assertEqual(response.status_code, 201)
             args, kwargs = mocked_save.call_args
             self.assertEqual(args[1], "/")
+            self.assertEqual(response.json["state"], "processing")
+            mocked_process.assert_called_once_with(response.json["id"])
 
     @mock.patch(
         "server.routes.gcodes.files.save",
@@ -275,9 +461,11 @@ class CreateRoute(unittest.TestCase):
             "display": "display",
             "absolute_path": "abspath",
             "size": 123,
+            "hash": "00" * 32,
         },
     )
-    def test_upload_path(self, mocked_save):
+    @mock.patch("server.routes.gcodes.process_gcode")
+    def test_upload_path(self, mocked_process, mocked_save):
         with app.test_client() as c:
             data = dict(
                 file=(io.BytesIO(b"my file contents"), "some.gcode"), path="/a/b"
@@ -320,6 +508,221 @@ class CreateRoute(unittest.TestCase):
             self.assertEqual(response.status_code, 415)
 
 
+def process_inline(gcode_id):
+    for task in get_pipeline(gcode_id):
+        task()
+
+
+class ContentAddressedUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.config = mock.patch.dict(app.config, {"UPLOAD_FOLDER": self.folder.name})
+        self.config.start()
+        # the processing runs right in the request instead of a worker
+        self.processing = mock.patch(
+            "server.routes.gcodes.process_gcode", side_effect=process_inline
+        )
+        self.processing.start()
+
+    def tearDown(self):
+        self.processing.stop()
+        self.config.stop()
+        self.folder.cleanup()
+
+    # every request has its own client, the request is closed once it is done
+    def upload(self, contents, filename):
+        with app.test_client() as c:
+            data = dict(file=(io.BytesIO(contents), filename))
+            response = c.post("/gcodes", data=data, content_type="multipart/form-data")
+            self.assertEqual(response.status_code, 201)
+            return response.json
+
+    def delete(self, gcode_id):
+        with app.test_client() as c:
+            response = c.delete("/gcodes/%s" % gcode_id)
+            self.assertEqual(response.status_code, 204)
+
+    def get_stored(self):
+        stored = []
+        for root, _, names in os.walk(self.folder.name):
+            stored.extend(os.path.join(root, name) for name in names)
+        return stored
+
+    def test_same_content_stored_once(self):
+        contents = ("G28\n%s\n" % time()).encode("utf-8")
+        first = self.upload(contents, "first.gcode")
+        second = self.upload(contents, "second.gcode")
+        self.assertEqual(first["absolute_path"], second["absolute_path"])
+        self.assertEqual(first["filename"], "first.gcode")
+        self.assertEqual(second["filename"], "second.gcode")
+        self.assertEqual(first["size"], len(contents))
+        self.assertEqual(self.get_stored(), [first["absolute_path"]])
+
+        self.delete(first["id"])
+        # still used by the second one
+        self.assertEqual(self.get_stored(), [second["absolute_path"]])
+        with app.test_client() as c:
+            response = c.get("/gcodes/%s/data" % second["id"])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, contents)
+            response.close()
+
+        self.delete(second["id"])
+        self.assertEqual(self.get_stored(), [])
+
+    def test_concurrent_delete_of_same_content(self):
+        contents = ("G28\n%s\n" % time()).encode("utf-8")
+        first = self.upload(contents, "first.gcode")
+        add_gcode = gcodes.add_gcode
+
+        # the only other gcode with the content goes away after the second
+        # upload found the blob in place but before it is referenced
+        def delete_first_then_add(**kwargs):
+            self.delete(first["id"])
+            return add_gcode(**kwargs)
+
+        with mock.patch(
+            "server.routes.gcodes.gcodes.add_gcode", side_effect=delete_first_then_add
+        ):
+            second = self.upload(contents, "second.gcode")
+        self.assertEqual(self.get_stored(), [second["absolute_path"]])
+        with app.test_client() as c:
+            response = c.get("/gcodes/%s/data" % second["id"])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, contents)
+            response.close()
+        self.delete(second["id"])
+
+    def get(self, gcode_id):
+        with app.test_client() as c:
+            response = c.get("/gcodes/%s" % gcode_id)
+            self.assertEqual(response.status_code, 200)
+            return response.json
+
+    def test_processing(self):
+        uploaded = self.upload(b"G28\nG1 X10 E1\n", "processing.gcode")
+        # returned before anything is derived from the file
+        self.assertEqual(uploaded["state"], "processing")
+        self.assertEqual(
+            uploaded["stages"],
+            {
+                "hash": "done",
+                "metadata": "pending",
+                "thumbnail": "pending",
+                "analysis": "pending",
+            },
+        )
+        self.assertEqual(uploaded["filament_length"], None)
+        processed = self.get(uploaded["id"])
+        self.assertEqual(processed["state"], "ready")
+        self.assertEqual(
+            processed["stages"],
+            {
+                "hash": "done",
+                "metadata": "done",
+                "thumbnail": "done",
+                "analysis": "done",
+            },
+        )
+        self.assertEqual(processed["filament_length"], 1)
+        self.delete(uploaded["id"])
+
+    @mock.patch(
+        "server.tasks.process_gcode.gcodeanalysis.analyze",
+        side_effect=ValueError("Broken"),
+    )
+    def test_processing_failed(self, mocked_analyze):
+        uploaded = self.upload(b"G28\n; printer_model = MK3\n", "failed.gcode")
+        processed = self.get(uploaded["id"])
+        self.assertEqual(processed["state"], "failed")
+        self.assertEqual(processed["stages"]["metadata"], "done")
+        self.assertEqual(processed["stages"]["analysis"], "failed")
+        self.assertEqual(processed["printer_model"], "MK3")
+        self.delete(uploaded["id"])
+
+    def test_metadata(self):
+        model = "MK%s" % time()
+        contents = (
+            "; generated by PrusaSlicer 2.2.0\nM140 S60\nM104 S215\nG28 W\n"
+            "; filament_type = PETG\n; printer_model = %s\n" % model
+        ).encode("utf-8")
+        uploaded = self.get(self.upload(contents, "metadata.gcode")["id"])
+        self.assertEqual(uploaded["filament_type"], "PETG")
+        self.assertEqual(uploaded["printer_model"], model)
+        self.assertEqual(uploaded["bed_temperature"], 60)
+        self.assertEqual(uploaded["extruder_temperature"], 215)
+        with app.test_client() as c:
+            response = c.get(
+                "/gcodes?filter=printer_model:%s&order_by=-bed_temperature" % model
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [g["id"] for g in response.json["items"]], [uploaded["id"]]
+            )
+        self.delete(uploaded["id"])
+
+    def test_analysis(self):
+        contents = (
+            "G90\nM83\nG1 Z0.2\nG1 X10 Y10\nG1 X20 Y10 E1.5 F1200\n"
+            "G1 X20 Y20 E1.5\nG1 Z0.4\nG1 X10 Y20 E1\n; filament_type = PLA\n"
+        ).encode("utf-8")
+        uploaded = self.get(self.upload(contents, "analysis.gcode")["id"])
+        self.assertEqual(uploaded["filament_length"], 4)
+        self.assertEqual(uploaded["layer_count"], 2)
+        self.assertEqual(
+            uploaded["bounding_box"], {"min": [10, 10, 0.2], "max": [20, 20, 0.4]}
+        )
+        self.assertTrue(uploaded["print_time"] > 0)
+        with app.test_client() as c:
+            response = c.get("/gcodes?order_by=-print_time&fields=id,print_time")
+            self.assertEqual(response.status_code, 200)
+        self.delete(uploaded["id"])
+
+    def test_thumbnail(self):
+        image = make_png(16, 16)
+        contents = make_block(image, 16, 16) + ("G28\n; %s\n" % time()).encode()
+        uploaded = self.get(self.upload(contents, "thumbnail.gcode")["id"])
+        url = "/gcodes/%s/thumbnail" % uploaded["id"]
+        self.assertEqual(uploaded["thumbnail"], url)
+        with app.test_client() as c:
+            response = c.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, "image/png")
+            self.assertEqual(response.data, image)
+            self.assertTrue(response.cache_control.public)
+            self.assertEqual(response.cache_control.max_age, 365 * 24 * 3600)
+            etag = response.headers["ETag"]
+            response.close()
+            response = c.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+            response.close()
+            response = c.get(
+                "/gcodes?filter=id:%s&fields=id,thumbnail" % uploaded["id"]
+            )
+            self.assertEqual(
+                response.json["items"], [{"id": uploaded["id"], "thumbnail": url}]
+            )
+        self.delete(uploaded["id"])
+        # removed together with the file
+        self.assertEqual(self.get_stored(), [])
+
+    def test_no_thumbnail(self):
+        uploaded = self.get(self.upload(b"G28\n", "no-thumbnail.gcode")["id"])
+        self.assertTrue("thumbnail" not in uploaded)
+        with app.test_client() as c:
+            response = c.get("/gcodes/%s/thumbnail" % uploaded["id"])
+            self.assertEqual(response.status_code, 404)
+        self.delete(uploaded["id"])
+
+    def test_rejected_upload_not_kept(self):
+        with app.test_client() as c:
+            data = dict(file=(io.BytesIO(b"G28\n"), "some.txt"))
+            response = c.post("/gcodes", data=data, content_type="multipart/form-data")
+            self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.get_stored(), [])
+
+
 class DeleteRoute(unittest.TestCase):
     def test_delete(self):
         gcode_id = gcodes.add_gcode(
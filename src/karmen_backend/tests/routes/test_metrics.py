@@ -0,0 +1,52 @@
+import unittest
+import mock
+
+from server import app
+from server.database import instrumentation
+
+
+class MetricsRoute(unittest.TestCase):
+    @mock.patch("server.database.instrumentation.redis")
+    def test_metrics(self, mock_redis):
+        mock_redis.smembers.return_value = {b"printjobs.get_printjobs"}
+        mock_redis.pipeline.return_value.execute.return_value = [
+            {b"count": b"1", b"rows": b"3", b"ms": b"1.5", b"le_5": b"1"}
+        ]
+        with app.test_client() as c:
+            response = c.get("/metrics")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json["queries"]["printjobs.get_printjobs"]["count"], 1
+            )
+            self.assertTrue("size" in response.json["pool"])
+            self.assertTrue("idle" in response.json["pool"])
+            for key in ["new", "reused", "sessions"]:
+                self.assertTrue(key in response.json["printer_connections"])
+
+    @mock.patch("server.database.instrumentation.redis")
+    def test_metrics_redis_down(self, mock_redis):
+        mock_redis.smembers.side_effect = Exception("down")
+        with app.test_client() as c:
+            response = c.get("/metrics")
+            self.assertEqual(response.status_code, 503)
+
+
+class ServerTimingTest(unittest.TestCase):
+    def test_debug(self):
+        with mock.patch.dict(app.config, {"DEBUG": True}):
+            with app.test_client() as c:
+                response = c.get("/printjobs?limit=1")
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.headers["Server-Timing"].startswith("db;dur="))
+                self.assertTrue('desc="1 queries"' in response.headers["Server-Timing"])
+
+    def test_no_queries(self):
+        with mock.patch.dict(app.config, {"DEBUG": True}):
+            with app.test_client() as c:
+                response = c.get("/")
+                self.assertTrue("Server-Timing" not in response.headers)
+
+    def test_not_debug(self):
+        with app.test_client() as c:
+            response = c.get("/printjobs?limit=1")
+            self.assertTrue("Server-Timing" not in response.headers)
@@ -25,9 +25,11 @@ class FilesLocalRoute(unittest.TestCase):
             "display": "display",
             "absolute_path": "abspath",
             "size": 123,
+            "hash": "00" * 32,
         },
     )
-    def test_upload(self, mocked_save):
+    @mock.patch("server.routes.octoprintemulator.process_gcode")
+    def test_upload(self, mocked_process, mocked_save):
         with app.test_client() as c:
             data = dict(file=(io.BytesIO(b"my file contents"), "some.gcode"))
             response = c.post(
@@ -38,6 +40,7 @@ class FilesLocalRoute(unittest.TestCase):
             self.assertEqual(response.status_code, 201)
             args, kwargs = mocked_save.call_args
             self.assertEqual(args[1], "/")
+            self.assertEqual(mocked_process.call_count, 1)
 
     @mock.patch(
         "server.routes.octoprintemulator.files.save",
@@ -47,9 +50,11 @@ class FilesLocalRoute(unittest.TestCase):
             "display": "display",
             "absolute_path": "abspath",
             "size": 123,
+            "hash": "00" * 32,
         },
     )
-    def test_upload_path(self, mocked_save):
+    @mock.patch("server.routes.octoprintemulator.process_gcode")
+    def test_upload_path(self, mocked_process, mocked_save):
         with app.test_client() as c:
             data = dict(
                 file=(io.BytesIO(b"my file contents"), "some.gcode"), path="/a/b"
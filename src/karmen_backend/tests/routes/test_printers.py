@@ -1,3 +1,5 @@
+import json
+import time
 import unittest
 import mock
 
@@ -40,6 +42,137 @@ class ListRoute(unittest.TestCase):
             self.assertTrue("job" in response.json["items"][1])
 
 
+class ListRouteDeadline(unittest.TestCase):
+    def setUp(self):
+        printers.delete_printer("1.2.3.4")
+        printers.add_printer(
+            name="name",
+            hostname="hostname",
+            ip="1.2.3.4",
+            client="octoprint",
+            client_props={"version": "123", "connected": True},
+        )
+
+    def tearDown(self):
+        printers.delete_printer("1.2.3.4")
+
+    @mock.patch.dict(app.config, {"NETWORK_FANOUT_DEADLINE": 0.2})
+    @mock.patch("server.drivers.octoprint.get_uri")
+    def test_slow_printer_times_out(self, mock_get_uri):
+        def mock_call(ip, **kwargs):
+            time.sleep(1)
+
+        mock_get_uri.side_effect = mock_call
+        with app.test_client() as c:
+            started = time.time()
+            response = c.get("/printers?fields=status,job")
+            self.assertTrue(time.time() - started < 1)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["items"]), 3)
+            for item in response.json["items"]:
+                if item["ip"] == "1.2.3.4":
+                    self.assertTrue(item["timed_out"])
+                    self.assertEqual(
+                        item["status"]["state"], "Printer did not respond in time"
+                    )
+                    self.assertEqual(item["job"], {})
+                else:
+                    self.assertTrue("timed_out" not in item)
+                    self.assertTrue("status" in item)
+
+    @mock.patch("server.drivers.octoprint.get_uri")
+    def test_broken_printer(self, mock_get_uri):
+        def mock_call(ip, **kwargs):
+            if ip == "1.2.3.4":
+                raise ValueError("Unexpected response")
+
+        mock_get_uri.side_effect = mock_call
+        with app.test_client() as c:
+            response = c.get("/printers?fields=status,job")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["items"]), 3)
+            for item in response.json["items"]:
+                self.assertEqual("timed_out" in item, item["ip"] == "1.2.3.4")
+                self.assertTrue("status" in item)
+
+
+class EventsRoute(unittest.TestCase):
+    @mock.patch("server.services.printerstate.load")
+    @mock.patch("server.services.printerstate.get_event")
+    @mock.patch("server.services.printerstate.subscribe")
+    def test_events(self, mock_subscribe, mock_get_event, mock_load):
+        mock_load.return_value = {
+            "status": {"value": {"state": "Printing"}, "updated": 1000}
+        }
+        mock_get_event.side_effect = [
+            {"ip": "172.16.236.11:8080", "fields": {"webcam": {"stream": "url"}}},
+            None,
+            {"ip": "172.16.236.11:8080", "deleted": True},
+            Exception("Connection lost"),
+        ]
+        with app.test_client() as c:
+            response = c.get("/printers/events")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, "text/event-stream")
+            chunks = response.get_data(as_text=True).split("\n\n")
+            self.assertTrue(chunks[0].startswith("event: snapshot\ndata: "))
+            snapshot = json.loads(chunks[0][len("event: snapshot\ndata: ") :])
+            self.assertEqual(len(snapshot["items"]), 2)
+            self.assertEqual(snapshot["items"][0]["status"], {"state": "Printing"})
+            # not in the snapshot yet
+            self.assertEqual(
+                snapshot["items"][0]["webcam"], {"message": "Stream not accessible"}
+            )
+            self.assertEqual(snapshot["items"][0]["job"], {})
+            self.assertEqual(
+                chunks[1],
+                "event: change\ndata: %s"
+                % json.dumps(
+                    {
+                        "ip": "172.16.236.11:8080",
+                        "fields": {
+                            "webcam": {
+                                "stream": "url",
+                                "proxied": "/proxied-webcam/172.16.236.11:8080",
+                            }
+                        },
+                    }
+                ),
+            )
+            self.assertEqual(chunks[2], ": keepalive")
+            self.assertEqual(
+                chunks[3], 'event: delete\ndata: {"ip": "172.16.236.11:8080"}'
+            )
+            self.assertEqual(chunks[4], "")
+        self.assertEqual(mock_subscribe.return_value.close.call_count, 1)
+
+    @mock.patch("server.services.printerstate.load", return_value={})
+    @mock.patch(
+        "server.services.printerstate.get_event",
+        side_effect=Exception("Connection lost"),
+    )
+    @mock.patch("server.services.printerstate.subscribe")
+    def test_events_no_state(self, mock_subscribe, mock_get_event, mock_load):
+        # e.g. added after the last check_printers run
+        with app.test_client() as c:
+            response = c.get("/printers/events")
+            chunks = response.get_data(as_text=True).split("\n\n")
+            snapshot = json.loads(chunks[0][len("event: snapshot\ndata: ") :])
+            self.assertEqual(len(snapshot["items"]), 2)
+            for item in snapshot["items"]:
+                self.assertEqual(
+                    item["status"], {"state": "Unknown", "temperature": {}}
+                )
+                self.assertEqual(item["webcam"], {"message": "Stream not accessible"})
+                self.assertEqual(item["job"], {})
+
+    @mock.patch("server.services.printerstate.subscribe", return_value=None)
+    def test_events_unavailable(self, mock_subscribe):
+        with app.test_client() as c:
+            response = c.get("/printers/events")
+            self.assertEqual(response.status_code, 503)
+
+
 class DetailRoute(unittest.TestCase):
     def test_detail(self):
         with app.test_client() as c:
@@ -47,6 +180,7 @@ class DetailRoute(unittest.TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertTrue("client" in response.json)
             self.assertTrue("webcam" not in response.json)
+            self.assertEqual(response.json["circuit_breaker"]["state"], "closed")
 
     @mock.patch("server.drivers.octoprint.get_uri", return_value=None)
     def test_fields(self, mock_get_uri):
@@ -59,12 +193,110 @@ class DetailRoute(unittest.TestCase):
             self.assertTrue("status" in response.json)
             self.assertTrue("job" in response.json)
 
+    @mock.patch("server.services.printerstate.save")
+    @mock.patch("server.services.printerstate.load")
+    @mock.patch("server.drivers.octoprint.get_uri", return_value=None)
+    def test_fields_from_snapshot(self, mock_get_uri, mock_load, mock_save):
+        mock_load.return_value = {
+            "status": {
+                "value": {"state": "Printing", "temperature": {}},
+                "updated": time.time(),
+            },
+            "webcam": {
+                "value": {"message": "OK", "stream": "http://1.2.3.4/stream"},
+                "updated": time.time(),
+            },
+            "job": {"value": {"name": "file.gcode"}, "updated": time.time()},
+        }
+        with app.test_client() as c:
+            response = c.get("/printers/172.16.236.11:8080?fields=webcam,status,job")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["status"]["state"], "Printing")
+            self.assertEqual(response.json["job"]["name"], "file.gcode")
+            self.assertEqual(
+                response.json["webcam"]["proxied"],
+                "/proxied-webcam/172.16.236.11:8080",
+            )
+            self.assertEqual(mock_save.call_count, 0)
+
+    @mock.patch("server.services.printerstate.save")
+    @mock.patch("server.services.printerstate.load")
+    @mock.patch("server.drivers.octoprint.get_uri", return_value=None)
+    def test_fields_max_age(self, mock_get_uri, mock_load, mock_save):
+        mock_load.return_value = {
+            "status": {
+                "value": {"state": "Printing", "temperature": {}},
+                "updated": time.time() - 60,
+            },
+            "job": {"value": {"name": "file.gcode"}, "updated": time.time()},
+        }
+        with app.test_client() as c:
+            response = c.get(
+                "/printers/172.16.236.11:8080?fields=status,job&max_age=30"
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json["status"]["state"], "Printer is not responding"
+            )
+            self.assertEqual(response.json["job"]["name"], "file.gcode")
+            mock_save.assert_called_with(
+                "172.16.236.11:8080",
+                status={"state": "Printer is not responding", "temperature": {}},
+            )
+
     def test_404(self):
         with app.test_client() as c:
             response = c.get("/printers/172.16.236.35")
             self.assertEqual(response.status_code, 404)
 
 
+class WebcamSnapshotRoute(unittest.TestCase):
+    @mock.patch("server.services.webcam.get_snapshot", return_value=b"jpeg")
+    @mock.patch("server.services.printerstate.load")
+    def test_snapshot(self, mock_load, mock_get_snapshot):
+        mock_load.return_value = {
+            "webcam": {"value": {"stream": "http://1.2.3.4/stream"}, "updated": 1}
+        }
+        with app.test_client() as c:
+            response = c.get("/printers/172.16.236.11:8080/webcam/snapshot?w=320")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, "image/jpeg")
+            self.assertEqual(response.data, b"jpeg")
+            self.assertEqual(response.headers["Cache-Control"], "max-age=5")
+            mock_get_snapshot.assert_called_with(
+                "172.16.236.11:8080", "http://1.2.3.4/stream", 320
+            )
+
+    @mock.patch("server.services.printerstate.load", return_value={})
+    @mock.patch("server.drivers.octoprint.get_uri", return_value=None)
+    def test_no_stream(self, mock_get_uri, mock_load):
+        with app.test_client() as c:
+            response = c.get("/printers/172.16.236.11:8080/webcam/snapshot")
+            self.assertEqual(response.status_code, 404)
+
+    @mock.patch("server.services.webcam.get_snapshot", return_value=None)
+    @mock.patch("server.services.printerstate.load")
+    def test_capture_failed(self, mock_load, mock_get_snapshot):
+        mock_load.return_value = {
+            "webcam": {"value": {"stream": "http://1.2.3.4/stream"}, "updated": 1}
+        }
+        with app.test_client() as c:
+            response = c.get("/printers/172.16.236.11:8080/webcam/snapshot")
+            self.assertEqual(response.status_code, 404)
+
+    def test_unsupported_width(self):
+        with app.test_client() as c:
+            response = c.get("/printers/172.16.236.11:8080/webcam/snapshot?w=123")
+            self.assertEqual(response.status_code, 400)
+            response = c.get("/printers/172.16.236.11:8080/webcam/snapshot?w=abc")
+            self.assertEqual(response.status_code, 400)
+
+    def test_unknown_printer(self):
+        with app.test_client() as c:
+            response = c.get("/printers/1.2.3.4/webcam/snapshot")
+            self.assertEqual(response.status_code, 404)
+
+
 class CreateRoute(unittest.TestCase):
     @mock.patch("server.services.network.get_avahi_hostname", return_value=None)
     @mock.patch("server.drivers.octoprint.get_uri", return_value=None)
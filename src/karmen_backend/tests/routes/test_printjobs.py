@@ -1,8 +1,12 @@
+import io
+import csv
+import json
 import unittest
 import mock
+from time import time
 
-from server import app
-from server.database import gcodes, printjobs
+from server import app, database
+from server.database import gcodes, printjobs, encode_cursor
 from server.drivers.utils import PrinterDriverException
 
 
@@ -98,15 +102,18 @@ class ListRoute(unittest.TestCase):
             self.assertTrue(
                 response.json["items"][1]["id"] > response.json["items"][0]["id"]
             )
+            next_id = int(response.json["items"][1]["id"]) + 1
             self.assertEqual(
                 response.json["next"],
-                "/printjobs?limit=2&start_with=%s"
-                % str(int(response.json["items"][1]["id"]) + 1),
+                "/printjobs?limit=2&start_with=%s" % encode_cursor(next_id, next_id),
             )
 
     def test_start_with_non_existent(self):
         with app.test_client() as c:
-            response = c.get("/printjobs?limit=3&start_with=99999&order_by=started")
+            response = c.get(
+                "/printjobs?limit=3&start_with=%s&order_by=started"
+                % encode_cursor("2999-01-01T00:00:00+00:00", 99999)
+            )
             self.assertEqual(response.status_code, 200)
             self.assertTrue("items" in response.json)
             self.assertTrue(len(response.json["items"]) == 0)
@@ -131,6 +138,21 @@ class ListRoute(unittest.TestCase):
                 response.json["items"][2]["id"] > response.json["items"][1]["id"]
             )
 
+    def test_ignore_start_with_other_type(self):
+        with app.test_client() as c:
+            for order_by, value in [
+                ("started", "abc"),
+                ("-started", 12),
+                ("gcode_id", "2019-10-01T12:00:00+00:00"),
+                ("printer_ip", 12),
+            ]:
+                response = c.get(
+                    "/printjobs?limit=3&order_by=%s&start_with=%s"
+                    % (order_by, encode_cursor(value, 1))
+                )
+                self.assertEqual(response.status_code, 200, order_by)
+                self.assertTrue("items" in response.json)
+
     def test_ignore_start_with_str(self):
         with app.test_client() as c:
             response = c.get("/printjobs?limit=3&start_with=asdfasdf")
@@ -192,6 +214,49 @@ class ListRoute(unittest.TestCase):
                 response.json["items"][0]["id"] > response2.json["items"][0]["id"]
             )
 
+    def test_filter_structured(self):
+        rand = repr(round(time()))
+        available_id = printjobs.add_printjob(
+            gcode_id=self.gcode_id,
+            gcode_data={"id": self.gcode_id, "available": True},
+            printer_ip="172.16.236.11:8080",
+            printer_data={"ip": "172.16.236.11:8080", "name": "printer-%s" % rand},
+        )
+        removed_id = printjobs.add_printjob(
+            gcode_id=self.gcode_id,
+            gcode_data={"id": self.gcode_id, "available": False},
+            printer_ip="172.16.236.11:8080",
+            printer_data={"ip": "172.16.236.11:8080", "name": "printer-%s" % rand},
+        )
+        with app.test_client() as c:
+            response = c.get(
+                "/printjobs?filter=printer_data.name:printer-%s&order_by=id" % rand
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [i["id"] for i in response.json["items"]], [available_id, removed_id]
+            )
+            response = c.get(
+                "/printjobs?filter=gcode_data.available:false&order_by=-id&limit=1"
+            )
+            self.assertEqual([i["id"] for i in response.json["items"]], [removed_id])
+            response = c.get(
+                "/printjobs?filter=gcode_data.id:%s&order_by=-id&limit=1"
+                % self.gcode_id
+            )
+            self.assertEqual([i["id"] for i in response.json["items"]], [removed_id])
+            response = c.get("/printjobs?filter=printer_data.name:printer")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json["items"]), 0)
+        printjobs.delete_printjob(available_id)
+        printjobs.delete_printjob(removed_id)
+
+    def test_filter_ignore_path_on_plain_column(self):
+        with app.test_client() as c:
+            response = c.get("/printjobs?filter=printer_ip.name:file1")
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(len(response.json["items"]) >= 1)
+
     def test_filter_ignore_bad_column(self):
         with app.test_client() as c:
             response = c.get("/printjobs?filter=random:file1")
@@ -207,6 +272,193 @@ class ListRoute(unittest.TestCase):
             self.assertTrue(len(response.json["items"]) >= 1)
 
 
+class ExportRoute(unittest.TestCase):
+    def setUp(self):
+        self.rand = repr(round(time()))
+        self.printjob_ids = [
+            printjobs.add_printjob(
+                gcode_id=1,
+                gcode_data={"id": 1, "filename": "file, with comma.gcode"},
+                printer_ip="172.16.236.11:8080",
+                printer_data={
+                    "ip": "172.16.236.11:8080",
+                    "name": "export-%s" % self.rand,
+                },
+            )
+            for _ in range(0, 5)
+        ]
+
+    def tearDown(self):
+        for printjob_id in self.printjob_ids:
+            printjobs.delete_printjob(printjob_id)
+
+    def test_ndjson(self):
+        with app.test_client() as c:
+            response = c.get(
+                "/printjobs/export?filter=printer_data.name:export-%s&order_by=-id"
+                % self.rand
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, "application/x-ndjson")
+            lines = response.get_data(as_text=True).splitlines()
+            items = [json.loads(line) for line in lines]
+            self.assertEqual(
+                [i["id"] for i in items], sorted(self.printjob_ids, reverse=True)
+            )
+            self.assertEqual(
+                items[0]["gcode_data"]["filename"], "file, with comma.gcode"
+            )
+            self.assertTrue("started" in items[0])
+
+    def test_csv(self):
+        with app.test_client() as c:
+            response = c.get(
+                "/printjobs/export?format=csv&fields=gcode_data,id&filter=printer_data.name:export-%s"
+                % self.rand
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, "text/csv")
+            rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+            self.assertEqual(rows[0], ["id", "gcode_data"])
+            self.assertEqual([int(r[0]) for r in rows[1:]], self.printjob_ids)
+            self.assertEqual(
+                json.loads(rows[1][1]),
+                {"id": 1, "filename": "file, with comma.gcode"},
+            )
+
+    def test_release_connection_early(self):
+        with app.test_client() as c:
+            response = c.get("/printjobs/export")
+            iterator = iter(response.response)
+            next(iterator)
+            response.close()
+        with database.get_connection() as connection:
+            self.assertTrue(connection.autocommit)
+        self.assertEqual(
+            database.POOL.get_stats()["size"], database.POOL.get_stats()["idle"]
+        )
+
+    def test_bad_format(self):
+        with app.test_client() as c:
+            response = c.get("/printjobs/export?format=xml")
+            self.assertEqual(response.status_code, 400)
+
+    def test_bad_order_by(self):
+        with app.test_client() as c:
+            response = c.get("/printjobs/export?order_by=absolute_path")
+            self.assertEqual(response.status_code, 400)
+
+
+class StatsRoute(unittest.TestCase):
+    def setUp(self):
+        self.printer_ip = "172.16.236.%s:8080" % int(time() * 1000 % 200 + 20)
+        self.gcode_id = gcodes.add_gcode(
+            path="a/b/c",
+            filename="stats-file",
+            display="file-display",
+            absolute_path="/ab/a/b/c",
+            size=123,
+        )
+        self.printjob_ids = []
+        for i in range(0, 3):
+            self.printjob_ids.append(
+                printjobs.add_printjob(
+                    gcode_id=self.gcode_id,
+                    gcode_data={"id": self.gcode_id, "filename": "stats-file"},
+                    printer_ip=self.printer_ip,
+                    printer_data={"ip": self.printer_ip},
+                )
+            )
+
+    def tearDown(self):
+        for printjob_id in self.printjob_ids:
+            printjobs.delete_printjob(printjob_id)
+
+    def get_printer(self, response):
+        for printer in response.json["printers"]:
+            if printer["printer_ip"] == self.printer_ip:
+                return printer
+        return None
+
+    def test_stats(self):
+        with app.test_client() as c:
+            response = c.get("/printjobs/stats?days=7&gcodes=100")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["days"], 7)
+            printer = self.get_printer(response)
+            self.assertEqual(printer["jobs"], 3)
+            self.assertEqual(printer["jobs_total"], 3)
+            self.assertTrue(printer["last_started"] is not None)
+            self.assertEqual(len(printer["jobs_per_day"]), 1)
+            self.assertEqual(printer["jobs_per_day"][0]["jobs"], 3)
+            self.assertTrue(printer["jobs_per_day"][0]["day"] >= response.json["since"])
+            self.assertEqual(printer["utilisation"], round(1 / 7, 4))
+            self.assertTrue(0 < printer["jobs_ratio"] <= 1)
+        # the shared test database may hold more printed gcodes than the endpoint lists
+        gcode = [
+            g
+            for g in printjobs.get_gcode_stats(100000)
+            if g["gcode_id"] == self.gcode_id
+        ]
+        self.assertEqual(len(gcode), 1)
+        self.assertEqual(gcode[0]["jobs"], 3)
+        self.assertEqual(gcode[0]["filename"], "stats-file")
+
+    def test_most_printed_first(self):
+        with app.test_client() as c:
+            response = c.get("/printjobs/stats")
+            self.assertEqual(response.status_code, 200)
+            jobs = [g["jobs"] for g in response.json["gcodes"]]
+            self.assertEqual(jobs, sorted(jobs, reverse=True))
+            self.assertTrue(len(jobs) <= 10)
+
+    def test_delete_updates_stats(self):
+        printjobs.delete_printjob(self.printjob_ids.pop())
+        with app.test_client() as c:
+            response = c.get("/printjobs/stats?gcodes=100")
+            printer = self.get_printer(response)
+            self.assertEqual(printer["jobs"], 2)
+            self.assertEqual(printer["jobs_total"], 2)
+        gcode = [
+            g
+            for g in printjobs.get_gcode_stats(100000)
+            if g["gcode_id"] == self.gcode_id
+        ]
+        self.assertEqual(gcode[0]["jobs"], 2)
+        for printjob_id in self.printjob_ids:
+            printjobs.delete_printjob(printjob_id)
+        self.printjob_ids = []
+        with app.test_client() as c:
+            response = c.get("/printjobs/stats?gcodes=100")
+            self.assertEqual(self.get_printer(response), None)
+        self.assertFalse(
+            any(
+                g["gcode_id"] == self.gcode_id
+                for g in printjobs.get_gcode_stats(100000)
+            )
+        )
+
+    def get_last_started(self):
+        for printer in printjobs.get_printer_stats():
+            if printer["printer_ip"] == self.printer_ip:
+                return printer["last_started"]
+        return None
+
+    def test_delete_latest_updates_last_started(self):
+        started = [printjobs.get_printjob(i)["started"] for i in self.printjob_ids]
+        self.assertEqual(self.get_last_started(), started[2])
+        printjobs.delete_printjob(self.printjob_ids.pop(0))
+        self.assertEqual(self.get_last_started(), started[2])
+        printjobs.delete_printjob(self.printjob_ids.pop())
+        self.assertEqual(self.get_last_started(), started[1])
+
+    def test_survive_bad_args(self):
+        with app.test_client() as c:
+            response = c.get("/printjobs/stats?days=-1&gcodes=aaa")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["days"], 30)
+
+
 class DetailRoute(unittest.TestCase):
     def setUp(self):
         self.gcode_id = gcodes.add_gcode(
@@ -272,11 +524,12 @@ class CreateRoute(unittest.TestCase):
             )
             self.assertEqual(c_args[0], "/ab/a/b/c")
             self.assertEqual(c_args[1], "a/b/c")
+            self.assertEqual(c_args[2], "file")
 
     @mock.patch("server.routes.printjobs.drivers.get_printer_instance")
     def test_create_already_printing(self, mock_print_inst):
-        mock_print_inst.return_value.upload_and_start_job.side_effect = PrinterDriverException(
-            "Printer is printing"
+        mock_print_inst.return_value.upload_and_start_job.side_effect = (
+            PrinterDriverException("Printer is printing")
         )
         with app.test_client() as c:
             response = c.post(
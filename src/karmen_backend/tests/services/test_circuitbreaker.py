@@ -0,0 +1,95 @@
+import unittest
+import mock
+import requests
+
+from server.services import circuitbreaker
+from server.services.network import get_uri
+
+
+class GetStateTest(unittest.TestCase):
+    @mock.patch("server.services.circuitbreaker.redis")
+    def test_closed(self, mock_redis):
+        mock_redis.hgetall.return_value = {b"failures": b"1"}
+        self.assertEqual(
+            circuitbreaker.get_state("1.2.3.4"),
+            {"state": "closed", "failures": 1, "retry_at": None},
+        )
+        mock_redis.hgetall.assert_called_with("circuit_breaker_1.2.3.4")
+
+    @mock.patch("server.services.circuitbreaker.time", return_value=1000)
+    @mock.patch("server.services.circuitbreaker.redis")
+    def test_open(self, mock_redis, mock_time):
+        mock_redis.hgetall.return_value = {b"failures": b"3", b"retry_at": b"1010"}
+        self.assertEqual(circuitbreaker.get_state("1.2.3.4")["state"], "open")
+        self.assertFalse(circuitbreaker.allow("1.2.3.4"))
+
+    @mock.patch("server.services.circuitbreaker.time", return_value=1000)
+    @mock.patch("server.services.circuitbreaker.redis")
+    def test_half_open_single_probe(self, mock_redis, mock_time):
+        mock_redis.hgetall.return_value = {b"failures": b"3", b"retry_at": b"990"}
+        self.assertEqual(circuitbreaker.get_state("1.2.3.4")["state"], "half-open")
+        mock_redis.set.return_value = True
+        self.assertTrue(circuitbreaker.allow("1.2.3.4"))
+        mock_redis.set.return_value = None
+        self.assertFalse(circuitbreaker.allow("1.2.3.4"))
+
+    @mock.patch("server.services.circuitbreaker.app.logger")
+    @mock.patch("server.services.circuitbreaker.redis")
+    def test_fail_open_on_broken_redis(self, mock_redis, mock_logger):
+        mock_redis.hgetall.side_effect = Exception("Cannot connect to redis")
+        self.assertTrue(circuitbreaker.allow("1.2.3.4"))
+        self.assertEqual(mock_logger.error.call_count, 1)
+
+
+class RecordTest(unittest.TestCase):
+    def test_backoff(self):
+        self.assertEqual(circuitbreaker.get_backoff(3), 10)
+        self.assertEqual(circuitbreaker.get_backoff(4), 20)
+        self.assertEqual(circuitbreaker.get_backoff(6), 80)
+        self.assertEqual(circuitbreaker.get_backoff(20), 600)
+
+    @mock.patch("server.services.circuitbreaker.redis")
+    def test_failure_below_threshold(self, mock_redis):
+        mock_redis.hincrby.return_value = 2
+        circuitbreaker.record_failure("1.2.3.4")
+        mock_redis.hincrby.assert_called_with("circuit_breaker_1.2.3.4", "failures", 1)
+        self.assertEqual(mock_redis.pipeline.call_count, 0)
+
+    @mock.patch("server.services.circuitbreaker.time", return_value=1000)
+    @mock.patch("server.services.circuitbreaker.redis")
+    def test_failure_opens(self, mock_redis, mock_time):
+        mock_redis.hincrby.return_value = 4
+        circuitbreaker.record_failure("1.2.3.4")
+        mock_redis.pipeline.return_value.hset.assert_called_with(
+            "circuit_breaker_1.2.3.4", "retry_at", 1020
+        )
+
+    @mock.patch("server.services.circuitbreaker.redis")
+    def test_success_closes(self, mock_redis):
+        circuitbreaker.record_success("1.2.3.4")
+        mock_redis.delete.assert_called_with(
+            "circuit_breaker_1.2.3.4", "circuit_breaker_1.2.3.4_probe"
+        )
+
+
+class GetUriBreakerTest(unittest.TestCase):
+    @mock.patch("server.services.circuitbreaker.allow", return_value=False)
+    @mock.patch("requests.Session.get")
+    def test_fail_fast(self, mock_requests, mock_allow):
+        self.assertEqual(get_uri("1.2.3.4", "/api/version"), None)
+        self.assertEqual(mock_requests.call_count, 0)
+
+    @mock.patch("server.services.circuitbreaker.record_failure")
+    @mock.patch("server.services.circuitbreaker.allow", return_value=True)
+    @mock.patch("requests.Session.get")
+    def test_record_failure(self, mock_requests, mock_allow, mock_record_failure):
+        mock_requests.side_effect = requests.exceptions.ConnectionError("mocked")
+        self.assertEqual(get_uri("1.2.3.4", "/api/version"), None)
+        mock_record_failure.assert_called_with("1.2.3.4")
+
+    @mock.patch("server.services.circuitbreaker.record_success")
+    @mock.patch("server.services.circuitbreaker.allow", return_value=True)
+    @mock.patch("requests.Session.get")
+    def test_record_success(self, mock_requests, mock_allow, mock_record_success):
+        get_uri("1.2.3.4", "/api/version")
+        mock_record_success.assert_called_with("1.2.3.4")
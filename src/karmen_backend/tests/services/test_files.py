@@ -0,0 +1,110 @@
+import io
+import os
+import hashlib
+import tempfile
+import unittest
+import mock
+
+from werkzeug.datastructures import FileStorage
+
+from server import app
+from server.services import files
+
+
+class HashingStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.config = mock.patch.dict(app.config, {"UPLOAD_FOLDER": self.folder.name})
+        self.config.start()
+
+    def tearDown(self):
+        self.config.stop()
+        self.folder.cleanup()
+
+    def get_leftovers(self):
+        return [f for f in os.listdir(files.get_blob_dir()) if f.startswith(".upload-")]
+
+    def test_store(self):
+        stream = files.HashingStream()
+        stream.write(b"G28\n")
+        stream.write(b"G1 X10\n")
+        hash, destination = stream.store()
+        stream.close()
+        self.assertEqual(hash, hashlib.sha256(b"G28\nG1 X10\n").hexdigest())
+        self.assertEqual(stream.size, 11)
+        self.assertEqual(destination, files.get_blob_path(hash))
+        with open(destination, "rb") as blob:
+            self.assertEqual(blob.read(), b"G28\nG1 X10\n")
+        self.assertEqual(self.get_leftovers(), [])
+
+    def test_store_known_content(self):
+        first = files.HashingStream()
+        first.write(b"G28\n")
+        first_hash, first_destination = first.store()
+        first.close()
+        second = files.HashingStream()
+        second.write(b"G28\n")
+        second_hash, second_destination = second.store()
+        second.close()
+        self.assertEqual(first_hash, second_hash)
+        self.assertEqual(first_destination, second_destination)
+        self.assertEqual(os.listdir(os.path.dirname(first_destination)), [first_hash])
+        self.assertEqual(self.get_leftovers(), [])
+
+    def test_close_without_store(self):
+        stream = files.HashingStream()
+        stream.write(b"G28\n")
+        self.assertEqual(len(self.get_leftovers()), 1)
+        stream.close()
+        self.assertEqual(self.get_leftovers(), [])
+
+    def test_readable(self):
+        stream = files.HashingStream()
+        stream.write(b"G28\n")
+        stream.seek(0)
+        self.assertEqual(stream.read(), b"G28\n")
+        stream.close()
+
+    def test_save_plain_stream(self):
+        incoming = FileStorage(stream=io.BytesIO(b"G28\n"), filename="some file.gcode")
+        saved = files.save(incoming, "a/b")
+        incoming.close()
+        self.assertEqual(saved["path"], "a/b")
+        self.assertEqual(saved["filename"], "some_file.gcode")
+        self.assertEqual(saved["display"], "some file.gcode")
+        self.assertEqual(saved["size"], 4)
+        self.assertEqual(saved["hash"], hashlib.sha256(b"G28\n").hexdigest())
+        self.assertTrue(os.path.exists(saved["absolute_path"]))
+        self.assertEqual(self.get_leftovers(), [])
+
+    def test_restore(self):
+        incoming = FileStorage(stream=io.BytesIO(b"G28\n"), filename="some.gcode")
+        saved = files.save(incoming, "a/b")
+        # removed by a delete of the same content in the meantime
+        os.remove(saved["absolute_path"])
+        files.restore(incoming, saved)
+        incoming.close()
+        with open(saved["absolute_path"], "rb") as blob:
+            self.assertEqual(blob.read(), b"G28\n")
+        self.assertEqual(self.get_leftovers(), [])
+
+
+class UploadRequestTest(unittest.TestCase):
+    def get_stream(self, path):
+        data = {"file": (io.BytesIO(b"G28\n"), "some.gcode")}
+        with app.test_request_context(
+            path, method="POST", data=data, content_type="multipart/form-data"
+        ) as context:
+            return context.request.files["file"].stream
+
+    def test_gcode_uploads_hashed(self):
+        self.assertTrue(isinstance(self.get_stream("/gcodes"), files.HashingStream))
+        self.assertTrue(
+            isinstance(
+                self.get_stream("/octoprint-emulator/api/files/local"),
+                files.HashingStream,
+            )
+        )
+
+    def test_other_uploads_untouched(self):
+        self.assertFalse(isinstance(self.get_stream("/printers"), files.HashingStream))
@@ -0,0 +1,166 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from server.services import gcodeanalysis
+
+TWO_LAYERS = b"""; generated by PrusaSlicer 2.2.0
+G90 ; use absolute coordinates
+M83 ; extruder relative mode
+G28 W ; home all without mesh bed level
+G1 Z0.2 F720
+G1 X10 Y10 F9000 ; travel, nothing printed
+G1 X20 Y10 E1 F1200
+G1 X20.000 Y20.0 E1.0 ; X99 Y99 in a comment
+; G1 X500 Y500 E10
+G1 E-0.8 F2100
+G1 Z0.4 F720
+G1 E0.8 F2100
+G1 X10 Y20 E1.5 F1200
+M104 S0
+"""
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_commands(self):
+        commands, params = gcodeanalysis.tokenize(
+            b"G0 X1\nG1 Y2.5 F300\nG28\nG92 E0\nG90\nG91\nM82\nM83\nG10\nM104 S200\n"
+        )
+        self.assertEqual(
+            list(commands),
+            [
+                gcodeanalysis.MOVE,
+                gcodeanalysis.MOVE,
+                gcodeanalysis.SET,
+                gcodeanalysis.ABSOLUTE,
+                gcodeanalysis.RELATIVE,
+                gcodeanalysis.ABSOLUTE_E,
+                gcodeanalysis.RELATIVE_E,
+            ],
+        )
+        self.assertEqual(params[0, gcodeanalysis.X], 1)
+        self.assertTrue(np.isnan(params[0, gcodeanalysis.Y]))
+        self.assertEqual(params[1, gcodeanalysis.Y], 2.5)
+        self.assertEqual(params[1, gcodeanalysis.F], 300)
+        self.assertEqual(params[2, gcodeanalysis.E], 0)
+
+    def test_comments_and_malformed_numbers(self):
+        _, params = gcodeanalysis.tokenize(
+            b"G1 X-1.5 ; Y3\nG1 X1.2.3 Y4\n;G1 X7\nG1 E\n"
+        )
+        self.assertEqual(params.shape, (3, 5))
+        self.assertEqual(params[0, gcodeanalysis.X], -1.5)
+        self.assertTrue(np.isnan(params[0, gcodeanalysis.Y]))
+        self.assertTrue(np.isnan(params[1, gcodeanalysis.X]))
+        self.assertEqual(params[1, gcodeanalysis.Y], 4)
+        self.assertTrue(np.isnan(params[2, gcodeanalysis.E]))
+
+
+class MoveTimesTest(unittest.TestCase):
+    def get_time(self, lengths, directions, speed=100):
+        return float(
+            np.sum(
+                gcodeanalysis.get_move_times(
+                    np.array(lengths, dtype=float),
+                    np.array(directions, dtype=float),
+                    np.full(len(lengths), speed, dtype=float),
+                    1000,
+                )
+            )
+        )
+
+    def test_trapezoid(self):
+        # 0.1 s to reach 100 mm/s over 5 mm, 590 mm at full speed, 0.1 s to stop
+        self.assertAlmostEqual(self.get_time([600], [[1, 0, 0]]), 6.1)
+
+    def test_triangle(self):
+        # never gets to the feedrate, peaks at 50 mm/s in the middle
+        self.assertAlmostEqual(self.get_time([2.5], [[1, 0, 0]]), 0.1)
+
+    def test_junctions(self):
+        self.assertAlmostEqual(self.get_time([600, 600], [[1, 0, 0], [1, 0, 0]]), 12.1)
+        # has to stop in the corner
+        self.assertAlmostEqual(self.get_time([600, 600], [[1, 0, 0], [0, 1, 0]]), 12.2)
+
+
+class AnalyzeTest(unittest.TestCase):
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(suffix=".gcode", delete=False)
+
+    def tearDown(self):
+        self.file.close()
+        os.remove(self.file.name)
+
+    def analyze(self, contents, **kwargs):
+        self.file.write(contents)
+        self.file.flush()
+        return gcodeanalysis.analyze(self.file.name, **kwargs)
+
+    def test_two_layers(self):
+        result = self.analyze(TWO_LAYERS)
+        self.assertEqual(result["filament_length"], 3.5)
+        self.assertEqual(result["layer_count"], 2)
+        self.assertEqual(
+            result["bounding_box"], {"min": [10, 10, 0.2], "max": [20, 20, 0.4]}
+        )
+        self.assertTrue(result["print_time"] > 0)
+
+    def test_chunks(self):
+        self.assertEqual(
+            self.analyze(TWO_LAYERS),
+            gcodeanalysis.analyze(self.file.name, chunk_size=7),
+        )
+
+    def test_no_trailing_newline(self):
+        result = self.analyze(b"G90\nM83\nG1 X10 E2")
+        self.assertEqual(result["filament_length"], 2)
+
+    def test_absolute_extrusion(self):
+        result = self.analyze(
+            b"G90\nM82\nG1 X10 E5\nG92 E0\nG1 X20 E3\nG1 X30 E2 ; retraction\n"
+        )
+        self.assertEqual(result["filament_length"], 7)
+        self.assertEqual(result["bounding_box"]["max"], [20, 0, 0])
+
+    def test_relative_positioning(self):
+        result = self.analyze(b"G91\nG1 X10 E1\nG1 X10 E1\nG90\nM83\nG1 X5 E1\n")
+        self.assertEqual(result["filament_length"], 3)
+        self.assertEqual(result["bounding_box"], {"min": [0, 0, 0], "max": [20, 0, 0]})
+
+    def test_print_time(self):
+        # 600 mm at 100 mm/s, accelerating takes no time at all
+        result = self.analyze(b"G90\nG1 X600 F6000\n", acceleration=1e9)
+        self.assertEqual(result["print_time"], 6)
+        # with 10 mm/s2 the move peaks at 77.5 mm/s halfway
+        result = gcodeanalysis.analyze(self.file.name, acceleration=10)
+        self.assertEqual(result["print_time"], 15)
+
+    def test_filament_weight(self):
+        contents = b"M83\nG1 X10 E1000\n"
+        self.assertEqual(self.analyze(contents)["filament_weight"], 2.98)
+        self.assertEqual(
+            gcodeanalysis.analyze(self.file.name, filament_type="ABS")[
+                "filament_weight"
+            ],
+            2.5,
+        )
+        self.assertEqual(
+            gcodeanalysis.analyze(self.file.name, filament_diameter=2.85)[
+                "filament_weight"
+            ],
+            7.91,
+        )
+
+    def test_empty(self):
+        self.assertEqual(
+            self.analyze(b""),
+            {
+                "print_time": 0,
+                "filament_length": 0,
+                "filament_weight": 0,
+                "layer_count": 0,
+                "bounding_box": None,
+            },
+        )
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import unittest
+from time import time
+
+from server.services import gcodemeta
+
+PRUSA_HEADER = b"""; generated by PrusaSlicer 2.2.0+linux64 on 2020-03-20 at 10:12:31 UTC
+;
+
+; external perimeters extrusion width = 0.45mm
+M73 P0 R52
+M201 X1000 Y1000 Z1000 E5000
+M107
+M115 U3.8.1 ; tell printer latest fw version
+G90 ; use absolute coordinates
+M83 ; extruder relative mode
+M104 S215 ; set extruder temp
+M140 S60 ; set bed temp
+M190 S60 ; wait for bed temp
+M109 S215 ; wait for extruder temp
+G28 W ; home all without mesh bed level
+"""
+PRUSA_FOOTER = b"""M104 S0 ; turn off temperature
+M140 S0 ; turn off heatbed
+M84 ; disable motors
+; filament used [mm] = 1541.16
+; filament used [g] = 4.60
+; bed_temperature = 60
+; filament_type = PETG;PLA
+; printer_model = MK3S
+; temperature = 240
+"""
+CURA = b""";FLAVOR:Marlin
+;TIME:5221
+;Filament used: 3.24574m
+;Layer height: 0.2
+;TARGET_MACHINE.NAME:Creality Ender-3
+M140 S50
+M105
+M190 S50
+M104 T0 S200.4
+M105
+M109 S200
+"""
+MOVES = b"G1 X104.193 Y96.193 E0.01426\n"
+
+
+class ExtractTest(unittest.TestCase):
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(suffix=".gcode", delete=False)
+
+    def tearDown(self):
+        self.file.close()
+        os.remove(self.file.name)
+
+    def extract(self, *parts):
+        for part in parts:
+            self.file.write(part)
+        self.file.flush()
+        return gcodemeta.extract(self.file.name)
+
+    def test_prusaslicer(self):
+        self.assertEqual(
+            self.extract(PRUSA_HEADER, MOVES * 1000, PRUSA_FOOTER),
+            {
+                "filament_type": "PETG",
+                "printer_model": "MK3S",
+                "bed_temperature": 60,
+                "extruder_temperature": 215,
+            },
+        )
+
+    def test_cura(self):
+        self.assertEqual(
+            self.extract(CURA, MOVES * 1000),
+            {
+                "filament_type": None,
+                "printer_model": "Creality Ender-3",
+                "bed_temperature": 50,
+                "extruder_temperature": 200,
+            },
+        )
+
+    def test_comments_fallback(self):
+        result = self.extract(MOVES * 10, PRUSA_FOOTER)
+        self.assertEqual(result["bed_temperature"], 60)
+        self.assertEqual(result["extruder_temperature"], 240)
+
+    def test_ignore_heaters_off_and_commented_out(self):
+        result = self.extract(b"M104 S0\n;M140 S70\n", MOVES)
+        self.assertEqual(result["extruder_temperature"], None)
+        self.assertEqual(result["bed_temperature"], None)
+
+    def test_empty(self):
+        self.assertEqual(
+            self.extract(),
+            {
+                "filament_type": None,
+                "printer_model": None,
+                "bed_temperature": None,
+                "extruder_temperature": None,
+            },
+        )
+
+    def test_middle_not_read(self):
+        middle = MOVES * (gcodemeta.HEADER_SIZE // len(MOVES) + 10)
+        result = self.extract(middle, b"; printer_model = MK2\n", middle)
+        self.assertEqual(result["printer_model"], None)
+
+    def test_large_file(self):
+        self.file.write(PRUSA_HEADER + MOVES * 100000)
+        # sparse, the middle is never read anyway
+        self.file.seek(500 * 1024 * 1024)
+        self.file.write(PRUSA_FOOTER)
+        self.file.flush()
+        start = time()
+        result = gcodemeta.extract(self.file.name)
+        self.assertTrue(time() - start < 0.5)
+        self.assertEqual(result["printer_model"], "MK3S")
+        self.assertEqual(result["extruder_temperature"], 215)
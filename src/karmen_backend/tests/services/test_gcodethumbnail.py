@@ -0,0 +1,81 @@
+import io
+import os
+import base64
+import tempfile
+import unittest
+
+from PIL import Image
+
+from server.services import gcodethumbnail
+
+
+def make_png(width, height):
+    image = io.BytesIO()
+    Image.new("RGB", (width, height), (255, 128, 0)).save(image, "PNG")
+    return image.getvalue()
+
+
+# the way PrusaSlicer embeds it, base64 split into commented lines
+def make_block(image, width, height, kind="thumbnail"):
+    encoded = base64.b64encode(image)
+    lines = [encoded[i : i + 78] for i in range(0, len(encoded), 78)]
+    return (
+        b";\n; %s begin %dx%d %d\n"
+        % (kind.encode("ascii"), width, height, len(encoded))
+        + b"".join(b"; %s\n" % line for line in lines)
+        + b"; %s end\n;\n\n" % kind.encode("ascii")
+    )
+
+
+class ExtractTest(unittest.TestCase):
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(suffix=".gcode", delete=False)
+
+    def tearDown(self):
+        self.file.close()
+        os.remove(self.file.name)
+
+    def extract(self, *parts):
+        for part in parts:
+            self.file.write(part)
+        self.file.flush()
+        return gcodethumbnail.extract(self.file.name)
+
+    def test_largest(self):
+        small = make_png(16, 16)
+        large = make_png(220, 124)
+        self.assertEqual(
+            self.extract(
+                b"; generated by PrusaSlicer 2.2.0\n",
+                make_block(small, 16, 16),
+                make_block(large, 220, 124),
+                b"G28 W\nG1 X10 Y10\n",
+            ),
+            large,
+        )
+
+    def test_none(self):
+        self.assertEqual(self.extract(b"G28 W\nG1 X10 Y10\n"), None)
+        self.assertEqual(self.extract(), None)
+
+    def test_other_formats_skipped(self):
+        image = make_png(16, 16)
+        self.assertEqual(
+            self.extract(
+                make_block(b"\xff\xd8\xff\xe0 not a png", 300, 300, "thumbnail_JPG"),
+                make_block(b"\xff\xd8\xff\xe0 not a png", 400, 400),
+                make_block(image, 16, 16),
+            ),
+            image,
+        )
+
+    def test_broken(self):
+        block = make_block(make_png(16, 16), 16, 16)
+        # cut off in the middle
+        self.assertEqual(self.extract(block[: len(block) // 2]), None)
+
+    def test_header_only(self):
+        padding = b"G1 X10 Y10\n" * (gcodethumbnail.HEADER_SIZE // 11 + 1)
+        self.assertEqual(
+            self.extract(padding, make_block(make_png(16, 16), 16, 16)), None
+        )
@@ -0,0 +1,34 @@
+import unittest
+import mock
+
+from server.services import locks
+
+
+class LocksTest(unittest.TestCase):
+    @mock.patch("server.services.locks.redis")
+    def test_acquire(self, mock_redis):
+        mock_redis.set.return_value = True
+        token = locks.acquire("check_printer_1234", 60)
+        self.assertTrue(token)
+        mock_redis.set.assert_called_with(
+            "lock_check_printer_1234", token, nx=True, ex=60
+        )
+
+    @mock.patch("server.services.locks.redis")
+    def test_acquire_held(self, mock_redis):
+        mock_redis.set.return_value = None
+        self.assertEqual(locks.acquire("check_printer_1234", 60), None)
+
+    @mock.patch("server.services.locks.app.logger")
+    @mock.patch("server.services.locks.redis")
+    def test_acquire_broken_redis(self, mock_redis, mock_logger):
+        mock_redis.set.side_effect = Exception("Cannot connect to redis")
+        self.assertTrue(locks.acquire("check_printer_1234", 60))
+        self.assertEqual(mock_logger.error.call_count, 1)
+
+    @mock.patch("server.services.locks.redis")
+    def test_release_own_lock(self, mock_redis):
+        locks.release("check_printer_1234", "token")
+        mock_redis.register_script.return_value.assert_called_with(
+            keys=["lock_check_printer_1234"], args=["token"]
+        )
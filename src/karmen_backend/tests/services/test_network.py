@@ -1,10 +1,22 @@
 import os
+import asyncio
+import threading
 import unittest
 import tempfile
 import mock
 import requests
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
-from server.services.network import do_arp_scan, get_avahi_hostname, get_uri, post_uri
+from server import app
+from server.services import network
+from server.services.network import (
+    do_arp_scan,
+    get_avahi_hostname,
+    get_uri,
+    post_uri,
+    async_get_uri,
+    async_post_uri,
+)
 
 
 class DoArpScanTest(unittest.TestCase):
@@ -131,38 +143,38 @@ Failed to resolve address '10.192.202.200': Timeout reached
 
 
 class GetUriTest(unittest.TestCase):
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_try_hostname(self, mock_requests):
         get_uri("1.2.3.4", "/api/version")
         mock_requests.assert_called_with("http://1.2.3.4/api/version", timeout=2)
 
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_pass_protocol_timeout(self, mock_requests):
         get_uri("1.2.3.4", "/api/version", protocol="https", timeout=3)
         mock_requests.assert_called_with("https://1.2.3.4/api/version", timeout=3)
 
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_add_leading_slash(self, mock_requests):
         get_uri("1.2.3.4", "api/version")
         mock_requests.assert_called_with("http://1.2.3.4/api/version", timeout=2)
 
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_ip_port(self, mock_requests):
         get_uri("1.2.3.4:5000", "api/version")
         mock_requests.assert_called_with("http://1.2.3.4:5000/api/version", timeout=2)
 
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_try_nothing(self, mock_requests):
         request = get_uri(None, "/api/version")
         self.assertEqual(mock_requests.call_count, 0)
         self.assertEqual(request, None)
 
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_try_root(self, mock_requests):
         request = get_uri("1.2.3.4")
         mock_requests.assert_called_with("http://1.2.3.4/", timeout=2)
 
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_no_success(self, mock_requests):
         def mock_call(uri, **kwargs):
             raise requests.exceptions.ConnectionError("mocked")
@@ -184,28 +196,28 @@ class PostUriTest(unittest.TestCase):
         self.file_mock.close()
         os.remove(self.file_mock.name)
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_try_hostname(self, mock_requests):
         post_uri("1.2.3.4", "/api/version")
         mock_requests.assert_called_with(
             "http://1.2.3.4/api/version", timeout=2, data=None, files=None, json=None
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_pass_protocol_timeout(self, mock_requests):
         post_uri("1.2.3.4", "/api/version", protocol="https", timeout=3)
         mock_requests.assert_called_with(
             "https://1.2.3.4/api/version", timeout=3, data=None, files=None, json=None
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_add_leading_slash(self, mock_requests):
         post_uri("1.2.3.4", "api/version")
         mock_requests.assert_called_with(
             "http://1.2.3.4/api/version", timeout=2, data=None, files=None, json=None
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_ip_port(self, mock_requests):
         post_uri("1.2.3.4:5000", "api/version")
         mock_requests.assert_called_with(
@@ -216,20 +228,20 @@ class PostUriTest(unittest.TestCase):
             json=None,
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_try_nothing(self, mock_requests):
         request = post_uri(None, "/api/version")
         self.assertEqual(mock_requests.call_count, 0)
         self.assertEqual(request, None)
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_try_root(self, mock_requests):
         post_uri("1.2.3.4")
         mock_requests.assert_called_with(
             "http://1.2.3.4/", timeout=2, data=None, files=None, json=None
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_no_success(self, mock_requests):
         def mock_call(uri, **kwargs):
             raise requests.exceptions.ConnectionError("mocked")
@@ -250,7 +262,7 @@ class PostUriTest(unittest.TestCase):
             ]
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_pass_files_data(self, mock_requests):
         post_uri("1.2.3.4", files=self.file_mock, data={"some": "data"})
         mock_requests.assert_called_with(
@@ -261,14 +273,14 @@ class PostUriTest(unittest.TestCase):
             json=None,
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_pass_json(self, mock_requests):
         post_uri("1.2.3.4", json={"some": "data"})
         mock_requests.assert_called_with(
             "http://1.2.3.4/", timeout=2, data=None, files=None, json={"some": "data"}
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_no_pass_data_json(self, mock_requests):
         with self.assertRaises(Exception) as ctx:
             post_uri("1.2.3.4", json={"some": "data"}, data={"more": "data"})
@@ -277,7 +289,7 @@ class PostUriTest(unittest.TestCase):
             "Cannot pass json and data/files at the same time" in str(ctx.exception)
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_no_pass_files_json(self, mock_requests):
         with self.assertRaises(Exception) as ctx:
             post_uri("1.2.3.4", json={"some": "data"}, files=self.file_mock)
@@ -285,3 +297,93 @@ class PostUriTest(unittest.TestCase):
         self.assertTrue(
             "Cannot pass json and data/files at the same time" in str(ctx.exception)
         )
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class SessionRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.host = "127.0.0.1:%s" % self.server.server_port
+
+    def tearDown(self):
+        with network.SESSIONS_LOCK:
+            for host in list(network.SESSIONS.keys()):
+                network.close_session(host)
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_same_session_per_host(self):
+        self.assertIs(network.get_session("1.2.3.4"), network.get_session("1.2.3.4"))
+        self.assertIsNot(network.get_session("1.2.3.4"), network.get_session("1.2.3.5"))
+
+    def test_reuse_connection(self):
+        before = network.get_pool_stats()
+        for _ in range(3):
+            self.assertEqual(get_uri(self.host, "/api/version").status_code, 200)
+        after = network.get_pool_stats()
+        self.assertEqual(after["new"] - before["new"], 1)
+        self.assertEqual(after["reused"] - before["reused"], 2)
+        self.assertEqual(after["sessions"], 1)
+
+    def test_close_idle_session(self):
+        get_uri(self.host, "/api/version")
+        session = network.get_session(self.host)
+        with mock.patch.dict(app.config, {"NETWORK_POOL_IDLE_TTL": -1}):
+            self.assertIsNot(network.get_session(self.host), session)
+        # counters of the closed session are kept
+        self.assertTrue(network.get_pool_stats()["new"] >= 1)
+
+
+class AsyncUriTest(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.host = "127.0.0.1:%s" % self.server.server_port
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_get(self):
+        request = self.loop.run_until_complete(async_get_uri(self.host, "api/version"))
+        self.assertEqual(request.status_code, 200)
+        self.assertEqual(request.json(), {})
+        self.assertTrue(request)
+
+    def test_try_nothing(self):
+        self.assertEqual(self.loop.run_until_complete(async_get_uri(None)), None)
+
+    def test_no_success(self):
+        self.server.server_close()
+        request = self.loop.run_until_complete(
+            async_get_uri("127.0.0.1:1", "/api/version")
+        )
+        self.assertEqual(request, None)
+
+    def test_no_pass_data_json(self):
+        with self.assertRaises(Exception) as ctx:
+            self.loop.run_until_complete(
+                async_post_uri("1.2.3.4", json={"some": "data"}, data={"more": "data"})
+            )
+        self.assertTrue(
+            "Cannot pass json and data/files at the same time" in str(ctx.exception)
+        )
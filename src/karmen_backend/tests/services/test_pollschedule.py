@@ -0,0 +1,32 @@
+import unittest
+import mock
+
+from server.services import pollschedule
+
+
+class PollScheduleTest(unittest.TestCase):
+    @mock.patch("server.services.pollschedule.time", return_value=1000)
+    @mock.patch("server.services.pollschedule.redis")
+    def test_sync(self, mock_redis, mock_time):
+        mock_redis.zrange.return_value = [b"1234", b"9999"]
+        pollschedule.sync(["1234", "5678"])
+        pipe = mock_redis.pipeline.return_value
+        pipe.zadd.assert_called_with(
+            "printers_schedule", {"1234": 1000, "5678": 1000}, nx=True
+        )
+        pipe.zrem.assert_called_with("printers_schedule", "9999")
+        self.assertEqual(pipe.execute.call_count, 1)
+
+    @mock.patch("server.services.pollschedule.time", return_value=1000)
+    @mock.patch("server.services.pollschedule.redis")
+    def test_pop_due(self, mock_redis, mock_time):
+        script = mock_redis.register_script.return_value
+        script.return_value = [b"1234"]
+        self.assertEqual(pollschedule.pop_due(), ["1234"])
+        script.assert_called_with(keys=["printers_schedule"], args=[1000, 1060, 100])
+
+    @mock.patch("server.services.pollschedule.time", return_value=1000)
+    @mock.patch("server.services.pollschedule.redis")
+    def test_reschedule(self, mock_redis, mock_time):
+        pollschedule.reschedule("1234", 5)
+        mock_redis.zadd.assert_called_with("printers_schedule", {"1234": 1005})
@@ -0,0 +1,139 @@
+import json
+import unittest
+import mock
+
+from server.services import printerstate
+
+
+def run_transaction(mock_redis, previous):
+    # runs the transaction body once against a fake watching pipeline
+    pipe = mock.Mock()
+    pipe.hmget.return_value = previous
+    mock_redis.transaction.side_effect = lambda func, *keys: func(pipe)
+    return pipe
+
+
+class SaveTest(unittest.TestCase):
+    @mock.patch("server.services.printerstate.time", return_value=1000)
+    @mock.patch("server.services.printerstate.redis")
+    def test_save_fields_with_timestamp(self, mock_redis, mock_time):
+        pipe = run_transaction(mock_redis, [None, None])
+        printerstate.save("1.2.3.4", status={"state": "Printing"}, job={})
+        self.assertEqual(
+            mock_redis.transaction.call_args[0][1], "printer_state_1.2.3.4"
+        )
+        self.assertEqual(pipe.multi.call_count, 1)
+        pipe.hset.assert_has_calls(
+            [
+                mock.call(
+                    "printer_state_1.2.3.4",
+                    "status",
+                    json.dumps({"value": {"state": "Printing"}, "updated": 1000}),
+                ),
+                mock.call(
+                    "printer_state_1.2.3.4",
+                    "job",
+                    json.dumps({"value": {}, "updated": 1000}),
+                ),
+            ]
+        )
+
+    @mock.patch("server.services.printerstate.time", return_value=1000)
+    @mock.patch("server.services.printerstate.redis")
+    def test_publish_changed_fields(self, mock_redis, mock_time):
+        pipe = run_transaction(
+            mock_redis,
+            [
+                b'{"value": {"state": "Printing", "temperature": [1, 2]}, "updated": 900}',
+                b'{"value": {}, "updated": 900}',
+            ],
+        )
+        printerstate.save(
+            "1.2.3.4",
+            status={"state": "Printing", "temperature": (1, 2)},
+            job={"name": "file.gcode"},
+        )
+        pipe.hmget.assert_called_with("printer_state_1.2.3.4", "status", "job")
+        pipe.publish.assert_called_once_with(
+            "printer_state_events",
+            json.dumps({"ip": "1.2.3.4", "fields": {"job": {"name": "file.gcode"}}}),
+        )
+
+    @mock.patch("server.services.printerstate.redis")
+    def test_no_publish_without_change(self, mock_redis):
+        pipe = run_transaction(mock_redis, [b'{"value": {}, "updated": 900}'])
+        printerstate.save("1.2.3.4", job={})
+        self.assertEqual(pipe.hset.call_count, 1)
+        self.assertEqual(pipe.publish.call_count, 0)
+
+    @mock.patch("server.services.printerstate.app.logger")
+    @mock.patch("server.services.printerstate.redis")
+    def test_no_fail_on_broken_redis(self, mock_redis, mock_logger):
+        mock_redis.transaction.side_effect = Exception("Cannot connect to redis")
+        printerstate.save("1.2.3.4", status={})
+        self.assertEqual(mock_logger.error.call_count, 1)
+
+
+class LoadTest(unittest.TestCase):
+    @mock.patch("server.services.printerstate.redis")
+    def test_load(self, mock_redis):
+        mock_redis.hgetall.return_value = {
+            b"status": b'{"value": {"state": "Printing"}, "updated": 1000}',
+            b"job": b"invalid json",
+        }
+        self.assertEqual(
+            printerstate.load("1.2.3.4"),
+            {"status": {"value": {"state": "Printing"}, "updated": 1000}},
+        )
+        mock_redis.hgetall.assert_called_with("printer_state_1.2.3.4")
+
+    @mock.patch("server.services.printerstate.app.logger")
+    @mock.patch("server.services.printerstate.redis")
+    def test_no_fail_on_broken_redis(self, mock_redis, mock_logger):
+        mock_redis.hgetall.side_effect = Exception("Cannot connect to redis")
+        self.assertEqual(printerstate.load("1.2.3.4"), {})
+        self.assertEqual(mock_logger.error.call_count, 1)
+
+
+class DeleteTest(unittest.TestCase):
+    @mock.patch("server.services.printerstate.redis")
+    def test_delete(self, mock_redis):
+        printerstate.delete("1.2.3.4")
+        pipe = mock_redis.pipeline.return_value
+        pipe.delete.assert_called_with("printer_state_1.2.3.4")
+        pipe.publish.assert_called_with(
+            "printer_state_events", json.dumps({"ip": "1.2.3.4", "deleted": True})
+        )
+
+
+class EventsTest(unittest.TestCase):
+    @mock.patch("server.services.printerstate.redis")
+    def test_subscribe(self, mock_redis):
+        pubsub = printerstate.subscribe()
+        self.assertEqual(pubsub, mock_redis.pubsub.return_value)
+        pubsub.subscribe.assert_called_with("printer_state_events")
+
+    @mock.patch("server.services.printerstate.app.logger")
+    @mock.patch("server.services.printerstate.redis")
+    def test_subscribe_broken_redis(self, mock_redis, mock_logger):
+        mock_redis.pubsub.return_value.subscribe.side_effect = Exception(
+            "Cannot connect to redis"
+        )
+        self.assertEqual(printerstate.subscribe(), None)
+        self.assertEqual(mock_logger.error.call_count, 1)
+
+    def test_get_event(self):
+        pubsub = mock.Mock()
+        pubsub.get_message.return_value = {"type": "message", "data": b'{"ip": "1"}'}
+        self.assertEqual(printerstate.get_event(pubsub, 5), {"ip": "1"})
+        pubsub.get_message.assert_called_with(timeout=5)
+
+    def test_get_event_timeout(self):
+        pubsub = mock.Mock()
+        pubsub.get_message.return_value = None
+        self.assertEqual(printerstate.get_event(pubsub, 5), None)
+
+    def test_get_event_invalid(self):
+        pubsub = mock.Mock()
+        pubsub.get_message.return_value = {"type": "message", "data": b"invalid"}
+        self.assertEqual(printerstate.get_event(pubsub, 5), None)
@@ -0,0 +1,135 @@
+import io
+import unittest
+import mock
+from PIL import Image
+
+from server.services import webcam
+
+
+def make_jpeg(width=640, height=480):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (255, 0, 0)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+class GetFrameTest(unittest.TestCase):
+    @mock.patch("server.services.webcam.requests.get")
+    def test_first_frame(self, mock_get):
+        frame = make_jpeg()
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.iter_content.return_value = [
+            b"--boundarydonotcross\r\nContent-Type: image/jpeg\r\n\r\n",
+            frame[:100],
+            frame[100:] + b"\r\n--boundarydonotcross\r\n",
+            b"\xff\xd8 another frame",
+        ]
+        self.assertEqual(webcam.get_frame("http://1.2.3.4/stream"), frame)
+        self.assertEqual(mock_get.return_value.close.call_count, 1)
+
+    @mock.patch("server.services.webcam.requests.get")
+    def test_split_markers(self, mock_get):
+        frame = make_jpeg()
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.iter_content.return_value = [
+            b"--boundary\r\n\r\n" + frame[:1],
+            frame[1:-1],
+            frame[-1:] + b"\r\n",
+        ]
+        self.assertEqual(webcam.get_frame("http://1.2.3.4/stream"), frame)
+
+    @mock.patch("server.services.webcam.requests.get")
+    def test_no_frame(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.iter_content.return_value = [b"garbage"]
+        self.assertEqual(webcam.get_frame("http://1.2.3.4/stream"), None)
+
+    @mock.patch("server.services.webcam.requests.get")
+    def test_bad_status(self, mock_get):
+        mock_get.return_value.status_code = 404
+        self.assertEqual(webcam.get_frame("http://1.2.3.4/stream"), None)
+
+
+class ScaleTest(unittest.TestCase):
+    def test_scale(self):
+        image = Image.open(io.BytesIO(webcam.scale(make_jpeg(), 320)))
+        self.assertEqual(image.size, (320, 240))
+
+    def test_no_upscale(self):
+        frame = make_jpeg(100, 50)
+        self.assertEqual(webcam.scale(frame, 320), frame)
+
+
+class GetSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        for target in ("acquire", "release"):
+            patcher = mock.patch("server.services.locks.%s" % target, return_value="t")
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @mock.patch("server.services.webcam.get_frame")
+    @mock.patch("server.services.webcam.redis")
+    def test_cached(self, mock_redis, mock_get_frame):
+        mock_redis.get.return_value = b"jpeg"
+        self.assertEqual(
+            webcam.get_snapshot("1.2.3.4", "http://1.2.3.4/stream", 160), b"jpeg"
+        )
+        mock_redis.get.assert_called_with("webcam_snapshot_1.2.3.4_160")
+        self.assertEqual(mock_get_frame.call_count, 0)
+
+    @mock.patch("server.services.webcam.get_frame")
+    @mock.patch("server.services.webcam.redis")
+    def test_capture_all_variants(self, mock_redis, mock_get_frame):
+        frame = make_jpeg()
+        mock_redis.get.return_value = None
+        mock_get_frame.return_value = frame
+        snapshot = webcam.get_snapshot("1.2.3.4", "http://1.2.3.4/stream", 320)
+        self.assertEqual(Image.open(io.BytesIO(snapshot)).size, (320, 240))
+        pipe = mock_redis.pipeline.return_value
+        self.assertEqual(
+            [c[0][0] for c in pipe.set.call_args_list],
+            [
+                "webcam_snapshot_1.2.3.4_full",
+                "webcam_snapshot_1.2.3.4_160",
+                "webcam_snapshot_1.2.3.4_320",
+            ],
+        )
+        self.assertEqual(pipe.set.call_args_list[0][1], {"ex": 5})
+
+    @mock.patch("server.services.webcam.get_frame", return_value=None)
+    @mock.patch("server.services.webcam.redis")
+    def test_capture_failed(self, mock_redis, mock_get_frame):
+        mock_redis.get.return_value = None
+        self.assertEqual(webcam.get_snapshot("1.2.3.4", "http://1.2.3.4/stream"), None)
+        mock_redis.set.assert_called_with("webcam_snapshot_1.2.3.4_failed", 1, ex=5)
+
+    @mock.patch("server.services.webcam.get_frame")
+    @mock.patch("server.services.webcam.redis")
+    def test_recently_failed(self, mock_redis, mock_get_frame):
+        mock_redis.get.side_effect = [None, b"1"]
+        self.assertEqual(webcam.get_snapshot("1.2.3.4", "http://1.2.3.4/stream"), None)
+        self.assertEqual(mock_get_frame.call_count, 0)
+
+    @mock.patch("server.services.webcam.sleep")
+    @mock.patch("server.services.webcam.get_frame")
+    @mock.patch("server.services.webcam.redis")
+    def test_wait_for_other_capture(self, mock_redis, mock_get_frame, mock_sleep):
+        # snapshot and failure lookups alternate
+        mock_redis.get.side_effect = [None, None, None, None, b"jpeg"]
+        with mock.patch("server.services.locks.acquire", return_value=None):
+            self.assertEqual(
+                webcam.get_snapshot("1.2.3.4", "http://1.2.3.4/stream"), b"jpeg"
+            )
+        self.assertEqual(mock_get_frame.call_count, 0)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @mock.patch("server.services.webcam.sleep")
+    @mock.patch("server.services.webcam.get_frame")
+    @mock.patch("server.services.webcam.redis")
+    def test_other_capture_failed(self, mock_redis, mock_get_frame, mock_sleep):
+        mock_redis.get.side_effect = [None, None, None, b"1"]
+        with mock.patch("server.services.locks.acquire", return_value=None):
+            self.assertEqual(
+                webcam.get_snapshot("1.2.3.4", "http://1.2.3.4/stream"), None
+            )
+        self.assertEqual(mock_get_frame.call_count, 0)
+        self.assertEqual(mock_sleep.call_count, 1)
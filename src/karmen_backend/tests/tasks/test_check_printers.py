@@ -1,10 +1,40 @@
 import unittest
 import mock
 
-from server.tasks.check_printers import check_printers
+from server.tasks.check_printers import (
+    check_printers,
+    check_printers_batch,
+    summarize_check_printers,
+)
 
 
-class CheckPrintersTest(unittest.TestCase):
+class CheckPrintersBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.reschedule_patcher = mock.patch("server.services.pollschedule.reschedule")
+        self.mock_reschedule = self.reschedule_patcher.start()
+        self.addCleanup(self.reschedule_patcher.stop)
+        interval_patcher = mock.patch(
+            "server.tasks.check_printers.get_check_interval", return_value=30
+        )
+        interval_patcher.start()
+        self.addCleanup(interval_patcher.stop)
+        breaker_patcher = mock.patch(
+            "server.services.circuitbreaker.get_state",
+            return_value={"state": "closed", "failures": 0, "retry_at": None},
+        )
+        breaker_patcher.start()
+        self.addCleanup(breaker_patcher.stop)
+        self.acquire_patcher = mock.patch(
+            "server.services.locks.acquire", return_value="token"
+        )
+        self.release_patcher = mock.patch("server.services.locks.release")
+        self.mock_acquire = self.acquire_patcher.start()
+        self.mock_release = self.release_patcher.start()
+
+    def tearDown(self):
+        self.acquire_patcher.stop()
+        self.release_patcher.stop()
+
     @mock.patch(
         "server.database.printers.get_printers",
         return_value=[
@@ -23,14 +53,37 @@ class CheckPrintersTest(unittest.TestCase):
         ],
     )
     @mock.patch("server.database.printers.update_printer")
-    @mock.patch("server.drivers.octoprint.get_uri", return_value=None)
+    @mock.patch("server.drivers.octoprint.async_get_uri", return_value=None)
+    @mock.patch("server.services.printerstate.save")
     def test_deactivate_no_data_responding_printer(
-        self, mock_get_data, mock_update_printer, mock_get_printers
+        self, mock_save_state, mock_get_data, mock_update_printer, mock_get_printers
     ):
-        check_printers()
-        self.assertEqual(mock_get_printers.call_count, 1)
+        summary = check_printers_batch(mock_get_printers.return_value)
+        self.assertEqual(summary, {"checked": 2, "skipped": 0})
         self.assertEqual(mock_get_data.call_count, 2)
         self.assertEqual(mock_update_printer.call_count, 2)
+        self.assertEqual(mock_save_state.call_count, 2)
+        mock_save_state.assert_has_calls(
+            [
+                mock.call(
+                    "1234",
+                    status={"state": "Printer is not responding", "temperature": {}},
+                    webcam={"message": "Stream not accessible"},
+                    job={},
+                    client={
+                        "name": "octoprint",
+                        "version": {},
+                        "connected": False,
+                        "readonly": False,
+                    },
+                    circuit_breaker={
+                        "state": "closed",
+                        "failures": 0,
+                        "retry_at": None,
+                    },
+                )
+            ]
+        )
         mock_update_printer.assert_has_calls(
             [
                 mock.call(
@@ -80,10 +133,16 @@ class CheckPrintersTest(unittest.TestCase):
         ],
     )
     @mock.patch("server.database.printers.update_printer")
-    @mock.patch("server.drivers.octoprint.get_uri")
+    @mock.patch("server.drivers.octoprint.async_get_uri")
     @mock.patch("server.tasks.check_printers.redis")
+    @mock.patch("server.services.printerstate.save")
     def test_activate_responding_printer(
-        self, mock_redis, mock_get_data, mock_update_printer, mock_get_printers
+        self,
+        mock_save_state,
+        mock_redis,
+        mock_get_data,
+        mock_update_printer,
+        mock_get_printers,
     ):
         class Response:
             def __init__(self, status_code, contents, json=None):
@@ -113,14 +172,22 @@ class CheckPrintersTest(unittest.TestCase):
                         }
                     },
                 )
+            if "endpoint" in kwargs and kwargs["endpoint"].startswith("/api/printer"):
+                return Response(
+                    200,
+                    "",
+                    json={"state": {"text": "Operational"}, "temperature": {}},
+                )
+            if "endpoint" in kwargs and kwargs["endpoint"] == "/api/job":
+                return Response(200, "", json={"state": "Operational"})
             return Response(200, "")
 
         mock_get_data.side_effect = mock_call
-        check_printers()
-        self.assertEqual(mock_get_printers.call_count, 1)
+        summary = check_printers_batch(mock_get_printers.return_value)
+        self.assertEqual(summary, {"checked": 2, "skipped": 0})
         self.assertEqual(
-            mock_get_data.call_count, 5
-        )  # Does an additional sniff request + 2 webcam requests
+            mock_get_data.call_count, 9
+        )  # Does an additional sniff request + 2 webcam, status and job requests
         self.assertEqual(mock_update_printer.call_count, 2)
         mock_update_printer.assert_has_calls(
             [
@@ -159,6 +226,7 @@ class CheckPrintersTest(unittest.TestCase):
             [mock.call("webcam_5678", "http://5678/webcam/?action=stream")]
         )
         mock_redis.delete.assert_has_calls([mock.call("webcam_1234")])
+        self.assertEqual(mock_save_state.call_count, 2)
 
     @mock.patch(
         "server.database.printers.get_printers",
@@ -178,11 +246,13 @@ class CheckPrintersTest(unittest.TestCase):
         ],
     )
     @mock.patch("server.database.printers.update_printer")
-    @mock.patch("server.drivers.octoprint.get_uri")
+    @mock.patch("server.drivers.octoprint.async_get_uri")
     @mock.patch("server.tasks.check_printers.redis")
     @mock.patch("server.tasks.check_printers.app.logger")
+    @mock.patch("server.services.printerstate.save")
     def test_no_fail_on_broken_redis(
         self,
+        mock_save_state,
         mock_logger,
         mock_redis,
         mock_get_data,
@@ -217,16 +287,24 @@ class CheckPrintersTest(unittest.TestCase):
                         }
                     },
                 )
+            if "endpoint" in kwargs and kwargs["endpoint"].startswith("/api/printer"):
+                return Response(
+                    200,
+                    "",
+                    json={"state": {"text": "Operational"}, "temperature": {}},
+                )
+            if "endpoint" in kwargs and kwargs["endpoint"] == "/api/job":
+                return Response(200, "", json={"state": "Operational"})
             return Response(200, "")
 
         mock_get_data.side_effect = mock_call
         mock_redis.delete.side_effect = Exception("Cannot delete in redis")
         mock_redis.set.side_effect = Exception("Cannot set in redis")
-        check_printers()
-        self.assertEqual(mock_get_printers.call_count, 1)
+        summary = check_printers_batch(mock_get_printers.return_value)
+        self.assertEqual(summary, {"checked": 2, "skipped": 0})
         self.assertEqual(
-            mock_get_data.call_count, 5
-        )  # Does an additional sniff request + 2 webcam requests
+            mock_get_data.call_count, 9
+        )  # Does an additional sniff request + 2 webcam, status and job requests
         self.assertEqual(mock_update_printer.call_count, 2)
         mock_update_printer.assert_has_calls(
             [
@@ -265,4 +343,85 @@ class CheckPrintersTest(unittest.TestCase):
             [mock.call("webcam_5678", "http://5678/webcam/?action=stream")]
         )
         mock_redis.delete.assert_has_calls([mock.call("webcam_1234")])
+        self.assertEqual(mock_save_state.call_count, 2)
         self.assertEqual(mock_logger.error.call_count, 2)
+
+    @mock.patch("server.database.printers.update_printer")
+    @mock.patch("server.drivers.octoprint.async_get_uri", return_value=None)
+    @mock.patch("server.services.printerstate.save")
+    def test_skip_locked_printer(
+        self, mock_save_state, mock_get_data, mock_update_printer
+    ):
+        self.mock_acquire.side_effect = lambda name, ttl: (
+            None if name == "check_printer_1234" else "token"
+        )
+        summary = check_printers_batch(
+            [
+                {
+                    "hostname": "a",
+                    "ip": "1234",
+                    "client_props": {"connected": True},
+                    "client": "octoprint",
+                },
+                {
+                    "hostname": "b",
+                    "ip": "5678",
+                    "client_props": {"connected": True},
+                    "client": "octoprint",
+                },
+            ]
+        )
+        self.assertEqual(summary, {"checked": 1, "skipped": 1})
+        self.assertEqual(mock_update_printer.call_count, 1)
+        self.assertEqual(mock_update_printer.call_args[1]["ip"], "5678")
+        self.mock_reschedule.assert_called_once_with("5678", 30)
+        self.mock_release.assert_called_once_with("check_printer_5678", "token")
+
+    @mock.patch("server.database.printers.update_printer")
+    @mock.patch("server.drivers.octoprint.async_get_uri", return_value=None)
+    @mock.patch("server.services.printerstate.save")
+    @mock.patch("server.tasks.check_printers.app.logger")
+    def test_broken_printer_does_not_stop_batch(
+        self, mock_logger, mock_save_state, mock_get_data, mock_update_printer
+    ):
+        summary = check_printers_batch(
+            [
+                {"hostname": "a", "ip": "1234", "client": "octoprint"},
+                {"hostname": "b", "ip": "5678", "client": "unknown"},
+            ]
+        )
+        self.assertEqual(summary, {"checked": 1, "skipped": 1})
+        self.assertEqual(mock_update_printer.call_count, 1)
+        self.assertEqual(mock_logger.error.call_count, 1)
+        self.assertEqual(self.mock_release.call_count, 2)
+
+
+class CheckPrintersTest(unittest.TestCase):
+    @mock.patch(
+        "server.database.printers.get_printers",
+        return_value=[{"ip": str(i), "client": "octoprint"} for i in range(25)],
+    )
+    @mock.patch("server.tasks.check_printers.chord")
+    def test_split_into_batches(self, mock_chord, mock_get_printers):
+        check_printers()
+        batches = list(mock_chord.call_args[0][0])
+        self.assertEqual(len(batches), 3)
+        self.assertEqual([len(b.args[0]) for b in batches], [10, 10, 5])
+        self.assertEqual(mock_chord.return_value.call_count, 1)
+
+    @mock.patch("server.database.printers.get_printers", return_value=[])
+    @mock.patch("server.tasks.check_printers.chord")
+    def test_no_printers(self, mock_chord, mock_get_printers):
+        check_printers()
+        self.assertEqual(mock_chord.call_count, 0)
+
+    @mock.patch("server.tasks.check_printers.time", return_value=1010)
+    @mock.patch("server.tasks.check_printers.redis")
+    def test_summary(self, mock_redis, mock_time):
+        summary = summarize_check_printers(
+            [{"checked": 10, "skipped": 0}, {"checked": 3, "skipped": 2}], 1000
+        )
+        self.assertEqual(
+            summary, {"started": 1000, "duration": 10, "checked": 13, "skipped": 2}
+        )
+        self.assertEqual(mock_redis.set.call_count, 1)
@@ -0,0 +1,121 @@
+import os
+import hashlib
+import tempfile
+import unittest
+import mock
+
+from server.database import gcodes
+from server.services import files
+from server.tasks.process_gcode import (
+    analyze_gcode,
+    extract_gcode_metadata,
+    extract_gcode_thumbnail,
+    finish_gcode_processing,
+    get_initial_stages,
+    process_gcode,
+)
+from tests.services.test_gcodethumbnail import make_png, make_block
+
+
+class ProcessGcodeTest(unittest.TestCase):
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(suffix=".gcode", delete=False)
+        self.file.write(b"M83\nM104 S215\nG1 X10 E2\n; filament_type = PETG\n")
+        self.file.close()
+        self.gcode_id = gcodes.add_gcode(
+            path="/",
+            filename="process.gcode",
+            display="process.gcode",
+            absolute_path=self.file.name,
+            size=os.path.getsize(self.file.name),
+            state="processing",
+            stages=get_initial_stages(),
+        )
+
+    def tearDown(self):
+        gcodes.delete_gcode(self.gcode_id)
+        files.remove(self.file.name)
+
+    def test_stages(self):
+        extract_gcode_metadata(self.gcode_id)
+        gcode = gcodes.get_gcode(self.gcode_id)
+        self.assertEqual(gcode["state"], "processing")
+        self.assertEqual(
+            gcode["stages"],
+            {
+                "hash": "done",
+                "metadata": "done",
+                "thumbnail": "pending",
+                "analysis": "pending",
+            },
+        )
+        self.assertEqual(gcode["filament_type"], "PETG")
+        self.assertEqual(gcode["extruder_temperature"], 215)
+        self.assertEqual(gcode["filament_length"], None)
+
+        analyze_gcode(self.gcode_id)
+        finish_gcode_processing(self.gcode_id)
+        gcode = gcodes.get_gcode(self.gcode_id)
+        self.assertEqual(gcode["state"], "ready")
+        self.assertEqual(gcode["stages"]["analysis"], "done")
+        self.assertEqual(gcode["filament_length"], 2)
+        self.assertEqual(gcode["bounding_box"]["max"], [10, 0, 0])
+        self.assertEqual(gcode["filament_weight"], 0.01)
+
+    def test_thumbnail(self):
+        image = make_png(16, 16)
+        with open(self.file.name, "ab") as gcode:
+            gcode.write(make_block(image, 16, 16))
+        extract_gcode_thumbnail(self.gcode_id)
+        gcode = gcodes.get_gcode(self.gcode_id)
+        self.assertEqual(gcode["stages"]["thumbnail"], "done")
+        self.assertEqual(gcode["thumbnail"], hashlib.sha256(image).hexdigest())
+        with open(files.get_thumbnail_path(self.file.name), "rb") as thumbnail:
+            self.assertEqual(thumbnail.read(), image)
+
+    def test_no_thumbnail(self):
+        extract_gcode_thumbnail(self.gcode_id)
+        gcode = gcodes.get_gcode(self.gcode_id)
+        self.assertEqual(gcode["stages"]["thumbnail"], "done")
+        self.assertEqual(gcode["thumbnail"], None)
+        self.assertFalse(os.path.exists(files.get_thumbnail_path(self.file.name)))
+
+    def test_failed_stage(self):
+        with mock.patch(
+            "server.tasks.process_gcode.gcodemeta.extract",
+            side_effect=OSError("Disk problem"),
+        ):
+            extract_gcode_metadata(self.gcode_id)
+        analyze_gcode(self.gcode_id)
+        finish_gcode_processing(self.gcode_id)
+        gcode = gcodes.get_gcode(self.gcode_id)
+        self.assertEqual(gcode["state"], "failed")
+        self.assertEqual(gcode["stages"]["metadata"], "failed")
+        self.assertEqual(gcode["stages"]["analysis"], "done")
+
+    def test_deleted_meanwhile(self):
+        gcodes.delete_gcode(self.gcode_id)
+        extract_gcode_metadata(self.gcode_id)
+        analyze_gcode(self.gcode_id)
+        self.assertEqual(gcodes.get_gcode(self.gcode_id), None)
+
+    @mock.patch("server.tasks.process_gcode.chain")
+    def test_process_gcode(self, mocked_chain):
+        process_gcode(self.gcode_id)
+        self.assertEqual(mocked_chain.return_value.delay.call_count, 1)
+        tasks = [task.task for task in mocked_chain.call_args[0]]
+        self.assertEqual(
+            tasks,
+            [
+                "extract_gcode_metadata",
+                "extract_gcode_thumbnail",
+                "analyze_gcode",
+                "finish_gcode_processing",
+            ],
+        )
+
+    @mock.patch("server.tasks.process_gcode.chain")
+    def test_broker_down(self, mocked_chain):
+        mocked_chain.return_value.delay.side_effect = ConnectionError("No broker")
+        process_gcode(self.gcode_id)
+        self.assertEqual(gcodes.get_gcode(self.gcode_id)["state"], "processing")
@@ -0,0 +1,74 @@
+import unittest
+import mock
+
+from server.drivers.octoprint import Octoprint
+from server.drivers.utils import PrinterClientInfo
+from server.tasks.schedule_printer_checks import (
+    get_check_interval,
+    schedule_printer_checks,
+)
+
+
+class GetCheckIntervalTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "server.services.printerstate.is_push_active", return_value=False
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_printing(self):
+        printer = Octoprint("1234", client=PrinterClientInfo(connected=True))
+        self.assertEqual(get_check_interval(printer, {"state": "Printing"}), 5)
+        self.assertEqual(get_check_interval(printer, {"state": "Paused"}), 5)
+
+    def test_idle(self):
+        printer = Octoprint("1234", client=PrinterClientInfo(connected=True))
+        self.assertEqual(get_check_interval(printer, {"state": "Operational"}), 30)
+
+    @mock.patch("server.services.printerstate.is_push_active", return_value=True)
+    def test_push_subscribed(self, mock_is_push_active):
+        printer = Octoprint("1234", client=PrinterClientInfo(connected=True))
+        self.assertEqual(get_check_interval(printer, {"state": "Printing"}), 120)
+
+    @mock.patch("server.services.circuitbreaker.get_state")
+    def test_offline_backoff(self, mock_get_state):
+        printer = Octoprint("1234", client=PrinterClientInfo(connected=False))
+        status = {"state": "Printer is not responding"}
+        mock_get_state.return_value = {"failures": 1}
+        self.assertEqual(get_check_interval(printer, status), 60)
+        mock_get_state.return_value = {"failures": 3}
+        self.assertEqual(get_check_interval(printer, status), 240)
+        mock_get_state.return_value = {"failures": 30}
+        self.assertEqual(get_check_interval(printer, status), 600)
+
+
+class ScheduleTest(unittest.TestCase):
+    @mock.patch(
+        "server.database.printers.get_printers",
+        return_value=[{"ip": "1234"}, {"ip": "5678"}],
+    )
+    @mock.patch("server.services.pollschedule.sync")
+    @mock.patch("server.services.pollschedule.pop_due", return_value=["5678"])
+    @mock.patch("server.tasks.check_printers.chord")
+    def test_dispatch_due_printers(
+        self, mock_chord, mock_pop_due, mock_sync, mock_get_printers
+    ):
+        schedule_printer_checks()
+        mock_sync.assert_called_with(["1234", "5678"])
+        batches = list(mock_chord.call_args[0][0])
+        self.assertEqual([b.args[0] for b in batches], [[{"ip": "5678"}]])
+        # the run summary is recorded once the batches finish
+        self.assertEqual(
+            mock_chord.return_value.call_args[0][0].task, "summarize_check_printers"
+        )
+
+    @mock.patch("server.database.printers.get_printers", return_value=[{"ip": "1234"}])
+    @mock.patch("server.services.pollschedule.sync")
+    @mock.patch("server.services.pollschedule.pop_due", return_value=["5678"])
+    @mock.patch("server.tasks.check_printers.chord")
+    def test_skip_removed_printer(
+        self, mock_chord, mock_pop_due, mock_sync, mock_get_printers
+    ):
+        schedule_printer_checks()
+        self.assertEqual(mock_chord.call_count, 0)
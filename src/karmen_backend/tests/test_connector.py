@@ -0,0 +1,153 @@
+import asyncio
+import json
+import unittest
+import mock
+import aiohttp
+from aiohttp import web
+
+from server.connector import subscribe, sync_subscriptions
+
+PRINTING = {
+    "current": {
+        "state": {"text": "Printing"},
+        "job": {"file": {"display": "file.gcode"}},
+        "progress": {"completion": 10, "printTimeLeft": 100, "printTime": 10},
+        "temps": [{"time": 1, "bed": {"actual": 60, "target": 60}}],
+    }
+}
+
+
+async def push_handler(request):
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    await ws.send_str(json.dumps({"connected": {"version": "1.3.11"}}))
+    await ws.send_str(json.dumps(PRINTING))
+    await ws.send_str(json.dumps(PRINTING))
+    await ws.send_str("not json")
+    await ws.close()
+    return ws
+
+
+async def idle_handler(request):
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    await ws.send_str(json.dumps(PRINTING))
+    # stays open until the client goes away
+    async for msg in ws:
+        pass
+    return ws
+
+
+class SubscribeTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        push_app = web.Application()
+        push_app.router.add_get("/sockjs/websocket", push_handler)
+        push_app.router.add_get("/idle/sockjs/websocket", idle_handler)
+        self.runner = web.AppRunner(push_app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+    @mock.patch("server.services.pollschedule.reschedule")
+    @mock.patch("server.services.printerstate.clear_push_active")
+    @mock.patch("server.services.printerstate.set_push_active")
+    @mock.patch("server.services.printerstate.save")
+    @mock.patch("server.database.printers.update_printer")
+    def test_subscribe(
+        self,
+        mock_update_printer,
+        mock_save,
+        mock_set_push_active,
+        mock_clear_push_active,
+        mock_reschedule,
+    ):
+        ip = "127.0.0.1:%s" % self.port
+        raw_printer = {
+            "name": "printer",
+            "hostname": None,
+            "ip": ip,
+            "client": "octoprint",
+            "client_props": {"connected": False, "version": {}, "read_only": False},
+        }
+
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                await subscribe(raw_printer, session)
+
+        self.loop.run_until_complete(run())
+        self.assertEqual(mock_update_printer.call_count, 1)
+        self.assertTrue(mock_update_printer.call_args[1]["client_props"]["connected"])
+        # the repeated message did not change anything
+        mock_save.assert_called_once_with(
+            ip,
+            status={
+                "state": "Printing",
+                "temperature": {"bed": {"actual": 60, "target": 60}},
+            },
+            job={
+                "name": "file.gcode",
+                "completion": 10,
+                "printTimeLeft": 100,
+                "printTime": 10,
+            },
+        )
+        # refreshed once, the flag outlives the following messages
+        self.assertEqual(mock_set_push_active.call_count, 1)
+        mock_clear_push_active.assert_called_once_with(ip)
+        mock_reschedule.assert_called_once_with(ip, 0)
+
+    @mock.patch("server.services.pollschedule.reschedule")
+    @mock.patch("server.services.printerstate.clear_push_active")
+    @mock.patch("server.services.printerstate.set_push_active")
+    @mock.patch("server.services.printerstate.save")
+    def test_cancel_removed(
+        self, mock_save, mock_set_push_active, mock_clear_push_active, mock_reschedule
+    ):
+        ip = "127.0.0.1:%s/idle" % self.port
+        raw_printer = {
+            "name": "printer",
+            "hostname": None,
+            "ip": ip,
+            "client": "octoprint",
+            "client_props": {"connected": True, "version": {}, "read_only": False},
+        }
+
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                task = asyncio.ensure_future(subscribe(raw_printer, session))
+                while not mock_save.call_count:
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+        self.loop.run_until_complete(run())
+        mock_clear_push_active.assert_called_once_with(ip)
+        # a removed printer is not put back into the schedule
+        self.assertEqual(mock_reschedule.call_count, 0)
+
+
+class SyncSubscriptionsTest(unittest.TestCase):
+    @mock.patch("server.connector.subscribe", new_callable=mock.Mock)
+    @mock.patch("server.connector.asyncio.ensure_future")
+    def test_sync(self, mock_ensure_future, mock_subscribe):
+        finished = mock.Mock()
+        finished.done.return_value = True
+        removed = mock.Mock()
+        removed.done.return_value = False
+        running = mock.Mock()
+        running.done.return_value = False
+        subscriptions = {"1": finished, "2": removed, "3": running}
+        sync_subscriptions(subscriptions, {"1": {}, "3": {}, "4": {}}, None)
+        self.assertEqual(finished.cancel.call_count, 1)
+        self.assertEqual(removed.cancel.call_count, 1)
+        self.assertEqual(running.cancel.call_count, 0)
+        self.assertEqual(sorted(subscriptions.keys()), ["1", "3", "4"])
+        self.assertEqual(mock_ensure_future.call_count, 2)
@@ -0,0 +1,151 @@
+import asyncio
+import unittest
+import mock
+import aiohttp
+from aiohttp import web
+
+from server import webcamrelay
+
+UPSTREAM = {"connections": 0, "open": 0}
+
+
+async def mjpeg_handler(request):
+    UPSTREAM["connections"] += 1
+    UPSTREAM["open"] += 1
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": "multipart/x-mixed-replace; boundary=boundarydonotcross"
+        }
+    )
+    await response.prepare(request)
+    try:
+        frame = 0
+        while True:
+            frame += 1
+            data = b"jpeg%d" % frame
+            await response.write(
+                b"--boundarydonotcross\r\nContent-Type: image/jpeg\r\n"
+                + b"Content-Length: %d\r\n\r\n" % len(data)
+                + data
+                + b"\r\n"
+            )
+            await asyncio.sleep(0.01)
+    finally:
+        UPSTREAM["open"] -= 1
+
+
+class WebcamRelayTest(unittest.TestCase):
+    def setUp(self):
+        UPSTREAM.update({"connections": 0, "open": 0})
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        upstream = web.Application()
+        upstream.router.add_get("/stream", mjpeg_handler)
+        self.runners = []
+        self.upstream_port = self.start(upstream)
+        self.relay_port = self.start(webcamrelay.make_app())
+
+    def start(self, application):
+        runner = web.AppRunner(application)
+        self.loop.run_until_complete(runner.setup())
+        self.runners.append(runner)
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        return site._server.sockets[0].getsockname()[1]
+
+    def tearDown(self):
+        for runner in reversed(self.runners):
+            self.loop.run_until_complete(runner.cleanup())
+        self.loop.close()
+
+    def get_uri(self, path):
+        return "http://127.0.0.1:%s%s" % (self.relay_port, path)
+
+    async def read_frames(self, session, count):
+        async with session.get(self.get_uri("/proxied-webcam/1.2.3.4")) as resp:
+            reader = aiohttp.MultipartReader(resp.headers, resp.content)
+            frames = []
+            while len(frames) < count:
+                part = await reader.next()
+                frames.append(await part.read())
+            return frames
+
+    @mock.patch("server.webcamrelay.redis")
+    def test_single_upstream(self, mock_redis):
+        mock_redis.get.return_value = (
+            "http://127.0.0.1:%s/stream" % self.upstream_port
+        ).encode("utf-8")
+
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                results = await asyncio.gather(
+                    self.read_frames(session, 3),
+                    self.read_frames(session, 3),
+                    self.read_frames(session, 3),
+                )
+                self.assertEqual(UPSTREAM["connections"], 1)
+                for frames in results:
+                    self.assertEqual(len(frames), 3)
+                    self.assertTrue(frames[0].startswith(b"jpeg"))
+                # let the relay notice that everybody left
+                for _ in range(100):
+                    if not webcamrelay.STREAMS and not UPSTREAM["open"]:
+                        break
+                    await asyncio.sleep(0.01)
+                self.assertEqual(webcamrelay.STREAMS, {})
+                self.assertEqual(UPSTREAM["open"], 0)
+
+        self.loop.run_until_complete(run())
+
+    @mock.patch("server.webcamrelay.redis")
+    def test_unknown_webcam(self, mock_redis):
+        mock_redis.get.return_value = None
+
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                async with session.get(self.get_uri("/proxied-webcam/1.2.3.4")) as resp:
+                    self.assertEqual(resp.status, 404)
+
+        self.loop.run_until_complete(run())
+
+    @mock.patch("server.webcamrelay.redis")
+    def test_stats(self, mock_redis):
+        mock_redis.get.return_value = (
+            "http://127.0.0.1:%s/stream" % self.upstream_port
+        ).encode("utf-8")
+
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                async with session.get(self.get_uri("/proxied-webcam/1.2.3.4")) as resp:
+                    reader = aiohttp.MultipartReader(resp.headers, resp.content)
+                    for _ in range(5):
+                        await (await reader.next()).read()
+                    async with session.get(self.get_uri("/webcam-streams")) as stats:
+                        data = await stats.json()
+                self.assertEqual(len(data["items"]), 1)
+                self.assertEqual(data["items"][0]["ip"], "1.2.3.4")
+                self.assertEqual(data["items"][0]["viewers"], 1)
+                self.assertTrue(data["items"][0]["frames"] >= 5)
+                self.assertTrue(data["items"][0]["fps"] > 0)
+
+        self.loop.run_until_complete(run())
+
+
+class StreamTest(unittest.TestCase):
+    def test_drop_frames_for_slow_viewers(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        async def run():
+            stream = webcamrelay.Stream("1.2.3.4", "http://1.2.3.4/stream", None)
+            stream.task.cancel()
+            queue = stream.subscribe()
+            stream.publish(("image/jpeg", b"1"))
+            stream.publish(("image/jpeg", b"2"))
+            stream.publish(("image/jpeg", b"3"))
+            self.assertEqual(await queue.get(), ("image/jpeg", b"3"))
+            self.assertEqual(stream.frames, 3)
+            self.assertEqual(stream.dropped, 2)
+
+        loop.run_until_complete(run())
+        loop.close()
@@ -5,7 +5,7 @@ import Loader from '../components/loader';
 import { PrinterConnection, PrinterState } from '../components/printer-view';
 import { WebcamStream } from '../components/webcam-stream';
 import { PrinterEditForm } from '../components/printer-edit-form';
-import { getPrinter, patchPrinter, getPrinterJobs } from '../services/karmen-backend';
+import { getPrinter, patchPrinter, getPrinterJobs, subscribePrinterEvents } from '../services/karmen-backend';
 import formatters from '../services/formatters';
 
 const BASE_URL = window.env.BACKEND_BASE;
@@ -35,6 +35,8 @@ class PrintJobRow extends React.Component {
 class PrinterDetail extends React.Component {
   state = {
     printer: null,
+    timer: null,
+    events: null,
     jobs: [],
     jobsTable: {
       currentPage: 0,
@@ -48,6 +50,8 @@ class PrinterDetail extends React.Component {
   constructor(props) {
     super(props);
     this.loadPrinter = this.loadPrinter.bind(this);
+    this.pollPrinter = this.pollPrinter.bind(this);
+    this.subscribePrinter = this.subscribePrinter.bind(this);
     this.loadJobsPage = this.loadJobsPage.bind(this);
     this.changePrinter = this.changePrinter.bind(this);
   }
@@ -61,6 +65,50 @@ class PrinterDetail extends React.Component {
     });
   }
 
+  pollPrinter() {
+    const { match } = this.props;
+    getPrinter(match.params.ip, ['job', 'status', 'webcam']).then((printer) => {
+      this.setState({
+        printer,
+        timer: setTimeout(this.pollPrinter, 3000),
+      });
+    });
+  }
+
+  subscribePrinter() {
+    const { match } = this.props;
+    const merge = (fields) => {
+      const { printer } = this.state;
+      if (printer) {
+        this.setState({
+          printer: Object.assign({}, printer, fields),
+        });
+      }
+    };
+    const events = subscribePrinterEvents(
+      (printers) => {
+        // the snapshot may be newer than the first load after a reconnect
+        const printer = printers.find((p) => p.ip === match.params.ip);
+        if (printer) {
+          merge(printer);
+        }
+      },
+      (ip, fields) => {
+        if (ip === match.params.ip) {
+          merge(fields);
+        }
+      },
+      (ip) => {
+        if (ip === match.params.ip) {
+          this.props.history.push('/');
+        }
+      },
+      // fall back to polling when the backend cannot stream the events
+      this.pollPrinter
+    );
+    this.setState({ events });
+  }
+
   loadJobsPage(page, newOrderBy) {
     const { match } = this.props;
     const { jobsTable } = this.state;
@@ -123,11 +171,26 @@ class PrinterDetail extends React.Component {
   }
 
   componentDidMount() {
-    this.loadPrinter();
+    if (window.EventSource) {
+      this.loadPrinter();
+      this.subscribePrinter();
+    } else {
+      this.pollPrinter();
+    }
     const { jobsTable } = this.state
     this.loadJobsPage(0, jobsTable.orderBy);
   }
 
+  componentWillUnmount() {
+    const { timer, events } = this.state;
+    if (timer) {
+      clearTimeout(timer);
+    }
+    if (events) {
+      events.close();
+    }
+  }
+
   render () {
     const { printer, jobs, jobsTable } = this.state;
     if (!printer) {
@@ -2,17 +2,45 @@ import React from 'react';
 import { Link } from 'react-router-dom';
 import Loader from '../components/loader';
 import PrinterView from '../components/printer-view';
-import { getPrinters } from '../services/karmen-backend';
+import { getPrinters, subscribePrinterEvents } from '../services/karmen-backend';
 
 class PrinterList extends React.Component {
   state = {
     printers: null,
     timer: null,
+    events: null,
   }
 
   constructor(props) {
     super(props);
     this.loadPrinters = this.loadPrinters.bind(this);
+    this.subscribePrinters = this.subscribePrinters.bind(this);
+  }
+
+  subscribePrinters() {
+    const events = subscribePrinterEvents(
+      (printers) => this.setState({ printers }),
+      (ip, fields) => {
+        const { printers } = this.state;
+        if (!printers || !printers.find((p) => p.ip === ip)) {
+          // a printer that was added after the snapshot
+          getPrinters(['job', 'status', 'webcam']).then((printers) => this.setState({ printers }));
+          return;
+        }
+        this.setState({
+          printers: printers.map((p) => p.ip === ip ? Object.assign({}, p, fields) : p),
+        });
+      },
+      (ip) => {
+        const { printers } = this.state;
+        this.setState({
+          printers: printers && printers.filter((p) => p.ip !== ip),
+        });
+      },
+      // fall back to polling when the backend cannot stream the events
+      this.loadPrinters
+    );
+    this.setState({ events });
   }
 
   loadPrinters() {
@@ -25,14 +53,21 @@ class PrinterList extends React.Component {
   }
 
   componentDidMount() {
-    this.loadPrinters();
+    if (window.EventSource) {
+      this.subscribePrinters();
+    } else {
+      this.loadPrinters();
+    }
   }
 
   componentWillUnmount() {
-    const { timer } = this.state;
+    const { timer, events } = this.state;
     if (timer) {
       clearTimeout(timer);
     }
+    if (events) {
+      events.close();
+    }
   }
 
   render () {
@@ -30,6 +30,24 @@ export const getPrinter = (ip, fields = []) => {
     })
 }
 
+export const subscribePrinterEvents = (onSnapshot, onChange, onDelete, onError) => {
+  const source = new EventSource(`${BASE_URL}/printers/events`);
+  source.addEventListener('snapshot', (e) => onSnapshot(JSON.parse(e.data).items));
+  source.addEventListener('change', (e) => {
+    const data = JSON.parse(e.data);
+    onChange(data.ip, data.fields);
+  });
+  source.addEventListener('delete', (e) => onDelete(JSON.parse(e.data).ip));
+  source.onerror = () => {
+    // the browser reconnects on its own unless the stream is closed for good
+    if (source.readyState === EventSource.CLOSED) {
+      console.error('Cannot subscribe to printer events');
+      onError();
+    }
+  };
+  return source;
+}
+
 export const addPrinter = (ip, name) => {
   return fetch(`${BASE_URL}/printers`, {
     method: 'POST',